@@ -16,40 +16,51 @@
 # class and builder are the building blocks for map creation.
 ##############################################################################
 
-import logging
 from collections import Counter
 
 from LammpsSearchFuncs import get_data, find_sections, get_neighbours, get_additional_neighbours
-from LammpsTreatmentFuncs import clean_data
-
-def build_atom_objects(fileName, elementDict, bondingAtoms, createAtoms=[]):
-    # Load molecule file
-    with open(fileName, 'r') as f:
-        lines = f.readlines()
-
-    # Clean data and get coords and bonds
-    data = clean_data(lines)
+from LammpsTreatmentFuncs import read_data_file
+from Tracing import TRACER
+
+# Trace rule names for each neighbour comparison level
+NEIGHBOUR_RULES = {
+    'firstNeighbourElements': 'first_neighbours',
+    'secondNeighbourElements': 'second_neighbours',
+    'thirdNeighbourElements': 'third_neighbours',
+}
+
+def read_atom_graph(fileName):
+    '''
+    Atom types and neighbours of a molecule file, which can be given to build_atom_objects
+    to build atom objects for the same file again without parsing it.
+
+    Returns:
+        List of [atomID, atomType] and dict of atomID: neighbour atomIDs, all integers
+    '''
+    # Load and clean molecule file, then get types and bonds. IDs and types are converted to integers here
+    data = read_data_file(fileName)
     sections = find_sections(data)
-    types = get_data('Types', data, sections)
+    types = [[int(row[0]), int(row[1])] for row in get_data('Types', data, sections)]
 
     atomIDs = [row[0] for row in types]
-    bonds = get_data('Bonds', data, sections)
+    bonds = [[row[0], row[1], int(row[2]), int(row[3])] for row in get_data('Bonds', data, sections)]
     
     # Build neighbours dict
     neighboursDict = get_neighbours(atomIDs, bonds)
 
+    return types, neighboursDict
+
+def build_atom_objects(fileName, elementDict, bondingAtoms, createAtoms=[], atomGraph=None):
+    if atomGraph is None:
+        atomGraph = read_atom_graph(fileName)
+    types, neighboursDict = atomGraph
+    atomIDs = [row[0] for row in types]
+
     # Remove createAtoms as neighbours - confuses the map and are not required
+    # A new dict is made so a shared atomGraph isn't changed
     if createAtoms is not None:
-        for keyAtom, neighbours in neighboursDict.items():
-            updatedList = []
-            for atom in neighbours:
-                if atom not in createAtoms:
-                    updatedList.append(atom) # Done this way as cannot update list whilst iterating through it
-            
-            neighboursDict[keyAtom] = updatedList
-
-    def get_elements(neighbourIDs, elementDict):
-        return [elementDict[atomID]for atomID in neighbourIDs]
+        createAtoms = set(createAtoms)
+        neighboursDict = {keyAtom: [atom for atom in neighbours if atom not in createAtoms] for keyAtom, neighbours in neighboursDict.items()}
 
     atomObjectDict = {}
     for index, atomID in enumerate(atomIDs):
@@ -61,14 +72,8 @@ def build_atom_objects(fileName, elementDict, bondingAtoms, createAtoms=[]):
         # Get atom type
         atomType = types[index][1]
 
-        # Establish all neighbours
+        # First neighbours - second and third neighbours are only found if an atom needs them
         neighbours = neighboursDict[atomID]
-        secondNeighbours = get_additional_neighbours(neighboursDict, atomID, neighbours, bondingAtoms)
-        thirdNeighbours = get_additional_neighbours(neighboursDict, atomID, secondNeighbours, bondingAtoms)
-
-        neighbourElements = get_elements(neighbours, elementDict)
-        secondNeighbourElements = get_elements(secondNeighbours, elementDict)
-        thirdNeighbourElements = get_elements(thirdNeighbours, elementDict)
 
         # Check if atom is a bonding atom, return boolean
         if atomID in bondingAtoms:
@@ -76,7 +81,7 @@ def build_atom_objects(fileName, elementDict, bondingAtoms, createAtoms=[]):
         else:
             bondingAtom = False
 
-        atom = Atom(atomID, atomType, elementDict[atomID], bondingAtom, neighbours, secondNeighbours, thirdNeighbours, neighbourElements, secondNeighbourElements, thirdNeighbourElements)
+        atom = Atom(atomID, atomType, elementDict[atomID], bondingAtom, neighbours, neighboursDict, elementDict, bondingAtoms)
         atomObjectDict[atomID] = atom
     
     return atomObjectDict
@@ -100,7 +105,8 @@ def compare_symmetric_atoms(postNeighbourAtomObjectList, preNeighbourAtom, outpu
         preNeighbourFingerprint = ''.join(sorted(getattr(preNeighbourAtom, neighbourLevel)))
         for index, fingerprint in tuppledFingerprints:
             if preNeighbourFingerprint == fingerprint:
-                logging.debug(f'Pre: {preNeighbourAtom.atomID}, Post: {postNeighbourAtomObjectList[index].atomID} found with {neighbourLevel}')
+                if TRACER.enabled:
+                    TRACER.record(NEIGHBOUR_RULES[neighbourLevel], preNeighbourAtom.atomID, postNeighbourAtomObjectList[index].atomID)
                 if outputType == 'index':
                     return index
                 elif outputType == 'atomID':
@@ -131,7 +137,8 @@ def compare_symmetric_atoms(postNeighbourAtomObjectList, preNeighbourAtom, outpu
                     possibleChoices.append((index, postNeighbourAtom.atomID))
 
             # Let the user know that an inference has been made     
-            logging.debug(f'Pre: {preNeighbourAtom.atomID}, Post: {possibleChoices[0][1]} found with symmetry inference')
+            if TRACER.enabled:
+                TRACER.record('symmetry_inference', preNeighbourAtom.atomID, possibleChoices[0][1])
             print(
                 f'Note: Pre-bond atomID {preNeighbourAtom.atomID} has been assigned by inference to post-bond atomID {possibleChoices[0][1]}. The potential choices were {[atom[1] for atom in possibleChoices]}. Please check this is correct.'
             )
@@ -144,22 +151,47 @@ def compare_symmetric_atoms(postNeighbourAtomObjectList, preNeighbourAtom, outpu
 
 
 class Atom():
-    def __init__(self, atomID, atomType, element, bondingAtom, neighbourIDs, secondNeighbourIDs, thirdNeighbourIDs, neighbourElements, secondNeighbourElements, thirdNeighbourElements):
+    def __init__(self, atomID, atomType, element, bondingAtom, neighbourIDs, neighboursDict, elementDict, bondingAtoms):
         self.atomID = atomID
         self.atomType = atomType
         self.element = element
         self.bondingAtom = bondingAtom
 
         # Neighbours
-        self.mappedNeighbourIDs = neighbourIDs # This is changed according to mapping
-        self.firstNeighbourIDs = neighbourIDs.copy() # This is fixed throughout mapping process
-        self.secondNeighbourIDs = secondNeighbourIDs
-        self.thirdNeighbourIDs = thirdNeighbourIDs
+        neighbourElements = [elementDict[atomID] for atomID in neighbourIDs]
+        self.mappedNeighbourIDs = list(neighbourIDs) # This is changed according to mapping
+        self.firstNeighbourIDs = list(neighbourIDs) # This is fixed throughout mapping process
 
         self.mappedNeighbourElements = neighbourElements # This is changed according to mapping
         self.firstNeighbourElements = neighbourElements.copy() # This is fixed throughout mapping process
-        self.secondNeighbourElements = secondNeighbourElements
-        self.thirdNeighbourElements = thirdNeighbourElements
+
+        # Shared molecule data for finding further neighbours on first use
+        self._neighboursDict = neighboursDict
+        self._elementDict = elementDict
+        self._bondingAtoms = bondingAtoms
+        self._secondNeighbourIDs = None
+        self._thirdNeighbourIDs = None
+
+    # Second and third neighbours are only needed for symmetric atoms, so are found on first access and kept
+    @property
+    def secondNeighbourIDs(self):
+        if self._secondNeighbourIDs is None:
+            self._secondNeighbourIDs = get_additional_neighbours(self._neighboursDict, self.atomID, self._neighboursDict[self.atomID], self._bondingAtoms)
+        return self._secondNeighbourIDs
+
+    @property
+    def thirdNeighbourIDs(self):
+        if self._thirdNeighbourIDs is None:
+            self._thirdNeighbourIDs = get_additional_neighbours(self._neighboursDict, self.atomID, self.secondNeighbourIDs, self._bondingAtoms)
+        return self._thirdNeighbourIDs
+
+    @property
+    def secondNeighbourElements(self):
+        return [self._elementDict[atomID] for atomID in self.secondNeighbourIDs]
+
+    @property
+    def thirdNeighbourElements(self):
+        return [self._elementDict[atomID] for atomID in self.thirdNeighbourIDs]
 
     def check_mapped(self, mappedIDs, searchIndex, elementDict):
         """Update neighbourIDs.
@@ -176,7 +208,7 @@ class Atom():
         Returns:
             Updates existing class variable self.NeighbourIDs
         """
-        searchIndexMappedIDs = [row[searchIndex] for row in mappedIDs]
+        searchIndexMappedIDs = {row[searchIndex] for row in mappedIDs}
         
         self.mappedNeighbourIDs = [ID for ID in self.mappedNeighbourIDs if ID not in searchIndexMappedIDs]
         self.mappedNeighbourElements = [elementDict[atomID]for atomID in self.mappedNeighbourIDs]
@@ -257,7 +289,8 @@ class Atom():
             # Assign atomIDs if there is only one matching element - could this go wrong if an element moves and an identical element takes its place?
             elif elementOccurence == 1:
                 postIndex = atomObject.mappedNeighbourElements.index(neighbour)
-                logging.debug(f'Pre: {self.mappedNeighbourIDs[preIndex]}, Post: {atomObject.mappedNeighbourIDs[postIndex]} found with single element occurence')
+                if TRACER.enabled:
+                    TRACER.record('single_element', self.mappedNeighbourIDs[preIndex], atomObject.mappedNeighbourIDs[postIndex])
                 matchNeighbour(self, atomObject, preIndex, postIndex, mapList, queueAtoms)
 
             # More than one matching element requires additional considerations
@@ -265,7 +298,8 @@ class Atom():
                 if neighbour == 'H': # H can be handled simply as all H are equivalent to each other in this case - ignores chirality
                     postHydrogenIndexList = [index for index, element in enumerate(atomObject.mappedNeighbourElements) if element == 'H']
                     postIndex = postHydrogenIndexList.pop()
-                    logging.debug(f'Pre: {self.mappedNeighbourIDs[preIndex]}, Post: {atomObject.mappedNeighbourIDs[postIndex]} found with hydrogen symmetry inference')
+                    if TRACER.enabled:
+                        TRACER.record('hydrogen', self.mappedNeighbourIDs[preIndex], atomObject.mappedNeighbourIDs[postIndex])
                     matchNeighbour(self, atomObject, preIndex, postIndex, mapList, queueAtoms)
                     
                 else:
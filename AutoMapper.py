@@ -28,68 +28,187 @@ if pythonVersion[0] == 2: # Python 2 check - might be needless due to the sheban
 if pythonVersion[0] == 3 and pythonVersion[1] < 6: # Note on earlier versions of Python 3
     print('Note: This code uses insertion ordered dictionaries which were added in Python 3.6. AutoMapper may work with earlier versions of Python 3 but results may vary.')
 
-# Check that natsort is installed
-try:
-    import natsort
-except ModuleNotFoundError:
-    print('The package natsort was not found in the Python modules. Please install natsort before continuing.')
-    sys.exit()
-
+import os
 import argparse
-from LammpsUnifiedCleaner import file_unifier
-from LammpsToMolecule import lammps_to_molecule
-from MapProcessor import map_processor
-
-# Init the parser
-parser = argparse.ArgumentParser(description='Run preprocessing tools for LAMMPS simulation using fix bond/react')
-
-# List of arguments for command line
-parser.add_argument('directory', metavar='directory', type=str, nargs=1, help='Directory of file(s), can be found in bash with . or $PWD')
-parser.add_argument('tool', metavar='tool', type=str, nargs=1, choices=['clean', 'molecule', 'map'], help='Name of tool to be used. Possible tools: clean, molecule, map')
-parser.add_argument('data_files', metavar='data_files', nargs='+', help='Name of file(s) to be acted on. If tool is "map" then this must be two files ordered as pre-bond post-bond. If "clean" this can be a list of files in any order')
-parser.add_argument('--coeff_file', metavar='coeff_file', nargs=1, help='Argument for the "clean" tool: a coefficients file to be cleaned')
-parser.add_argument('--save_name', metavar='save_name', nargs='+', help='Argument for "molecule" and "map" tools: the file name of the new file(s)')
-parser.add_argument('--ba', metavar='bonding_atoms', nargs='+', help='Argument for the "map" tool: atom IDs of the atoms that will be involved in creating a new bond, separated by a space. Order of atoms must be the same between molecule files when mapping.')
-parser.add_argument('--ebt', metavar='elements_by_type', nargs='+', help='Argument for the "map" tools: series of elements symbols in the same order as the types specified in the data file and separated with a space')
-parser.add_argument('--da', metavar='delete_atoms', nargs='+', help='An optional argument for the "map" tool: atom IDs of the atoms that will be deleted after the bond has formed, separated by a space')
-parser.add_argument('--debug', action='store_true', help='An optional argument for the "map" tool: prints debugging statements with information on the path search and map processor.')
-parser.add_argument('--ca', metavar='create_atoms', nargs='+', help='An optional argument for the "map" tool: atom IDs of the atoms that will be created after the bond has formed, separated by a space')
-
-# Get arguments from parser
-args = parser.parse_args()
-# Take compulsory args out of list - other args done later
-tool = args.tool[0]
-directory = args.directory[0]
-
-
-# Throw errors if arguments are missing from certain tools
-if tool == 'clean' and (args.coeff_file is None):
-    parser.error('"clean" tool requries --coeff_file')
-
-if tool == 'molecule' and args.save_name is None:
-    parser.error('"molecule" tool requries --save_name argument')
-
-if tool == 'molecule' and len(args.data_files) > 1:
-    parser.error('The molecule tool can only take 1 data_file as input')
-
-if tool == 'map' and (len(args.data_files) != 2 or len(args.save_name) != 2):
-    parser.error('The map tool requires 2 data_files and 2 save_names (for pre and post molecule files)')
-
-if tool == 'map' and (len(args.ba) < 4 or args.ebt is None):
-    parser.error('The map tool requires --ba (bonding atoms) with at least 4 atomIDs specified and --ebt (elements by type) arguments')
-
-# Unified data file clean
-if tool == "clean":  
-    print(f'DataFiles List: {args.data_files}')
-    file_unifier(directory, args.coeff_file[0], args.data_files)
-
-# Produce molecule data file
-elif tool == "molecule":
-    lammps_to_molecule(directory, args.data_files[0], args.save_name[0])
-
-# Combined molecule and map creation code
-elif tool == 'map':
-    map_processor(directory, args.data_files[0], args.data_files[1], args.save_name[0], args.save_name[1], args.ba[:2], args.ba[2:], args.da, args.ebt, args.ca, args.debug)
-
-# Print message to show AutoMapper is complete
-print('AutoMapper Task Complete')
\ No newline at end of file
+
+def build_parser():
+    # Init the parser
+    parser = argparse.ArgumentParser(description='Run preprocessing tools for LAMMPS simulation using fix bond/react')
+
+    # List of arguments for command line
+    parser.add_argument('directory', metavar='directory', type=str, nargs=1, help='Directory of file(s), can be found in bash with . or $PWD')
+    parser.add_argument('tool', metavar='tool', type=str, nargs=1, choices=['clean', 'molecule', 'map', 'summary', 'index'], help='Name of tool to be used. Possible tools: clean, molecule, map, summary, index')
+    parser.add_argument('data_files', metavar='data_files', nargs='+', help='Name of file(s) to be acted on. If tool is "map" then this must be the pre-bond file followed by one or more post-bond files, each post-bond file is a separate reaction from the same pre-bond file. If "clean" this can be a list of files in any order')
+    parser.add_argument('--coeff_file', metavar='coeff_file', nargs=1, help='Argument for the "clean" tool: a coefficients file to be cleaned')
+    parser.add_argument('--incremental', action='store_true', help='An optional argument for the "clean" tool: save a manifest of the cleaned types, and add data_files to the files of the last incremental clean with the same coeff_file. Only new or changed files are parsed, and other cleaned files are only rewritten if the type union changes')
+    parser.add_argument('--save_name', metavar='save_name', nargs='+', help='Argument for "molecule" and "map" tools: the file name of the new file(s). For "map", a pre- and post-bond molecule file name for each post-bond file')
+    parser.add_argument('--ba', metavar='bonding_atoms', nargs='+', help='Argument for the "map" tool: atom IDs of the atoms that will be involved in creating a new bond, separated by a space. Order of atoms must be the same between molecule files when mapping. With several post-bond files, give 4 atom IDs (2 pre-bond then 2 post-bond) for each in order')
+    parser.add_argument('--ebt', metavar='elements_by_type', nargs='+', help='Argument for the "map" tools: series of elements symbols in the same order as the types specified in the data file and separated with a space')
+    parser.add_argument('--da', metavar='delete_atoms', nargs='+', action='append', help='An optional argument for the "map" tool: atom IDs of the atoms that will be deleted after the bond has formed, separated by a space. With several post-bond files, repeat --da once for each in order')
+    parser.add_argument('--debug', action='store_true', help='An optional argument for the "map" tool: prints debugging statements with information on the path search and map processor.')
+    parser.add_argument('--ca', metavar='create_atoms', nargs='+', action='append', help='An optional argument for the "map" tool: atom IDs of the atoms that will be created after the bond has formed, separated by a space. With several post-bond files, repeat --ca once for each in order')
+    parser.add_argument('--radius', metavar='radius', type=int, default=3, help='An optional argument for the "map" tool: number of bonds from the bonding atoms kept in the partial structure, before edges are extended away from type changes. Defaults to 3')
+    parser.add_argument('--minimise', action='store_true', help='An optional argument for the "map" tool: remove atoms from the outside of the partial structure until it is the smallest that keeps edges away from type changes and new angles and dihedrals')
+    parser.add_argument('--skip_validation', action='store_true', help='An optional argument for the "map" tool: do not check the map and partial structure for consistency after mapping')
+    parser.add_argument('--branch_workers', metavar='branch_workers', type=int, default=1, help='An optional argument for the "map" tool with several post-bond files: number of processes mapping them at once. Defaults to 1')
+    parser.add_argument('--template_library', metavar='library_directory', help='An optional argument for the "map" tool: directory of solved maps. A map from a template with the same labelled pre- and post-bond molecules is used instead of the path search, and new maps are added to the directory')
+    parser.add_argument('--trace', metavar='trace_file', help='An optional argument for the "map" tool: write the last mapping events (pre atom, post atom and the rule that paired them) to this file as JSON lines')
+    parser.add_argument('--profile', metavar='profile_file', help='An optional argument for the "clean", "molecule" and "map" tools: write a JSON report of the time, calls and atoms of each stage to this file')
+    parser.add_argument('--profile_memory', action='store_true', help='An optional argument for --profile: also report the peak Python memory and peak resident memory of each stage. This slows the tool down several times')
+    parser.add_argument('--progress', action='store_true', help='An optional argument for all tools: show a progress line on stderr with rows parsed, atoms mapped, missing atom rounds and bytes written. Runs the tool in this process')
+    parser.add_argument('--local', action='store_true', help='An optional argument for all tools: run in this process even if an AutoMapper server is running')
+
+    return parser
+
+def check_args(parser, args):
+    # Take compulsory args out of list - other args done later
+    tool = args.tool[0]
+
+    # Throw errors if arguments are missing from certain tools
+    if tool == 'clean' and (args.coeff_file is None):
+        parser.error('"clean" tool requries --coeff_file')
+
+    if tool == 'molecule' and args.save_name is None:
+        parser.error('"molecule" tool requries --save_name argument')
+
+    if tool == 'molecule' and len(args.data_files) > 1:
+        parser.error('The molecule tool can only take 1 data_file as input')
+
+    if tool == 'map' and (len(args.data_files) < 2 or args.save_name is None or len(args.save_name) != 2 * (len(args.data_files) - 1)):
+        parser.error('The map tool requires a pre-bond data_file and at least 1 post-bond data_file, with 2 save_names (for pre and post molecule files) for each post-bond file')
+
+    if tool == 'map' and (args.ba is None or len(args.ba) < 4 or args.ebt is None):
+        parser.error('The map tool requires --ba (bonding atoms) with at least 4 atomIDs specified and --ebt (elements by type) arguments')
+
+    if tool == 'map' and len(args.data_files) > 2:
+        branchCount = len(args.data_files) - 1
+        if len(args.ba) != 4 * branchCount:
+            parser.error('With several post-bond data_files, --ba needs 4 atomIDs for each post-bond file')
+        for option, values in [('--da', args.da), ('--ca', args.ca)]:
+            if values is not None and len(values) != branchCount:
+                parser.error(f'With several post-bond data_files, {option} must be given once for each post-bond file')
+
+    if tool == 'map' and len(args.data_files) == 2:
+        for option, values in [('--da', args.da), ('--ca', args.ca)]:
+            if values is not None and len(values) > 1:
+                parser.error(f'{option} can only be given once for a single post-bond data_file')
+
+    if tool == 'map' and args.radius < 1:
+        parser.error('--radius must be at least 1')
+
+    if args.profile_memory and args.profile is None:
+        parser.error('--profile_memory requires --profile')
+
+def run_tool(args):
+    '''Run the tool chosen in args. Used by the command line and by AutoMapper server workers'''
+    # Requests from older clients may not have profile, trace or progress entries
+    profileFile = getattr(args, 'profile', None)
+    traceFile = getattr(args, 'trace', None)
+    showProgress = getattr(args, 'progress', False)
+    if profileFile is None and traceFile is None and not showProgress:
+        select_tool(args)
+        return
+
+    from StageProfiler import PROFILER
+    from Tracing import TRACER
+    from Progress import PROGRESS, ProgressBar
+    if profileFile is not None:
+        PROFILER.enable(memory=getattr(args, 'profile_memory', False))
+    if traceFile is not None:
+        TRACER.enable()
+    if showProgress:
+        progressBar = ProgressBar()
+        PROGRESS.add_callback(progressBar)
+    try:
+        with PROFILER.stage(args.tool[0]):
+            select_tool(args)
+    finally:
+        # Saved even when the tool exits early, as failed maps are the ones worth examining
+        if profileFile is not None:
+            PROFILER.disable()
+            PROFILER.save(profileFile)
+        if traceFile is not None:
+            TRACER.disable()
+            TRACER.dump(traceFile)
+        if showProgress:
+            PROGRESS.remove_callback(progressBar)
+            progressBar.close()
+
+def select_tool(args):
+    tool = args.tool[0]
+    directory = args.directory[0]
+
+    # Tools are imported only when needed so a call doesn't pay for modules it never uses
+    # Unified data file clean
+    if tool == "clean":  
+        from LammpsUnifiedCleaner import file_unifier
+        print(f'DataFiles List: {args.data_files}')
+        file_unifier(directory, args.coeff_file[0], args.data_files, incremental=getattr(args, 'incremental', False))
+
+    # Produce molecule data file
+    elif tool == "molecule":
+        from LammpsToMolecule import lammps_to_molecule
+        lammps_to_molecule(directory, args.data_files[0], args.save_name[0])
+
+    # Combined molecule and map creation code
+    elif tool == 'map':
+        from MapProcessor import map_processor, map_branches
+        # --da and --ca are given once per post-bond file
+        deleteAtoms = args.da if args.da is not None else [None] * (len(args.data_files) - 1)
+        createAtoms = args.ca if args.ca is not None else [None] * (len(args.data_files) - 1)
+        options = {'debug': args.debug, 'radius': args.radius, 'minimise': args.minimise, 'validate': not args.skip_validation,
+                   'templateLibrary': getattr(args, 'template_library', None)}
+        if len(args.data_files) == 2:
+            map_processor(directory, args.data_files[0], args.data_files[1], args.save_name[0], args.save_name[1], args.ba[:2], args.ba[2:], deleteAtoms[0], args.ebt, createAtoms[0], **options)
+        else:
+            # Each post-bond file is a branch with its own map file, numbered in order
+            branches = []
+            for index, postDataFile in enumerate(args.data_files[1:]):
+                branches.append({'postDataFileName': postDataFile, 'preMoleculeFileName': args.save_name[2 * index], 'postMoleculeFileName': args.save_name[2 * index + 1],
+                                 'preBondingAtoms': args.ba[4 * index:4 * index + 2], 'postBondingAtoms': args.ba[4 * index + 2:4 * index + 4],
+                                 'deleteAtoms': deleteAtoms[index], 'createAtoms': createAtoms[index], 'mapFileName': f'automap{index + 1}.data'})
+            map_branches(directory, args.data_files[0], branches, args.ebt, workers=getattr(args, 'branch_workers', 1), **options)
+
+    # Print counts, types and box dimensions from the file headers only
+    elif tool == 'summary':
+        from LammpsFileReader import file_summary
+        for dataFile in args.data_files:
+            summary = file_summary(os.path.join(directory, dataFile))
+            print(dataFile)
+            for group, values in summary.items():
+                valueStrings = [' '.join(str(val) for val in value) if isinstance(value, list) else str(value) for value in values.values()]
+                print(f' {group}: ' + ', '.join(f'{keyword} {value}' for keyword, value in zip(values.keys(), valueStrings)))
+
+    # Write section index sidecars so later reads can seek straight to each section
+    elif tool == 'index':
+        from LammpsFileReader import write_section_index
+        for dataFile in args.data_files:
+            index = write_section_index(os.path.join(directory, dataFile))
+            print(f'{dataFile}: indexed ' + ', '.join(f'{sectionName} ({section[2]} rows)' for sectionName, section in index['sections'].items()))
+
+if __name__ == '__main__':
+    # Get arguments from parser
+    parser = build_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+
+    # Tools change directory, so the profile, trace and template library use absolute paths
+    if args.profile is not None:
+        args.profile = os.path.abspath(args.profile)
+    if args.trace is not None:
+        args.trace = os.path.abspath(args.trace)
+    if args.template_library is not None:
+        args.template_library = os.path.abspath(args.template_library)
+
+    # Forward to a running AutoMapper server if there is one, otherwise run the tool here
+    # Progress events are only seen by the process running the tool, so --progress always runs here
+    forwarded = False
+    if not args.local and not args.progress:
+        from AutoMapperServer import forward_request
+        forwarded = forward_request(args)
+
+    if not forwarded:
+        run_tool(args)
+
+    # Print message to show AutoMapper is complete
+    print('AutoMapper Task Complete')
@@ -0,0 +1,110 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Programmatic access to the AutoMapper tools. Each function returns an
+# in-memory result object and only writes files when asked to. Results can be
+# chained without touching the disk, e.g.
+#
+#   cleaned = clean('.', 'system.in.settings', ['pre.data', 'post.data'])
+#   result = map_reaction('.', cleaned.tidied_lines('pre.data'), cleaned.tidied_lines('post.data'),
+#                         ['1', '6'], ['1', '2'], ['H', 'C'], preDeleteAtoms=['5', '10'], postDeleteAtoms=['9', '10'])
+#   result.mappedIDList, result.edgeIDs, result.preTemplate.bonds
+#
+# Wherever a data file is expected, a list of tidied lines can be given instead.
+##############################################################################
+
+from LammpsUnifiedCleaner import file_unifier, CleanResult
+from LammpsToMolecule import lammps_to_molecule, MoleculeTemplate
+from MapProcessor import map_processor, map_branches, restore_dir, MapResult
+
+def clean(directory, coeffsFile, dataFiles, writeFiles=False, incremental=False):
+    '''
+    Unify types across dataFiles and cut down the coefficients file.
+    If incremental is True, a clean manifest is saved with the files and dataFiles are added to those
+    of the last incremental clean with the same coefficients file. Only files that are new, changed
+    or need renumbering are cleaned.
+
+    Returns:
+        CleanResult. Files are saved with a 'cleaned' prefix if writeFiles is True.
+    '''
+    with restore_dir():
+        return file_unifier(directory, coeffsFile, dataFiles, writeFiles=writeFiles, incremental=incremental)
+
+def molecule(directory, dataFile, saveName=None, bondingAtoms=None, deleteAtoms=None):
+    '''
+    Convert a LAMMPS data file to a molecule template.
+
+    Returns:
+        MoleculeTemplate. The template is saved if saveName is given.
+    '''
+    with restore_dir():
+        return lammps_to_molecule(directory, dataFile, saveName, bondingAtoms, deleteAtoms=deleteAtoms)
+
+def map_reaction(directory, preDataFile, postDataFile, preBondingAtoms, postBondingAtoms, elementsByType, preDeleteAtoms=None, postDeleteAtoms=None,
+                 createAtoms=None, preSaveName=None, postSaveName=None, mapSaveName=None, debug=False, radius=3, minimise=False, validate=True, templateLibrary=None):
+    '''
+    Map a reaction and build the pre- and post-bond molecule templates.
+
+    Args:
+        preBondingAtoms, postBondingAtoms: Bonding atomIDs in the same order in both files
+        elementsByType: Element symbols in atom type order
+        preDeleteAtoms, postDeleteAtoms: Optional delete atomIDs, must be given together
+        createAtoms: Optional post-bond atomIDs created by the reaction
+        preSaveName, postSaveName, mapSaveName: Optional file names to save the results to
+        radius: Number of bonds from the bonding atoms kept in the partial structure
+        minimise: Shrink the partial structure to the smallest valid one
+        validate: Check the map and partial structure, problems are listed in MapResult.diagnostics
+        templateLibrary: Optional directory of solved maps, used instead of the path search when one matches
+
+    Returns:
+        MapResult holding the map, bonding/edge/delete/create IDs and both MoleculeTemplates
+    '''
+    assert (preDeleteAtoms is None) == (postDeleteAtoms is None), 'preDeleteAtoms and postDeleteAtoms must be given together.'
+
+    deleteAtoms = None
+    if preDeleteAtoms is not None:
+        deleteAtoms = list(preDeleteAtoms) + list(postDeleteAtoms)
+
+    with restore_dir():
+        return map_processor(directory, preDataFile, postDataFile, preSaveName, postSaveName, list(preBondingAtoms), list(postBondingAtoms),
+                             deleteAtoms, elementsByType, createAtoms, debug=debug, mapFileName=mapSaveName, radius=radius, minimise=minimise, validate=validate, templateLibrary=templateLibrary)
+
+def map_reactions(directory, preDataFile, reactions, elementsByType, debug=False, radius=3, minimise=False, validate=True, templateLibrary=None, workers=1):
+    '''
+    Map several reactions that share a pre-bond data file. The pre-bond file is only read and analysed once.
+
+    Args:
+        reactions: List of dictionaries, one per reaction, with postDataFile, preBondingAtoms, postBondingAtoms
+            and, optionally, preDeleteAtoms, postDeleteAtoms, createAtoms, preSaveName, postSaveName and mapSaveName,
+            as for map_reaction
+        workers: Number of processes mapping reactions at once
+        Other arguments are as for map_reaction and apply to every reaction
+
+    Returns:
+        List of MapResult in the order of reactions
+    '''
+    branches = []
+    for reaction in reactions:
+        assert (reaction.get('preDeleteAtoms') is None) == (reaction.get('postDeleteAtoms') is None), 'preDeleteAtoms and postDeleteAtoms must be given together.'
+        deleteAtoms = None
+        if reaction.get('preDeleteAtoms') is not None:
+            deleteAtoms = list(reaction['preDeleteAtoms']) + list(reaction['postDeleteAtoms'])
+
+        branches.append({'postDataFileName': reaction['postDataFile'], 'preBondingAtoms': list(reaction['preBondingAtoms']), 'postBondingAtoms': list(reaction['postBondingAtoms']),
+                         'deleteAtoms': deleteAtoms, 'createAtoms': reaction.get('createAtoms'), 'preMoleculeFileName': reaction.get('preSaveName'),
+                         'postMoleculeFileName': reaction.get('postSaveName'), 'mapFileName': reaction.get('mapSaveName')})
+
+    with restore_dir():
+        return map_branches(directory, preDataFile, branches, elementsByType, workers=workers, debug=debug, radius=radius, minimise=minimise,
+                            validate=validate, templateLibrary=templateLibrary)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Runs clean -> molecule -> map workflows for many reactions at once. Steps of
+# one reaction run in order, except consecutive molecule steps (e.g. the pre-
+# and post-bond sides) which run together. Different reactions run
+# concurrently, so total time is set by the busiest stage rather than the sum
+# of every stage. Steps are offloaded from an asyncio loop to worker processes,
+# as the tools change the working directory.
+#
+# Reactions are given as a JSON file:
+# [{"name": "rx1", "steps": [["dir", "clean", "pre.data", "post.data", "--coeff_file", "system.in.settings"],
+#                            ["dir", "map", "cleanedpre.data", "cleanedpost.data", "--save_name", ...]]}]
+# where each step is the argument list that would be given to AutoMapper.py.
+##############################################################################
+
+import os
+import sys
+import json
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from AutoMapper import build_parser, check_args
+from AutoMapperServer import init_worker, run_request
+
+def parse_step(step):
+    # Validate a step with the AutoMapper.py parser and convert it to a worker request
+    parser = build_parser()
+    args = parser.parse_args(step)
+    check_args(parser, args)
+
+    request = vars(args)
+    request['directory'] = [os.path.abspath(args.directory[0])]
+    for outputKey in ['profile', 'trace', 'template_library']:
+        if request.get(outputKey) is not None:
+            request[outputKey] = os.path.abspath(request[outputKey])
+
+    # Steps run in worker processes, where progress lines from several steps would overwrite each other
+    request['progress'] = False
+
+    return request
+
+def group_steps(requests):
+    '''Group requests that must run in order, with consecutive molecule steps grouped together'''
+    groups = []
+    for request in requests:
+        if groups and request['tool'][0] == 'molecule' and groups[-1][-1]['tool'][0] == 'molecule':
+            groups[-1].append(request)
+        else:
+            groups.append([request])
+
+    return groups
+
+async def run_reaction(executor, reaction):
+    loop = asyncio.get_running_loop()
+    requests = [parse_step(step) for step in reaction['steps']]
+
+    responses = []
+    for group in group_steps(requests):
+        groupResponses = await asyncio.gather(*[loop.run_in_executor(executor, run_request, request) for request in group])
+        responses.extend(groupResponses)
+
+        # Later steps depend on the files from earlier ones, so stop the reaction at the first failure
+        if any(response['status'] != 'ok' for response in groupResponses):
+            break
+
+    return reaction['name'], responses
+
+async def run_pipeline(reactions, workers=None, cacheSize=32):
+    '''
+    Run every reaction concurrently in a pool of worker processes.
+    Returns a list of (reaction name, list of step responses) in the order reactions were given.
+    '''
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cacheSize,)) as executor:
+        return await asyncio.gather(*[run_reaction(executor, reaction) for reaction in reactions])
+
+def run_network(reactions, workers=None, cacheSize=32):
+    # Synchronous entry point for scripts that don't run their own event loop
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run_pipeline(reactions, workers, cacheSize))
+    finally:
+        loop.close()
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run AutoMapper workflows for a network of reactions concurrently')
+    parser.add_argument('reaction_file', metavar='reaction_file', help='JSON file listing reactions, each with a name and a list of AutoMapper.py argument lists')
+    parser.add_argument('--workers', metavar='workers', type=int, help='Number of worker processes. Defaults to the number of CPUs')
+    parser.add_argument('--cache_size', metavar='cache_size', type=int, default=32, help='Number of tidied files each worker keeps in its LRU cache')
+    args = parser.parse_args()
+
+    with open(args.reaction_file, 'r') as f:
+        reactions = json.load(f)
+
+    failed = False
+    for name, responses in run_network(reactions, args.workers, args.cache_size):
+        print(f'Reaction: {name}')
+        for response in responses:
+            print(response['output'], end='')
+            if response['status'] != 'ok':
+                print(response['error'], file=sys.stderr)
+                failed = True
+
+    if failed:
+        sys.exit(1)
+
+    print('AutoMapper Task Complete')
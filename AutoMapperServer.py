@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A long running AutoMapper server. Workers keep the tool modules imported and
+# hold an LRU cache of tidied data and settings files, so repeated calls skip
+# interpreter start up, imports and file parsing. AutoMapper.py forwards its
+# arguments here whenever a server is listening on the server address.
+#
+# Requests and responses are single lines of JSON. Tools change the working
+# directory, so requests run in a pool of worker processes rather than threads.
+##############################################################################
+
+import os
+import sys
+import json
+import socket
+
+def server_address():
+    '''
+    Get the server address from the AUTOMAPPER_SERVER environment variable.
+    This can be a Unix socket path or host:port. Defaults to a per-user socket in the temp directory.
+    '''
+    address = os.environ.get('AUTOMAPPER_SERVER')
+    if address is not None:
+        return address
+
+    import getpass
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), 'automapper-' + getpass.getuser() + '.sock')
+
+def parse_address(address):
+    # host:port addresses use TCP, anything else is a Unix socket path
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit() and os.sep not in address:
+        return socket.AF_INET, (host, int(port))
+
+    return socket.AF_UNIX, address
+
+def send_request(address, request):
+    family, socketAddress = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as client:
+        client.connect(socketAddress)
+        client.sendall((json.dumps(request) + '\n').encode())
+        with client.makefile('r') as f:
+            response = f.readline()
+
+    return json.loads(response)
+
+def forward_request(args):
+    '''
+    Send parsed AutoMapper.py arguments to a running server.
+    Return True if the server ran the tool, False if no server is available.
+    '''
+    address = server_address()
+    family, socketAddress = parse_address(address)
+    if family == socket.AF_UNIX and not os.path.exists(socketAddress):
+        return False
+
+    # Server has a different working directory, so send an absolute path
+    request = vars(args).copy()
+    request['directory'] = [os.path.abspath(args.directory[0])]
+
+    # Unreachable or unresolvable addresses (OSError) and a truncated reply from a server that
+    # stopped part way through (ValueError) fall back to running the tool locally
+    try:
+        response = send_request(address, request)
+    except (OSError, ValueError):
+        return False
+
+    print(response['output'], end='')
+    if response['status'] != 'ok':
+        print(response['error'], file=sys.stderr)
+        sys.exit(1)
+
+    return True
+
+def init_worker(cacheSize):
+    # Warm up the worker with the tool modules and a file cache
+    from LammpsTreatmentFuncs import FILE_CACHE
+    import LammpsUnifiedCleaner, LammpsToMolecule, MapProcessor
+
+    FILE_CACHE.resize(cacheSize)
+
+def run_request(request):
+    import io
+    import argparse
+    import contextlib
+    import traceback
+    from AutoMapper import run_tool
+
+    startDir = os.getcwd()
+    output = io.StringIO()
+    response = {'status': 'ok'}
+    try:
+        with contextlib.redirect_stdout(output):
+            run_tool(argparse.Namespace(**request))
+    except (Exception, SystemExit): # Tools call sys.exit() on some failures, this must not kill the worker
+        response = {'status': 'error', 'error': traceback.format_exc()}
+    finally:
+        os.chdir(startDir)
+
+    response['output'] = output.getvalue()
+
+    return response
+
+def serve(address, workers=None, cacheSize=32):
+    import socketserver
+    from concurrent.futures import ProcessPoolExecutor
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            response = self.server.executor.submit(run_request, request).result()
+            self.wfile.write((json.dumps(response) + '\n').encode())
+
+    family, socketAddress = parse_address(address)
+    if family == socket.AF_UNIX:
+        # Remove a socket left behind by a server that didn't shut down cleanly
+        if os.path.exists(socketAddress):
+            os.remove(socketAddress)
+        serverClass = type('ThreadingUnixServer', (socketserver.ThreadingMixIn, socketserver.UnixStreamServer), {})
+    else:
+        serverClass = type('ThreadingTCPServer', (socketserver.ThreadingMixIn, socketserver.TCPServer), {})
+    serverClass.daemon_threads = True
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cacheSize,)) as executor:
+        with serverClass(socketAddress, RequestHandler) as server:
+            server.executor = executor
+            print(f'AutoMapper server listening on {address}', flush=True)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                if family == socket.AF_UNIX and os.path.exists(socketAddress):
+                    os.remove(socketAddress)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a persistent AutoMapper server that AutoMapper.py forwards tool calls to')
+    parser.add_argument('--address', metavar='address', default=server_address(), help='Unix socket path or host:port to listen on. Defaults to the AUTOMAPPER_SERVER environment variable or a socket in the temp directory')
+    parser.add_argument('--workers', metavar='workers', type=int, help='Number of worker processes. Defaults to the number of CPUs')
+    parser.add_argument('--cache_size', metavar='cache_size', type=int, default=32, help='Number of tidied files each worker keeps in its LRU cache')
+    args = parser.parse_args()
+
+    serve(args.address, args.workers, args.cache_size)
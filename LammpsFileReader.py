@@ -0,0 +1,262 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Readers for large LAMMPS 'read_data' files. read_header stops at the first
+# section keyword, so header counts cost the same whatever the file size. An
+# optional sidecar index records each section's byte range so later reads can
+# seek straight to the sections they need. For sections, keywords are found
+# with a byte level scan, then large sections are split into byte ranges at
+# line boundaries and tokenised in a process pool. Chunks are concatenated in
+# order, so results are identical to clean_data, find_sections and get_data.
+# Small, compressed or in-memory files take the usual serial route.
+##############################################################################
+
+import os
+import re
+import json
+import mmap
+
+from LammpsTreatmentFuncs import clean_data, read_data_file, open_file, file_checksum
+from LammpsSearchFuncs import get_data, find_sections, get_header
+from Progress import PROGRESS
+
+# Files smaller than this are read serially, pool start up costs more than it saves
+PARALLEL_THRESHOLD = 32 * 1024 * 1024
+# Target size of each byte range handed to a worker
+CHUNK_SIZE = 4 * 1024 * 1024
+# Sidecar section index file extension
+INDEX_SUFFIX = '.amidx'
+
+def scan_sections(fileName):
+    '''
+    Find section keywords in an uncompressed file without reading it line by line.
+
+    Returns:
+        List of (sectionName, dataStart, dataEnd) byte offsets, where the data range
+        excludes the keyword line, and the byte offset of the first keyword
+    '''
+    with open(fileName, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return [], 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Only lines starting with a letter can be keywords, clean them the same way as clean_data
+            keywords = []
+            for match in re.finditer(rb'^[A-Za-z][^\n]*', mm, re.MULTILINE):
+                # The first line is the file comment, never a keyword
+                if match.start() == 0:
+                    continue
+                cleanedLine = clean_data([match.group().decode() + '\n'])
+                if len(cleanedLine) == 1 and cleanedLine[0].isalpha():
+                    keywords.append((cleanedLine[0], match.start(), match.end() + 1))
+            fileSize = len(mm)
+
+    sections = []
+    for index, (sectionName, _, dataStart) in enumerate(keywords):
+        dataEnd = keywords[index + 1][1] if index + 1 < len(keywords) else fileSize
+        sections.append((sectionName, min(dataStart, fileSize), dataEnd))
+
+    firstKeyword = keywords[0][1] if keywords else fileSize
+
+    return sections, firstKeyword
+
+def split_byte_range(fileName, start, end, chunkSize=None):
+    # Split [start, end) into ranges of roughly chunkSize that end on a newline
+    if chunkSize is None:
+        chunkSize = CHUNK_SIZE
+
+    chunks = []
+    with open(fileName, 'rb') as f:
+        chunkStart = start
+        while chunkStart < end:
+            chunkEnd = chunkStart + chunkSize
+            if chunkEnd >= end:
+                chunkEnd = end
+            else:
+                f.seek(chunkEnd)
+                f.readline() # Move to the end of the current line
+                chunkEnd = min(f.tell(), end)
+            chunks.append((chunkStart, chunkEnd))
+            chunkStart = chunkEnd
+
+    return chunks
+
+def read_byte_range(fileName, start, end):
+    with open(fileName, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode()
+
+    return text.splitlines(keepends=True)
+
+def parse_chunk(fileName, start, end):
+    '''Tidy and split the rows in one byte range. Runs in a worker process'''
+    lines = clean_data(read_byte_range(fileName, start, end))
+
+    return [line.split() for line in lines]
+
+def is_seekable(fileName):
+    # Byte offsets only make sense for uncompressed files on disk
+    return isinstance(fileName, str) and os.path.splitext(fileName)[1].lower() not in ('.gz', '.xz', '.bz2', '.zst')
+
+def write_section_index(fileName):
+    '''
+    Write a sidecar index (fileName + INDEX_SUFFIX) recording the byte range and row
+    count of every section, and a checksum of the file. Returns the index dictionary.
+    '''
+    scannedSections, firstKeyword = scan_sections(fileName)
+
+    sections = {}
+    for sectionName, dataStart, dataEnd in scannedSections:
+        if sectionName not in sections: # First occurrence wins, matching get_data
+            rowCount = len(parse_chunk(fileName, dataStart, dataEnd))
+            sections[sectionName] = [dataStart, dataEnd, rowCount]
+
+    index = {
+        'checksum': file_checksum(fileName),
+        'firstKeyword': firstKeyword,
+        'sections': sections,
+    }
+    with open(fileName + INDEX_SUFFIX, 'w') as f:
+        json.dump(index, f)
+
+    return index
+
+def load_section_index(fileName):
+    '''Return the sidecar index of fileName, or None if there isn't one or the checksum no longer matches'''
+    if not is_seekable(fileName) or not os.path.exists(fileName + INDEX_SUFFIX):
+        return None
+
+    try:
+        with open(fileName + INDEX_SUFFIX, 'r') as f:
+            index = json.load(f)
+        if file_checksum(fileName) != index['checksum']:
+            return None
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None
+
+    return index
+
+def read_data_sections(fileName, sectionNames, workers=None):
+    '''
+    Read a LAMMPS data file and return its tidied header lines and split section rows.
+
+    If a valid section index exists, only the header and the requested sections are read.
+    Large uncompressed files are tokenised in parallel with up to workers processes
+    (defaults to the CPU count, a single CPU always reads serially). Missing sections are returned as empty lists, as in get_data.
+
+    Returns:
+        headerLines, {sectionName: rows}
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    useParallel = workers > 1 and is_seekable(fileName) and os.path.getsize(fileName) >= PARALLEL_THRESHOLD
+    index = load_section_index(fileName)
+
+    # Serial route without an index, also served by FILE_CACHE
+    if index is None and not useParallel:
+        lines = read_data_file(fileName)
+        sectionIndexList = find_sections(lines)
+        headerEnd = next((lineIndex for lineIndex in sectionIndexList if lineIndex > 0), len(lines))
+        headerLines = lines[:headerEnd]
+        sections = {sectionName: get_data(sectionName, lines, sectionIndexList) for sectionName in sectionNames}
+        if PROGRESS.enabled:
+            for sectionName, rows in sections.items():
+                PROGRESS.emit('rows_parsed', file=fileName, section=sectionName, rows=len(rows))
+        return headerLines, sections
+
+    # Byte ranges come from the index, or a scan if it is missing or out of date
+    if index is not None:
+        firstKeyword = index['firstKeyword']
+        sectionRanges = {sectionName: (section[0], section[1]) for sectionName, section in index['sections'].items()}
+    else:
+        scannedSections, firstKeyword = scan_sections(fileName)
+        # First occurrence of each keyword wins, matching get_data
+        sectionRanges = {}
+        for sectionName, dataStart, dataEnd in scannedSections:
+            sectionRanges.setdefault(sectionName, (dataStart, dataEnd))
+
+    headerLines = clean_data(read_byte_range(fileName, 0, firstKeyword))
+
+    chunkJobs = []
+    for sectionName in sectionNames:
+        if sectionName in sectionRanges:
+            for chunk in split_byte_range(fileName, *sectionRanges[sectionName]):
+                chunkJobs.append((sectionName, chunk))
+
+    sections = {sectionName: [] for sectionName in sectionNames}
+    if useParallel:
+        # Imported here so header-only reads don't pay for it
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunkRows = executor.map(parse_chunk, [fileName] * len(chunkJobs), [job[1][0] for job in chunkJobs], [job[1][1] for job in chunkJobs])
+            for (sectionName, _), rows in zip(chunkJobs, chunkRows):
+                sections[sectionName].extend(rows)
+                if PROGRESS.enabled:
+                    PROGRESS.emit('rows_parsed', file=fileName, section=sectionName, rows=len(sections[sectionName]))
+    else:
+        for sectionName, chunk in chunkJobs:
+            sections[sectionName].extend(parse_chunk(fileName, *chunk))
+            if PROGRESS.enabled:
+                PROGRESS.emit('rows_parsed', file=fileName, section=sectionName, rows=len(sections[sectionName]))
+
+    return headerLines, sections
+
+def read_header(fileName):
+    '''
+    Read only the header of a LAMMPS data file, stopping at the first section keyword.
+    Returns the same dictionary as get_header on the whole tidied file.
+    '''
+    if isinstance(fileName, list):
+        return get_header(fileName)
+
+    headerLines = []
+    with open_file(fileName, 'r') as f:
+        for line in f:
+            cleanedLine = clean_data([line])
+            if len(cleanedLine) == 0:
+                continue
+
+            # Same stop rule as get_header - first line after the comment starting with a letter
+            cleanedLine = cleanedLine[0]
+            if len(headerLines) > 0 and cleanedLine[0] != '#' and cleanedLine[0].isalpha():
+                break
+            headerLines.append(cleanedLine)
+
+    return get_header(headerLines)
+
+def file_summary(fileName):
+    '''
+    Summarise a data file from its header only.
+
+    Returns:
+        Dictionary of 'counts' (e.g. atoms, bonds), 'types' (e.g. atom types) and 'box'
+        (e.g. xlo xhi) dictionaries, keyed by the space separated header keyword
+    '''
+    header = read_header(fileName)
+
+    summary = {'counts': {}, 'types': {}, 'box': {}}
+    for key, values in header.items():
+        if key == 'comment':
+            continue
+
+        keyword = key.replace('_', ' ')
+        if key.endswith('_types'):
+            summary['types'][keyword] = values[0]
+        elif key in ('xlo_xhi', 'ylo_yhi', 'zlo_zhi', 'xy_xz_yz'):
+            summary['box'][keyword] = values
+        else:
+            summary['counts'][keyword] = values[0] if len(values) == 1 else values
+
+    return summary
@@ -15,8 +15,7 @@
 # A range of functions designed to search LAMMPS files for information.
 # These functions work for 'read_data' files and 'molecule' files
 ##############################################################################
-from natsort import natsorted
-from LammpsTreatmentFuncs import clean_data
+from LammpsTreatmentFuncs import read_data_file
 
 # Get data
 def get_data(sectionName, lines, sectionIndexList, useExcept = True):
@@ -148,28 +147,24 @@ def get_additional_neighbours(neighboursDict, searchAtomID, searchNeighbours, bo
     return list(totalNeighbourSet)
 
 def element_atomID_dict(fileName, elementsByType):
-    # Load molecule file
-    with open(fileName, 'r') as f:
-        lines = f.readlines()
-
-    # Clean data and get charge
-    data = clean_data(lines)
+    # Load and clean molecule file
+    data = read_data_file(fileName)
     sections = find_sections(data)
     try: # Try is for getting types from molecule file types
         types = get_data('Types', data, sections, useExcept=False)
     except ValueError: # Exception gets types from standard lammps file type
         atoms = get_data('Atoms', data, sections, useExcept=False)
         types = [[atomRow[0], atomRow[2]] for atomRow in atoms]
-    typesDict = {row[0]: row[1] for row in types} # Keys: ID, Val: Type
+    typesDict = {int(row[0]): int(row[1]) for row in types} # Keys: integer ID, Val: Type
 
     # Ensure elementsByType is uppercase
     elementsByTypeDict = {index+1: val.upper() for index, val in enumerate(elementsByType)} # Keys: Type, Val: Elements
 
     # Assert that there are enough types in elementsByType for the highest type in the types variable
-    largestType = int(natsorted(types, key=lambda x: x[1])[-1][1]) # Types are stored as lists of [AtomNumber, TypeNumber]
+    largestType = max(typesDict.values())
     assert len(elementsByType) >= largestType, 'EBT (elements by type) is missing values. Check that all types are present and separated with a space.'
 
-    elementIDDict = {key: elementsByTypeDict[int(val)] for key, val in typesDict.items()}
+    elementIDDict = {key: elementsByTypeDict[val] for key, val in typesDict.items()}
 
     return elementIDDict
 
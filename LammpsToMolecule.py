@@ -18,93 +18,136 @@
 ##############################################################################
 
 import os
-from LammpsTreatmentFuncs import clean_data, add_section_keyword, refine_data, save_text_file, format_comment
-from LammpsSearchFuncs import get_data, find_sections, get_header, convert_header
+from LammpsTreatmentFuncs import refine_data, gc_paused, save_text_file, format_comment, format_lines, clean_data
+from LammpsSearchFuncs import get_header, convert_header
+from LammpsFileReader import read_data_sections
+from StageProfiler import stage, set_atoms
+
+class MoleculeTemplate:
+    '''
+    A LAMMPS molecule file held in memory.
+    Header is a header dictionary (see get_header) and each section is a list of rows
+    of strings without the section keyword.
+    '''
+    def __init__(self, header, types, charges, coords, bonds, angles, dihedrals, impropers, bondingAtoms=None, deleteAtoms=None):
+        self.header = header
+        self.types = types
+        self.charges = charges
+        self.coords = coords
+        self.bonds = bonds
+        self.angles = angles
+        self.dihedrals = dihedrals
+        self.impropers = impropers
+        self.bondingAtoms = bondingAtoms
+        self.deleteAtoms = deleteAtoms
+
+    def output_list(self):
+        '''Combine header and sections, with keywords, to the list of lists used by save_text_file'''
+        outputList = convert_header(self.header)
+        sections = [('Types', self.types), ('Charges', self.charges), ('Coords', self.coords), ('Bonds', self.bonds),
+                    ('Angles', self.angles), ('Dihedrals', self.dihedrals), ('Impropers', self.impropers)]
+        for sectionName, data in sections:
+            # Empty sections are left out, matching add_section_keyword
+            if len(data) > 0:
+                outputList.extend(['\n', [sectionName], '\n'])
+                outputList.extend(data)
+
+        return outputList
+
+    def labelled(self, bondingAtoms, deleteAtoms=None):
+        '''Copy of the template with bonding and delete atoms added to the header comment. Sections are shared, not copied'''
+        header = dict(self.header)
+        header['comment'] = self.header['comment'] + reaction_comment(bondingAtoms, deleteAtoms)
+
+        return MoleculeTemplate(header, self.types, self.charges, self.coords, self.bonds, self.angles, self.dihedrals, self.impropers, bondingAtoms, deleteAtoms)
+
+    def tidied_lines(self):
+        '''Tidied lines identical to reading the saved file, for passing to read_data_file users'''
+        return clean_data(format_lines(self.output_list()))
+
+    def save(self, fileName):
+        save_text_file(fileName, self.output_list())
+
+def reaction_comment(bondingAtoms, deleteAtoms):
+    # Create bonding atom comment
+    commentString = []
+    if bondingAtoms is not None:
+        commentString = format_comment(bondingAtoms, 'Bonding_Atoms ')
+    if deleteAtoms is not None:
+        deleteAtomComment = format_comment(deleteAtoms, 'Delete_Atoms')
+        commentString.extend([deleteAtomComment])
 
-def lammps_to_molecule(directory, fileName, saveName, bondingAtoms: list =None, deleteAtoms=None, validIDSet=None, renumberedAtomDict=None):
+    return commentString
+
+def read_molecule_sections(fileName):
+    '''Header lines and sections of a data file used by lammps_to_molecule, so one file can make several templates'''
+    # Parsing creates millions of small lists that can't form cycles, so the cycle collector is paused
+    with gc_paused(), stage('read_sections'):
+        headerLines, sections = read_data_sections(fileName, ['Atoms', 'Bonds', 'Angles', 'Dihedrals', 'Impropers'])
+        set_atoms(len(sections['Atoms']))
+
+    return headerLines, sections
+
+def lammps_to_molecule(directory, fileName, saveName, bondingAtoms: list =None, deleteAtoms=None, validIDSet=None, renumberedAtomDict=None, dataSections=None):
+    '''
+    Convert a LAMMPS data file, or a list of tidied lines, to a MoleculeTemplate.
+    The template is saved to saveName unless saveName is None. dataSections from
+    read_molecule_sections can be given to skip reading the file. They are not changed.
+    '''
     # Go to file directory
     os.chdir(directory)
 
-    # Load file into python as a list of lists
-    with open(fileName, 'r') as f:
-        lines = f.readlines()
-    
-    # Tidy input
-    tidiedLines = clean_data(lines)
-    
-    # Build sectionIndexList
-    sectionIndexList = find_sections(tidiedLines)
-
-    # Get atoms data
-    atoms = get_data('Atoms', tidiedLines, sectionIndexList)
-    atoms = refine_data(atoms, 0, validIDSet, renumberedAtomDict)
-
-    # Get bonds data
-    bonds = get_data('Bonds', tidiedLines, sectionIndexList)
-    bonds = refine_data(bonds, [2, 3], validIDSet, renumberedAtomDict)
-    bondInfo = ('bonds', len(bonds))
-    bonds = add_section_keyword('Bonds', bonds)
-
-    # Get angles data
-    angles = get_data('Angles', tidiedLines, sectionIndexList)
-    angles = refine_data(angles, [2, 3, 4], validIDSet, renumberedAtomDict)
-    angleInfo = ('angles', len(angles))
-    angles = add_section_keyword('Angles', angles)
-
-    # Get dihedrals
-    dihedrals = get_data('Dihedrals', tidiedLines, sectionIndexList)
-    dihedrals = refine_data(dihedrals, [2, 3, 4, 5], validIDSet, renumberedAtomDict)
-    dihedralInfo = ('dihedrals', len(dihedrals))
-    dihedrals = add_section_keyword('Dihedrals', dihedrals)
-
-    # Get impropers
-    impropers = get_data('Impropers', tidiedLines, sectionIndexList)
-    impropers = refine_data(impropers, [2, 3, 4, 5], validIDSet, renumberedAtomDict)
-    improperInfo = ('impropers', len(impropers))
-    impropers = add_section_keyword('Impropers', impropers)
-
-    # Rearrange atom data to get types, charges, coords - assume atom type full very important
-    types = [[atom[0], atom[2]] for atom in atoms]
-    typeInfo = ('atoms', len(types))
-    types = add_section_keyword('Types', types)
-
-    charges = [[atom[0], atom[3]] for atom in atoms]
-    charges = add_section_keyword('Charges', charges)
-
-    coords = [[atom[0], atom[4], atom[5], atom[6]] for atom in atoms]
-    coords = add_section_keyword('Coords', coords)
+    # Refining creates millions of small lists that can't form cycles, so the cycle collector is paused
+    with gc_paused():
+        # Load file into python as tidied header lines and split sections
+        if dataSections is None:
+            dataSections = read_molecule_sections(fileName)
+        headerLines, sections = dataSections
+
+        with stage('refine'):
+            # Get atoms data
+            atoms = refine_data(sections['Atoms'], 0, validIDSet, renumberedAtomDict)
+
+            # Get bonds data
+            bonds = refine_data(sections['Bonds'], [2, 3], validIDSet, renumberedAtomDict)
+
+            # Get angles data
+            angles = refine_data(sections['Angles'], [2, 3, 4], validIDSet, renumberedAtomDict)
+
+            # Get dihedrals
+            dihedrals = refine_data(sections['Dihedrals'], [2, 3, 4, 5], validIDSet, renumberedAtomDict)
+
+            # Get impropers
+            impropers = refine_data(sections['Impropers'], [2, 3, 4, 5], validIDSet, renumberedAtomDict)
+
+            # Rearrange atom data to get types, charges, coords in one pass - assume atom type full very important
+            types, charges, coords = [], [], []
+            for atom in atoms:
+                types.append(atom[0:3:2])
+                charges.append(atom[0:4:3])
+                coords.append([atom[0], atom[4], atom[5], atom[6]])
+            set_atoms(len(atoms))
 
     # Get and change header values
-    header = get_header(tidiedLines)
+    header = get_header(headerLines)
     
     # Update numbers with new lengths of data if new IDs have been supplied
     if validIDSet is not None:
-        for info in [typeInfo, bondInfo, angleInfo, dihedralInfo, improperInfo]:
-            header[info[0]] = [info[1]]
+        for key, data in [('atoms', types), ('bonds', bonds), ('angles', angles), ('dihedrals', dihedrals), ('impropers', impropers)]:
+            header[key] = [len(data)]
 
     # Create bonding atom comment
-    commentString = []
-    if bondingAtoms is not None:
-        commentString = format_comment(bondingAtoms, 'Bonding_Atoms ')
-    if deleteAtoms is not None:
-        deleteAtomComment = format_comment(deleteAtoms, 'Delete_Atoms')
-        commentString.extend([deleteAtomComment])
-    header['comment'].extend(commentString)
+    header['comment'].extend(reaction_comment(bondingAtoms, deleteAtoms))
 
     # Remove unnecessary header elements
     keepList = ['comment', 'atoms', 'bonds', 'angles', 'dihedrals', 'impropers']
     cutHeader = {key: header[key] for key in keepList}
 
-    # Convert header back to list of lists of strings
-    header = convert_header(cutHeader)
+    molecule = MoleculeTemplate(cutHeader, types, charges, coords, bonds, angles, dihedrals, impropers, bondingAtoms, deleteAtoms)
 
-    # Combine to one long output list
-    outputList = []
-    totalList = [header, types, charges, coords, bonds, angles, dihedrals, impropers]
-    
-    for keyword in totalList:
-        outputList.extend(keyword)
-        
     # Output as text file
-    save_text_file(saveName, outputList)
+    if saveName is not None:
+        with stage('output'):
+            molecule.save(saveName)
 
+    return molecule
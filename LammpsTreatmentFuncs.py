@@ -17,29 +17,89 @@
 # to a wide range of problems
 ##############################################################################
 
+import os # For FileCache
 import re # For clean_data, clean_settings
-from collections import Counter # For refine_data
+import zlib # For file_checksum
+import gc # For gc_paused
+import contextlib # For gc_paused
+import threading # For FileCache
+from collections import OrderedDict # For FileCache
 from operator import itemgetter # For refine_data
-from natsort import natsorted # For refine_data
+
+from Progress import PROGRESS # For save_text_file
+
+def id_key(value):
+    '''
+    Sort key for LAMMPS ID strings.
+    Integer IDs take a fast path and sort numerically. Anything else (e.g. type labels)
+    sorts after the integers in natural order, so 'c2' comes before 'c10'.
+    '''
+    try:
+        return (0, int(value), ())
+    except ValueError:
+        # Odd positions of the split are always digit runs, so tuples compare like for like
+        naturalParts = tuple(int(part) if index % 2 else part for index, part in enumerate(re.split(r'(\d+)', value)))
+        return (1, 0, naturalParts)
+
+def int_ids(IDList):
+    '''
+    Convert atomID strings read from files or the command line to integers.
+    The mapping code works on integer IDs, converting back with str_ids only for output.
+    Returns None if IDList is None.
+    '''
+    if IDList is None:
+        return None
+
+    return [int(atomID) for atomID in IDList]
+
+def str_ids(IDList):
+    # Inverse of int_ids, for writing files and results
+    if IDList is None:
+        return None
+
+    return [str(atomID) for atomID in IDList]
+
+@contextlib.contextmanager
+def gc_paused():
+    '''
+    Pause the cyclic garbage collector while building large numbers of small lists.
+    Rows of split strings can't form reference cycles, but each new list counts towards
+    a collection, so bulk parsing otherwise spends most of its time in repeated full collections.
+    '''
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if wasEnabled:
+            gc.enable()
+
+COMMENT_PATTERN = re.compile(r'(?<!\d\s\s)#(.*)')
 
 # Function maybe moved to general function file later
 def clean_data(lines):
-    # Remove blank lines
-    lines = [line for line in lines if line != '\n']
+    cleanedLines = []
+    for line in lines:
+        # Remove blank lines
+        if line == '\n':
+            continue
 
-    # Remove comments - negative lookbehind means label comments in masses are kept e.g # C_3
-    lines = [re.sub(r'(?<!\d\s\s)#(.*)', '' ,line) for line in lines]
+        # Remove comments - negative lookbehind means label comments in masses are kept e.g # C_3
+        # Most lines have no comment, so only those with a # pay for the regex
+        if '#' in line:
+            line = COMMENT_PATTERN.sub('', line)
 
-    # Remove newline terminators
-    lines = [re.sub(r'\n', '', line) for line in lines]
+        # Remove newline terminators
+        line = line.replace('\n', '')
 
-    # Remove empty strings in list caused by comments being removed
-    lines = [line for line in lines if line != '']
+        # Remove empty strings caused by comments being removed
+        if line == '':
+            continue
 
-    # Remove trailing whitespace
-    lines = [re.sub(r'\s+$', '', line) for line in lines]
+        # Remove trailing whitespace
+        cleanedLines.append(line.rstrip())
 
-    return lines
+    return cleanedLines
 
 def clean_settings(lines):
     # Remove newline terminators
@@ -53,12 +113,126 @@ def clean_settings(lines):
 
     return lines
 
+class FileCache:
+    '''
+    Least recently used cache of tidied file lines.
+    Entries are keyed by absolute path and cleaning function, and are only reused while the
+    file's modification time and size are unchanged. A maxSize of 0 disables caching, which
+    is the default for single CLI calls; the AutoMapper server enables it in its workers.
+    '''
+    def __init__(self, maxSize=0):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def resize(self, maxSize):
+        with self.lock:
+            self.maxSize = maxSize
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def get(self, fileName, cleaner):
+        if self.maxSize == 0:
+            return load_file(fileName, cleaner)
+
+        path = os.path.abspath(fileName)
+        fileStat = os.stat(path)
+        stamp = (fileStat.st_mtime_ns, fileStat.st_size)
+        key = (path, cleaner.__name__)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                return list(entry[1]) # Copy so callers can't alter the cached lines
+
+        lines = load_file(fileName, cleaner)
+
+        with self.lock:
+            self.entries[key] = (stamp, lines)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+        return list(lines)
+
+    def invalidate(self, fileName):
+        path = os.path.abspath(fileName)
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == path]:
+                del self.entries[key]
+
+FILE_CACHE = FileCache()
+
+def open_file(fileName, mode='r'):
+    '''
+    Open a text file for reading or writing, streaming through a compressor when the
+    extension is .gz, .xz, .bz2 or .zst. Any other extension is opened as plain text.
+    '''
+    extension = os.path.splitext(fileName)[1].lower()
+    textMode = mode + 't'
+
+    if extension == '.gz':
+        import gzip
+        return gzip.open(fileName, textMode)
+    elif extension == '.xz':
+        import lzma
+        return lzma.open(fileName, textMode)
+    elif extension == '.bz2':
+        import bz2
+        return bz2.open(fileName, textMode)
+    elif extension == '.zst':
+        # zstandard is the only compressor not in the standard library
+        try:
+            import zstandard
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError('The package zstandard was not found in the Python modules. Please install zstandard to read or write .zst files.')
+        return zstandard.open(fileName, textMode)
+    else:
+        return open(fileName, mode)
+
+def load_file(fileName, cleaner):
+    with open_file(fileName, 'r') as f:
+        lines = f.readlines()
+
+    return cleaner(lines)
+
+# Bytes read at a time by file_checksum
+CHECKSUM_BLOCK = 1024 * 1024
+
+def file_checksum(fileName):
+    '''
+    Size and CRC of every byte of a file, for checking a file hasn't changed since a sidecar
+    (e.g. a section index or clean manifest) was written. Reading raw bytes is far cheaper than parsing.
+    '''
+    checksum = 0
+    with open(fileName, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK), b''):
+            checksum = zlib.crc32(block, checksum)
+
+    return [os.path.getsize(fileName), checksum]
+
+def read_data_file(fileName):
+    '''
+    Load a LAMMPS data or molecule file and return the tidied lines.
+    fileName can also be a list of already tidied lines, so in-memory results
+    (e.g. MoleculeTemplate.tidied_lines()) can be used wherever a file is expected.
+    '''
+    if isinstance(fileName, list):
+        return list(fileName)
+
+    return FILE_CACHE.get(fileName, clean_data)
+
+def read_settings_file(fileName):
+    '''Load a LAMMPS coefficients file and return the tidied lines'''
+    return FILE_CACHE.get(fileName, clean_settings)
+
 def refine_data(data, searchIndex: list, IDset=None, newAtomIDs=None):
     '''
-    Search multiple indices for matching atomID value.
-    If match is found keep that list row in the data.
-    Only output that row if the row appears len(searchIndex) times
-    This means the data row contains valid atomIDs in all possible ID positions
+    Keep the rows whose atomIDs at every searchIndex position are in IDset.
+    Kept rows are renumbered with newAtomIDs, if given, and the row ID (e.g. bond number)
+    is reset to count up from 1 in file order. The Atoms section (searchIndex 0) keeps its
+    atomIDs and is sorted by them. Rows are copied, data is not changed.
     '''
     # If IDSet is not given, skip refining
     if IDset is None:
@@ -68,61 +242,59 @@ def refine_data(data, searchIndex: list, IDset=None, newAtomIDs=None):
     if type(searchIndex) is not list:
         searchIndex = [searchIndex]
 
-    # Adds rows that include a valid atom ID to list
-    possibleValidData = []
-    for atomID in IDset:
-        for row in data:
-            for index in searchIndex:
-                if row[index] == atomID:
-                    possibleValidData.append(row)
-
-    # Lammps IDs found in above search
-    # E.g. for angles, if the angle '25' appears 3 times, it means that the components for angle '25' are all in the IDSet
-    possibleValidIDs = [val[0] for val in possibleValidData]
-    IDCount = dict(Counter(possibleValidIDs))
-    # If ID counter is the same size as the search index, ID is valid and gets added to data
-    validIDs = [key for key in IDCount.keys() if IDCount[key] == len(searchIndex)]
-    validData = []
-    for row in possibleValidData:
-        if row[0] in validIDs:
-            validData.append(row)
-            # Stops duplicate IDs being refound in the future
-            validIDIndex = validIDs.index(row[0])
-            del validIDs[validIDIndex]
-
-    # If dict provided then use it to update the atom IDs from old to new
+    if not isinstance(IDset, (set, frozenset)):
+        IDset = set(IDset)
+
+    # Single pass in file order, set lookups make this linear in the number of rows
+    if len(searchIndex) == 1:
+        validData = [row for row in data if row[searchIndex[0]] in IDset]
+    else:
+        getIDs = itemgetter(*searchIndex)
+        validData = [row for row in data if IDset.issuperset(getIDs(row))]
+
+    if newAtomIDs is None:
+        newAtomIDs = {atomID: atomID for atomID in IDset}
+
+    refinedData = []
     for rowInd, row in enumerate(validData, start=1):
+        newRow = list(row)
         if searchIndex != [0]: # Don't run this for the 'atoms' section
-            row[0] = str(rowInd) # Reset the LAMMPS ID e.g. bond number
+            newRow[0] = str(rowInd) # Reset the LAMMPS ID e.g. bond number
         for index in searchIndex:
-            row[index] = newAtomIDs[row[index]]
+            newRow[index] = newAtomIDs[row[index]]
+        refinedData.append(newRow)
 
-    # Re-sort validData by ID, use natsort as values are str not int
-    validData = natsorted(validData, key=itemgetter(0))
+    # Other sections are already in ID order from the renumbering
+    if searchIndex == [0]:
+        refinedData.sort(key=lambda row: id_key(row[0]))
 
-    return validData
+    return refinedData
 
 def add_section_keyword(sectionName, data):
     # Don't add keyword if list is empty - empty list means no section in file
     if len(data) == 0:
         return data
 
-    # Add keyword name to start of list
-    data.insert(0, '\n')
-    data.insert(1, [sectionName])
-    data.insert(2, '\n')
+    # Add keyword name to start of list in one move rather than shifting the list for each line
+    data[:0] = ['\n', [sectionName], '\n']
 
     return data
 
+def format_lines(dataSource):
+    '''Convert a list of lists of strings to the text lines written by save_text_file'''
+    return [line if line == '\n' else line + '\n' for line in map(' '.join, dataSource)]
+
 def save_text_file(fileName, dataSource):
-    # Save to text file
-    with open(fileName, 'w') as f:
-        for item in dataSource:
-            line = " ".join(item)
-            if line != '\n':
-                f.write("%s\n" % line)
-            else:
-                f.write(line)
+    # Drop any cached copy of the file being overwritten
+    FILE_CACHE.invalidate(fileName)
+
+    # Save to text file, compressed if fileName has a compression extension
+    lines = format_lines(dataSource)
+    with open_file(fileName, 'w') as f:
+        f.writelines(lines)
+
+    if PROGRESS.enabled:
+        PROGRESS.emit('bytes_written', file=fileName, bytes=sum(map(len, lines)))
 
 # Create comment string with bond atoms and edge atoms
 def format_comment(IDlist, comment):
@@ -139,7 +311,7 @@ def edge_atom_fingerprint_strings(edgeAtomFingerprintDict, elementsByTypeDict):
         cutList = [elementsByTypeDict[atom] for atom in atomList]
 
         # Sort list alphabetically
-        cutList = natsorted(cutList)
+        cutList = sorted(cutList)
 
         # Join list to single string
         cutList = ''.join(cutList)
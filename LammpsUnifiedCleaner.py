@@ -18,6 +18,9 @@
 # system.in.settings files.
 # If only one data file is specified this function is analogous to
 # cleanup_moltemplate.sh.
+# An incremental clean also saves a manifest of the type union, the remap tables
+# and each data file's types with the cleaned files, so a file can later be added
+# to the cleaned set without parsing the others again.
 
 # Assumptions:
 # LAMMPS Atom Type is full
@@ -26,94 +29,195 @@
 ##############################################################################
 
 import os
-from natsort import natsorted
+import json
 from itertools import combinations_with_replacement
-from LammpsTreatmentFuncs import clean_data, clean_settings, add_section_keyword, save_text_file
-from LammpsSearchFuncs import get_data, get_coeff, find_sections, get_header, convert_header
-
-def file_unifier(directory, coeffsFile, dataList):
+from LammpsTreatmentFuncs import read_settings_file, add_section_keyword, save_text_file, id_key, clean_data, format_lines, file_checksum
+from LammpsSearchFuncs import get_coeff, get_header, convert_header
+from LammpsFileReader import read_data_sections
+from StageProfiler import stage, set_atoms
+
+# Sections read from each data file
+DATA_SECTIONS = ['Atoms', 'Masses', 'Bonds', 'Angles', 'Dihedrals', 'Impropers']
+# Types unioned across the data files, and the sections renumbered by each type other than atom types
+TYPE_ATTRS = ['atom_types', 'bond_types', 'angle_types', 'dihedral_types', 'improper_types']
+SECTION_TYPES = [('bond_types', 'bonds'), ('angle_types', 'angles'), ('dihedral_types', 'dihedrals'), ('improper_types', 'impropers')]
+# Prefix of cleaned files, and the extension added to the cleaned coefficients file name for the clean manifest
+CLEANED_PREFIX = 'cleaned'
+MANIFEST_SUFFIX = '.manifest.json'
+
+class CleanResult:
+    '''
+    In-memory result of file_unifier.
+    data maps each input data file name to its cleaned contents and settings holds the
+    cleaned coefficients, both as the lists of lists of strings used by save_text_file.
+    In an incremental clean, data only holds the files that were cleaned again and settings
+    is None if the cleaned coefficients file didn't need to change.
+    '''
+    def __init__(self, data, coeffsFile, settings):
+        self.data = data
+        self.coeffsFile = coeffsFile
+        self.settings = settings
+
+    def tidied_lines(self, dataFile):
+        '''Tidied lines of a cleaned data file, for passing to tools in place of a file name'''
+        return clean_data(format_lines(self.data[dataFile]))
+
+    def save(self, prefix=CLEANED_PREFIX):
+        for dataFile, combinedData in self.data.items():
+            save_text_file(prefix + dataFile, combinedData)
+        if self.settings is not None:
+            save_text_file(prefix + self.coeffsFile, self.settings)
+
+def manifest_name(coeffsFile):
+    return CLEANED_PREFIX + coeffsFile + MANIFEST_SUFFIX
+
+def load_manifest(coeffsFile):
+    '''Return the clean manifest written alongside the cleaned coeffsFile, or None if there isn't a readable one'''
+    try:
+        with open(manifest_name(coeffsFile), 'r') as f:
+            manifest = json.load(f)
+        if manifest['coeffsFile'] != coeffsFile:
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    return manifest
+
+def write_manifest(coeffsFile, coeffsChecksum, files, unionTypes, remaps):
+    '''
+    Record the type union, the old to new type remap tables, and the checksum and types of
+    each data file, so an incremental clean only has to parse files that are new or changed
+    '''
+    manifest = {
+        'coeffsFile': coeffsFile,
+        'coeffsChecksum': coeffsChecksum,
+        'files': files,
+        'union': unionTypes,
+        'remaps': remaps,
+    }
+    with open(manifest_name(coeffsFile), 'w') as f:
+        json.dump(manifest, f)
+
+    return manifest
+
+def read_data(dataFile):
+    # Load, tidy and split data - large files are split in parallel
+    with stage('read_data'):
+        headerLines, sections = read_data_sections(dataFile, DATA_SECTIONS)
+        set_atoms(len(sections['Atoms']))
+
+    headerDict = get_header(headerLines)
+
+    # Initialise data class
+    with stage('data'):
+        data = Data(sections, headerDict)
+
+    return data
+
+def file_unifier(directory, coeffsFile, dataList, writeFiles=True, incremental=False):
+    '''
+    Unify the types of dataList files and cut down coeffsFile to match, returning a CleanResult.
+    Cleaned files are saved with a 'cleaned' prefix if writeFiles is True.
+
+    If incremental is True, a manifest of the type union and remap tables is saved with the cleaned
+    files. If there is already a manifest from an earlier incremental clean with the same coeffsFile,
+    dataList is added to the files in it. Only new or changed files are parsed and the cleaned files
+    of the others are left alone, unless the type union changes and every file has to be renumbered.
+    '''
     # Go to file directory
     os.chdir(directory)
 
-    # Load files from dataList, tidy and initialise class object
-    lammpsData = []
+    manifest = load_manifest(coeffsFile) if incremental else None
+    if incremental and manifest is None:
+        print(f'No clean manifest for {coeffsFile} was found, the data files given will be cleaned as a new set.')
+    if manifest is not None:
+        dataList = list(manifest['files']) + [dataFile for dataFile in dataList if dataFile not in manifest['files']]
+
+    # Load new and changed files, the types of unchanged files are taken from the manifest
+    lammpsData = {}
+    files = {}
     for dataFile in dataList:
-        with open(dataFile, 'r') as f:
-            data = f.readlines()
-
-        # Tidy data
-        data = clean_data(data)
-
-        headerDict = get_header(data)
-
-        # Initialise data class
-        data = Data(data, headerDict)
-        lammpsData.append(data)
-
-    def union_types(typeAttr, lammpsData=lammpsData):
-        lammpsTypes = []
-        for data in lammpsData:
-            # Get attribute for determining types
-            getTypeAttr = 'get_' + typeAttr
-            func = getattr(data, getTypeAttr)
-            # Run function and append to list
-            lammpsTypes.append(func())
-
-        # Union sets to remove duplicates and sort into numerical order list 
-        types = natsorted(set().union(*lammpsTypes))
-        numTypes = (typeAttr, str(len(types))) # Tuple so that type can be accessed in dict later
-        
-        # Print number of types changed
-        # print(f'{typeAttr}\n Types: {types}\n Count: {numTypes}') 
-        
-        return types, numTypes
+        checksum = file_checksum(dataFile) if incremental else None
+        fileEntry = manifest['files'].get(dataFile) if manifest is not None else None
+        if fileEntry is not None and fileEntry['checksum'] == checksum and os.path.exists(CLEANED_PREFIX + dataFile):
+            files[dataFile] = fileEntry
+        else:
+            lammpsData[dataFile] = read_data(dataFile)
+            files[dataFile] = {'checksum': checksum, 'types': lammpsData[dataFile].get_types()}
 
     # Union sets and create sorted list for each type
-    atomTypes, numAtomTypes = union_types('atom_types')
-    bondTypes, numBondTypes = union_types('bond_types')
-    angleTypes, numAngleTypes = union_types('angle_types')
-    dihedralTypes, numDihedralTypes = union_types('dihedral_types')
-    improperTypes, numImproperTypes = union_types('improper_types')
+    with stage('union_types'):
+        unionTypes = {typeAttr: sorted(set().union(*[fileEntry['types'][typeAttr] for fileEntry in files.values()]), key=id_key) for typeAttr in TYPE_ATTRS}
 
     # Update sections
-    for data in lammpsData:
-        bondDict = data.change_section_types(bondTypes, 'bonds')
-        angleDict = data.change_section_types(angleTypes, 'angles')
-        dihedralDict = data.change_section_types(dihedralTypes, 'dihedrals')
-        improperDict = data.change_section_types(improperTypes, 'impropers')
-        massDict = data.change_mass_types(atomTypes)
-        data.change_atom_types(massDict)
-
-    # Update header - will delete multiline comments and leave only the first
-    sectionTypeCounts = [numAtomTypes, numBondTypes, numAngleTypes, numDihedralTypes, numImproperTypes]
-    for data in lammpsData:
-        data.change_header(sectionTypeCounts)
-
-    # Save data files
-    for index, data in enumerate(lammpsData):
-        # Combine all different data sources into one list
-        combinedData = [data.header, data.masses, data.atoms, data.bonds, data.angles, data.dihedrals, data.impropers]
-        # Flatten list of lists by one
-        combinedData = [val for sublist in combinedData for val in sublist]
-
-        # Save to text file
-        save_text_file('cleaned' + dataList[index], combinedData)
-    
+    fileMasses = {}
+    with stage('remap_sections'):
+        for dataFile, data in lammpsData.items():
+            remaps = data.change_types(unionTypes)
+            fileMasses[dataFile] = remaps['masses']
+
+    # Cleaned files of unchanged data files stay valid only if every remap table is the same as before.
+    # Masses are renumbered from each file's Masses section, so they are checked as well as the union
+    unionChanged = manifest is None or unionTypes != manifest['union'] or \
+        any(massDict != manifest['remaps']['masses'] for massDict in fileMasses.values())
+    if unionChanged and len(lammpsData) < len(dataList):
+        if manifest is not None:
+            print('Type union has changed, all data files will be cleaned.')
+        for dataFile in dataList:
+            if dataFile not in lammpsData:
+                lammpsData[dataFile] = read_data(dataFile)
+                with stage('remap_sections'):
+                    fileMasses[dataFile] = lammpsData[dataFile].change_types(unionTypes)['masses']
+
+    # Section remaps only depend on the union, pair coeffs use the masses of the last data file
+    remaps = {section: type_remap(unionTypes[typeAttr]) for typeAttr, section in SECTION_TYPES}
+    remaps['masses'] = fileMasses[dataList[-1]] if dataList[-1] in fileMasses else manifest['remaps']['masses']
+
+    # Combine data files for output, in dataList order
+    cleanedData = {}
+    with stage('flatten'):
+        for dataFile in dataList:
+            if dataFile in lammpsData:
+                cleanedData[dataFile] = lammpsData[dataFile].combined()
+
     ####SETTINGS####
 
+    # Cleaned coefficients only change with the union, the masses or the coefficients file
+    coeffsChecksum = file_checksum(coeffsFile) if incremental else None
+    settingsChanged = unionChanged or manifest['coeffsChecksum'] != coeffsChecksum or not os.path.exists(CLEANED_PREFIX + coeffsFile)
+    combinedCoeffs = None
+    if settingsChanged:
+        with stage('settings'):
+            combinedCoeffs = unify_settings(coeffsFile, unionTypes['atom_types'], remaps)
+
+    cleanResult = CleanResult(cleanedData, coeffsFile, combinedCoeffs)
+
+    # Save data and coeff files, then the manifest describing them
+    if writeFiles:
+        with stage('output'):
+            cleanResult.save()
+            if incremental:
+                write_manifest(coeffsFile, coeffsChecksum, files, unionTypes, remaps)
+
+    return cleanResult
+
+def type_remap(unionedTypes):
+    # Old type keys and new type values, numbered from 1 in union order
+    return {oldType: str(newType) for newType, oldType in enumerate(unionedTypes, start=1)}
+
+def unify_settings(coeffsFile, atomTypes, remaps):
+    '''Cut coeffsFile down to the unioned types and renumber them with remaps, returns the coefficient lines'''
     # Load dataFile into python as a list of lists
-    with open(coeffsFile, 'r') as f:
-        settings = f.readlines()
-    
-    # Tidy settings and split
-    settings = clean_settings(settings)
+    settings = read_settings_file(coeffsFile)
+
+    # Split tidied settings
     settings = [line.split() for line in settings]
 
     # Create original atom type pair_coeff pairs
     originalPairTuples = list(combinations_with_replacement(atomTypes, 2))
     # Get all pair_coeffs
     pairCoeff = get_coeff("pair_coeff", settings)
-    
+
     # Find valid pair_coeff pairs that are needed for this molecule
     # Currently, the h-bond flag value in hbond/dreiding is sorted as H_HB will always be 2 if H is in system
     # Apart from water or peroxide...
@@ -124,6 +228,7 @@ def file_unifier(directory, coeffsFile, dataList):
                 validPairCoeff.append(coeff)
 
     # Update atom types in pair_coeffs with massDict
+    massDict = remaps['masses']
     for pair in validPairCoeff:
         pair[1] = massDict[pair[1]]
         pair[2] = massDict[pair[2]]
@@ -147,36 +252,34 @@ def file_unifier(directory, coeffsFile, dataList):
         return validCoeffs
 
     # Update coeff values
-    validBondCoeff = valid_coeffs('bond_coeff', bondDict)
-    validAngleCoeff = valid_coeffs('angle_coeff', angleDict)
-    validDihedralCoeff = valid_coeffs('dihedral_coeff', dihedralDict)
-    validImproperCoeff = valid_coeffs('improper_coeff', improperDict)
+    validBondCoeff = valid_coeffs('bond_coeff', remaps['bonds'])
+    validAngleCoeff = valid_coeffs('angle_coeff', remaps['angles'])
+    validDihedralCoeff = valid_coeffs('dihedral_coeff', remaps['dihedrals'])
+    validImproperCoeff = valid_coeffs('improper_coeff', remaps['impropers'])
 
     # Combine all the coeff sources
     combinedCoeffs = [validPairCoeff, validBondCoeff, validAngleCoeff, validDihedralCoeff, validImproperCoeff]
     # Flatten list of lists by one
-    combinedCoeffs = [val for sublist in combinedCoeffs for val in sublist]
-
-    # Save coeff file
-    save_text_file('cleaned' + coeffsFile, combinedCoeffs)
+    return [val for sublist in combinedCoeffs for val in sublist]
 
 # Class for handling Lammps data
 class Data:
-    def __init__(self, data, headerDict):
-        self.data = data
-        self.sectionIndexList = find_sections(self.data)
-
+    def __init__(self, sections, headerDict):
         # Header data
         self.header = headerDict
 
         # Section data
-        self.atoms = get_data('Atoms', self.data, self.sectionIndexList)
-        self.masses = get_data('Masses', self.data, self.sectionIndexList)
-        self.bonds = get_data('Bonds', self.data, self.sectionIndexList)
-        self.angles = get_data('Angles', self.data, self.sectionIndexList)
-        self.dihedrals = get_data('Dihedrals', self.data, self.sectionIndexList)
-        self.impropers = get_data('Impropers', self.data, self.sectionIndexList)
+        self.atoms = sections['Atoms']
+        self.masses = sections['Masses']
+        self.bonds = sections['Bonds']
+        self.angles = sections['Angles']
+        self.dihedrals = sections['Dihedrals']
+        self.impropers = sections['Impropers']
     
+    def get_types(self):
+        '''Sorted types of each TYPE_ATTRS name, as lists so they can be saved in the clean manifest'''
+        return {typeAttr: sorted(getattr(self, 'get_' + typeAttr)(), key=id_key) for typeAttr in TYPE_ATTRS}
+
     def get_atom_types(self):
         atom_types = {atom[2] for atom in self.atoms}
         return atom_types
@@ -248,6 +351,24 @@ class Data:
 
         return type_change_dict
 
+    def change_types(self, unionTypes):
+        '''Renumber every section and the header with the unioned types, returns the remap tables used'''
+        remaps = {}
+        for typeAttr, section in SECTION_TYPES:
+            remaps[section] = self.change_section_types(unionTypes[typeAttr], section)
+        remaps['masses'] = self.change_mass_types(unionTypes['atom_types'])
+        self.change_atom_types(remaps['masses'])
+
+        # Update header - will delete multiline comments and leave only the first
+        self.change_header([(typeAttr, str(len(unionTypes[typeAttr]))) for typeAttr in TYPE_ATTRS])
+
+        return remaps
+
+    def combined(self):
+        # Combine all different data sources into one list, flattened by one
+        combinedData = [self.header, self.masses, self.atoms, self.bonds, self.angles, self.dihedrals, self.impropers]
+        return [val for sublist in combinedData for val in sublist]
+
     def change_header(self, typeList):
         # Iterate through type tuples and update header
         for typeData in typeList:
@@ -23,21 +23,89 @@
 import os
 import logging
 import contextlib
-from natsort import natsorted
 from copy import deepcopy
+from collections import deque
 
 from PathSearch import map_from_path
-from LammpsToMolecule import lammps_to_molecule
-from LammpsTreatmentFuncs import save_text_file
+from LammpsToMolecule import lammps_to_molecule, read_molecule_sections
+from LammpsTreatmentFuncs import save_text_file, int_ids, str_ids
 from LammpsSearchFuncs import element_atomID_dict
-from AtomObjectBuilder import build_atom_objects
-
-def map_processor(directory, preDataFileName, postDataFileName, preMoleculeFileName, postMoleculeFileName, preBondingAtoms, postBondingAtoms, deleteAtoms, elementsByType, createAtoms, debug=False):
-    # Set log level
-    if debug:
-        logging.basicConfig(level='DEBUG')
-    else:
-        logging.basicConfig(level='INFO')
+from AtomObjectBuilder import build_atom_objects, read_atom_graph
+from MapValidator import validate_map
+from StageProfiler import stage, set_atoms
+from Tracing import configure_logging, TRACER
+from Progress import PROGRESS
+from TemplateLibrary import TemplateLibrary, ReactionGraphs
+
+# Edge atoms must be more than this many bonds from any atom that changes type
+EDGE_TYPE_DISTANCE = 2
+# Default number of bonds from the bonding atoms kept in a partial structure
+DEFAULT_RADIUS = 3
+# Atoms this many bonds or fewer from a bonding atom are part of new angles and dihedrals, so can never be edges
+CORE_RADIUS = 2
+
+class MapResult:
+    '''
+    In-memory result of map_processor.
+
+    mappedIDList is the map written to the map file, renumbered if a partial structure was made.
+    fullMappedIDList is the complete map in the original data file atomIDs and partialMappedIDList
+    holds the pairs kept in the partial structure, also in original atomIDs (empty if no partial structure).
+    bondingIDs, edgeIDs, deleteIDs and createIDs use the same numbering as mappedIDList.
+    preTemplate and postTemplate are the matching MoleculeTemplates. diagnostics lists any
+    problems found by MapValidator, with atomIDs from the original data files. searchStats
+    counts the atoms the path search missed and the inference rounds needed to find them, and
+    names the library template used instead of the path search, if any.
+    '''
+    def __init__(self, mappedIDList, fullMappedIDList, partialMappedIDList, bondingIDs, edgeIDs, deleteIDs, createIDs, preTemplate, postTemplate, diagnostics=None, searchStats=None):
+        self.mappedIDList = mappedIDList
+        self.fullMappedIDList = fullMappedIDList
+        self.partialMappedIDList = partialMappedIDList
+        self.bondingIDs = bondingIDs
+        self.edgeIDs = edgeIDs
+        self.deleteIDs = deleteIDs
+        self.createIDs = createIDs
+        self.preTemplate = preTemplate
+        self.postTemplate = postTemplate
+        self.diagnostics = diagnostics if diagnostics is not None else []
+        self.searchStats = searchStats if searchStats is not None else {}
+
+    def output_list(self):
+        return output_map(self.mappedIDList, self.bondingIDs, self.edgeIDs, self.deleteIDs, self.createIDs)
+
+    def save(self, fileName):
+        save_text_file(fileName, self.output_list())
+
+class PreReaction:
+    '''
+    The pre-bond side of a reaction, built once so several reactions (branches) from the same pre-bond
+    data file can share it. Holds the read data file sections, the full molecule template, its tidied lines,
+    element dict and atom graph, and a cache of the ring found around each bonding atom by is_cyclic.
+    '''
+    def __init__(self, directory, dataFileName, elementsByType):
+        with restore_dir(), stage('pre_molecule'):
+            os.chdir(directory)
+            self.dataSections = read_molecule_sections(dataFileName)
+            self.molecule = lammps_to_molecule(directory, dataFileName, None, dataSections=self.dataSections)
+            self.lines = self.molecule.tidied_lines()
+            self.elementDict = element_atomID_dict(self.lines, elementsByType)
+            self.atomGraph = read_atom_graph(self.lines)
+        self.cycles = {}
+
+def map_processor(directory, preDataFileName, postDataFileName, preMoleculeFileName, postMoleculeFileName, preBondingAtoms, postBondingAtoms, deleteAtoms, elementsByType, createAtoms, debug=False, mapFileName='automap.data', radius=DEFAULT_RADIUS, minimise=False, validate=True, templateLibrary=None, preReaction=None):
+    '''
+    Create pre- and post-bond molecule templates and a map, returned as a MapResult.
+    Data files can be file names or lists of tidied lines. Molecule and map files are only
+    written for the file names that are not None. The partial structure keeps atoms up to
+    radius bonds from the bonding atoms, before edge extension. If minimise is True, atoms
+    that aren't needed are then peeled off the outside of the partial structure. The map is
+    checked by MapValidator unless validate is False. If templateLibrary is a directory, a matching
+    template from it replaces the path search and new maps without validation problems are added to it.
+    Reactions with create atoms always use the path search. preReaction is a PreReaction for
+    preDataFileName, given when several reactions share it (see map_branches).
+    '''
+    # Set log level, debug also echoes traced mapping events
+    configure_logging(debug)
     
     # Split delete atoms list, if given
     if deleteAtoms is not None:
@@ -49,37 +117,75 @@ def map_processor(directory, preDataFileName, postDataFileName, preMoleculeFileN
         preDeleteAtoms = None
         postDeleteAtoms = None
     
-    # Initial molecule creation
-    with restore_dir(): # Allows for relative directory usage
-        lammps_to_molecule(directory, preDataFileName, preMoleculeFileName, preBondingAtoms, deleteAtoms=preDeleteAtoms)
+    # Initial molecule creation - kept in memory, files are written once the final structure is known
+    if preReaction is None:
+        preReaction = PreReaction(directory, preDataFileName, elementsByType)
+    preMolecule = preReaction.molecule.labelled(preBondingAtoms, preDeleteAtoms)
     
-    with restore_dir():
-        lammps_to_molecule(directory, postDataFileName, postMoleculeFileName, postBondingAtoms, deleteAtoms=postDeleteAtoms)
-
-    # Initial map creation
-    with restore_dir():
-        mappedIDList = map_from_path(directory, preMoleculeFileName, postMoleculeFileName, elementsByType, debug, preBondingAtoms, preDeleteAtoms, postBondingAtoms, postDeleteAtoms, createAtoms)
-
-    # Cut map down to smallest possible partial structure
-    with restore_dir():
-        # Load data from just created files
-        os.chdir(directory)
-        preElementDict = element_atomID_dict(preMoleculeFileName, elementsByType)
-        postElementDict = element_atomID_dict(postMoleculeFileName, elementsByType)
-
-        preAtomObjectDict = build_atom_objects(preMoleculeFileName, preElementDict, preBondingAtoms)
-        postAtomObjectDict = build_atom_objects(postMoleculeFileName, postElementDict, postBondingAtoms, createAtoms=createAtoms) 
+    with restore_dir(), stage('post_molecule'): # Allows for relative directory usage
+        postMolecule = lammps_to_molecule(directory, postDataFileName, None, postBondingAtoms, deleteAtoms=postDeleteAtoms)
+
+    preMoleculeLines = preReaction.lines
+    postMoleculeLines = postMolecule.tidied_lines()
+
+    # Mapping works on integer atomIDs, they are converted back to strings for the templates and MapResult
+    preBondingAtoms = int_ids(preBondingAtoms)
+    postBondingAtoms = int_ids(postBondingAtoms)
+    preDeleteAtoms = int_ids(preDeleteAtoms)
+    postDeleteAtoms = int_ids(postDeleteAtoms)
+    createAtoms = int_ids(createAtoms)
+
+    # Atom objects for the partial structure, the path search builds its own as it changes them
+    with stage('atom_objects'):
+        preElementDict = preReaction.elementDict
+        postElementDict = element_atomID_dict(postMoleculeLines, elementsByType)
+
+        preAtomObjectDict = build_atom_objects(preMoleculeLines, preElementDict, preBondingAtoms, atomGraph=preReaction.atomGraph)
+        postAtomObjectDict = build_atom_objects(postMoleculeLines, postElementDict, postBondingAtoms, createAtoms=createAtoms) 
+        set_atoms(len(preAtomObjectDict))
+
+    # Project a template from the library if one matches, otherwise create the map with the path search
+    searchStats = {'missingAtoms': 0, 'rounds': 0, 'template': None}
+    library = None
+    templateMap = None
+    if templateLibrary is not None and createAtoms is None:
+        with stage('template_lookup'):
+            library = TemplateLibrary(templateLibrary)
+            reactionGraphs = ReactionGraphs(preAtomObjectDict, postAtomObjectDict, preBondingAtoms, postBondingAtoms, preDeleteAtoms, postDeleteAtoms)
+            templateMap = library.project(reactionGraphs)
+
+    if templateMap is not None:
+        mappedIDList, searchStats['template'] = templateMap
+        if TRACER.enabled:
+            for preAtom, postAtom in mappedIDList:
+                TRACER.record('template', preAtom, postAtom)
+        if PROGRESS.enabled:
+            PROGRESS.emit('atoms_mapped', mapped=len(mappedIDList), total=len(preAtomObjectDict))
+    else:
+        with restore_dir(), stage('map_from_path'):
+            mappedIDList = map_from_path(directory, preMoleculeLines, postMoleculeLines, elementsByType, preBondingAtoms, preDeleteAtoms, postBondingAtoms, postDeleteAtoms, createAtoms, searchStats,
+                                         preElementDict=preElementDict, preAtomGraph=preReaction.atomGraph)
 
     # Determine if bonding atom is part of a cycle, and if so what atoms make up the cycle and their neighbours 
-    prePreservedAtomIDs = is_cyclic(preAtomObjectDict, preBondingAtoms, 'Pre-bond')
-    postPreservedAtomIDs = is_cyclic(postAtomObjectDict, postBondingAtoms, 'Post-bond')
+    with stage('is_cyclic'):
+        prePreservedAtomIDs = is_cyclic(preAtomObjectDict, preBondingAtoms, 'Pre-bond', preReaction.cycles)
+        postPreservedAtomIDs = is_cyclic(postAtomObjectDict, postBondingAtoms, 'Post-bond')
     
+    # Look up post atoms from pre atoms
+    mappedIDDict = {pair[0]: pair[1] for pair in mappedIDList}
+
     # Determine atoms to be kept if reaction is a ring opening
-    prePartialAtomsSet, postPartialAtomsSet = is_ring_opening(prePreservedAtomIDs, postPreservedAtomIDs, mappedIDList)
+    prePartialAtomsSet, postPartialAtomsSet = is_ring_opening(prePreservedAtomIDs, postPreservedAtomIDs, mappedIDDict)
+    ringOpeningAtoms = set(prePartialAtomsSet)
+
+    # Minimising can only remove atoms, so start from a structure that holds every core atom and its neighbours
+    if minimise:
+        radius = max(radius, CORE_RADIUS + 1)
 
-    # Keep atoms up to 4 bonds away from the bonding atoms
-    prePartialAtomsSet = keep_all_neighbours(preAtomObjectDict, preBondingAtoms, prePartialAtomsSet)
-    postPartialAtomsSet = keep_all_neighbours(postAtomObjectDict, postBondingAtoms, postPartialAtomsSet)
+    # Keep atoms up to radius bonds away from the bonding atoms
+    with stage('partial_structure'):
+        prePartialAtomsSet = keep_all_neighbours(preAtomObjectDict, preBondingAtoms, prePartialAtomsSet, radius)
+        postPartialAtomsSet = keep_all_neighbours(postAtomObjectDict, postBondingAtoms, postPartialAtomsSet, radius)
 
     # Keep delete atoms
     if preDeleteAtoms is not None:
@@ -90,26 +196,62 @@ def map_processor(directory, preDataFileName, postDataFileName, preMoleculeFileN
     if createAtoms is not None:
         postPartialAtomsSet.update(createAtoms)
 
-    # Find initial pre-bond edge atoms
-    preEdgeAtoms = find_edge_atoms(preAtomObjectDict, prePartialAtomsSet)
-
-    # Check the edges aren't too close to atoms that change type
-    preExtendEdgeDict = verify_edge_atoms(preEdgeAtoms, mappedIDList, preAtomObjectDict, postAtomObjectDict)
-
-    # Update mapped list and partial atom sets if edge atoms need extending
-    mappedIDList, prePartialAtomsSet, postPartialAtomsSet = extend_edge_atoms(preExtendEdgeDict, mappedIDList, preAtomObjectDict, postAtomObjectDict, prePartialAtomsSet, postPartialAtomsSet)
-    
-    # Refind edge atoms after potential extension
-    preEdgeAtoms = find_edge_atoms(preAtomObjectDict, prePartialAtomsSet)
-
     # Check for and get byproduct atoms that aren't deleteIDs
-    postAtomByproducts = get_byproducts(postAtomObjectDict, postBondingAtoms)
-    if postAtomByproducts is not None:
-        logging.debug(f'Byproducts found. Byproducts are {postAtomByproducts} (post IDs)')
-        postPartialAtomsSet.update(postAtomByproducts)
+    with stage('byproducts'):
+        postAtomByproducts = get_byproducts(postAtomObjectDict, postBondingAtoms)
+        if postAtomByproducts is not None:
+            logging.debug(f'Byproducts found. Byproducts are {postAtomByproducts} (post IDs)')
+            postPartialAtomsSet.update(postAtomByproducts)
+
+    # An atom near the bonding atoms on one side may be further away on the other, and byproducts are only found
+    # in the post structure, so keep both sides of every kept pair before the edges are found
+    prePartialAtomsSet, postPartialAtomsSet = match_partial_sets(mappedIDDict, prePartialAtomsSet, postPartialAtomsSet)
+    set_atoms(len(prePartialAtomsSet))
+
+    with stage('edge_atoms'):
+        # Find initial pre-bond edge atoms
+        preEdgeAtoms = find_edge_atoms(preAtomObjectDict, prePartialAtomsSet)
+
+        # Extend edges that are too close to atoms that change type, until every edge is far enough away
+        typeChangeDistances = type_change_distances(mappedIDDict, preAtomObjectDict, postAtomObjectDict)
+        preEdgeAtoms, prePartialAtomsSet, postPartialAtomsSet = extend_edges_until_stable(preEdgeAtoms, typeChangeDistances, mappedIDDict, preAtomObjectDict,
+                                                                                          prePartialAtomsSet, postPartialAtomsSet)
+        set_atoms(len(prePartialAtomsSet))
+
+    # Shrink the partial structure to the smallest one that still meets the edge, ring opening and atom count constraints
+    if minimise:
+        with stage('minimise'):
+            coreAtoms = find_core_atoms(preAtomObjectDict, postAtomObjectDict, preBondingAtoms, postBondingAtoms, mappedIDDict)
+            coreAtoms.update(ringOpeningAtoms)
+            if preDeleteAtoms is not None:
+                coreAtoms.update(preDeleteAtoms)
+            if postAtomByproducts is not None:
+                postPreDict = {postAtom: preAtom for preAtom, postAtom in mappedIDDict.items()}
+                coreAtoms.update(postPreDict[atom] for atom in postAtomByproducts if atom in postPreDict)
+
+            startSize = len(prePartialAtomsSet)
+            prePartialAtomsSet, postPartialAtomsSet = minimise_partial_structure(preAtomObjectDict, mappedIDDict, prePartialAtomsSet, postPartialAtomsSet, coreAtoms, typeChangeDistances)
+            preEdgeAtoms = find_edge_atoms(preAtomObjectDict, prePartialAtomsSet)
+            logging.debug(f'Partial structure minimised from {startSize} to {len(prePartialAtomsSet)} atoms')
+            set_atoms(len(prePartialAtomsSet))
+
+    # Check the map and partial structure before renumbering
+    diagnostics = []
+    if validate:
+        with stage('validation', atoms=len(mappedIDList)):
+            diagnostics = validate_map(mappedIDList, preAtomObjectDict, postAtomObjectDict, preBondingAtoms, postBondingAtoms, preDeleteAtoms, postDeleteAtoms, createAtoms,
+                                       preEdgeAtoms, typeChangeDistances, prePartialAtomsSet, postPartialAtomsSet, EDGE_TYPE_DISTANCE)
+        for problem in diagnostics:
+            print(f'Warning: Map validation ({problem["check"]}): {problem["message"]}')
+
+    # Only maps from the path search that passed validation are added to the library
+    if library is not None and templateMap is None and validate and len(diagnostics) == 0:
+        with stage('template_store'):
+            library.add(reactionGraphs, mappedIDList)
 
     # Order mappedIDList by preAtomID
-    mappedIDList = natsorted(mappedIDList, key=lambda x: x[0])
+    mappedIDList = sorted(mappedIDList, key=lambda x: x[0])
+    fullMappedIDList = mappedIDList
 
     # Create empty partialMappedIDList to fill the return
     partialMappedIDList = []
@@ -119,7 +261,8 @@ def map_processor(directory, preDataFileName, postDataFileName, preMoleculeFileN
     if len(prePartialAtomsSet) != len(preAtomObjectDict):
         logging.debug(f'Creating a partial map.')
         # Build a partial map and get the renumbering dictionaries
-        mappedIDList, preRenumberdAtomDict, postRenumberedAtomDict, partialMappedIDList = create_partial_map(mappedIDList, prePartialAtomsSet, postPartialAtomsSet)
+        with stage('partial_map', atoms=len(prePartialAtomsSet)):
+            mappedIDList, preRenumberdAtomDict, postRenumberedAtomDict, partialMappedIDList = create_partial_map(mappedIDList, prePartialAtomsSet, postPartialAtomsSet)
 
         # Renumber key features for molecule creation and output
         preBondingAtoms = renumber(preBondingAtoms, preRenumberdAtomDict)
@@ -134,32 +277,85 @@ def map_processor(directory, preDataFileName, postDataFileName, preMoleculeFileN
 
         # If create atoms are included, figure out the renumberedAtomDict and then renumber
         if createAtoms is not None:
-            IDCounter = max([int(val) for val in postRenumberedAtomDict.values()]) # Initialise counter as highest ID of renumbered atoms
+            IDCounter = max(postRenumberedAtomDict.values()) # Initialise counter as highest ID of renumbered atoms
 
             # Extend renumberedAtomDict for createAtoms
             for createAtom in createAtoms:
                 IDCounter += 1
-                postRenumberedAtomDict[createAtom] = str(IDCounter)
+                postRenumberedAtomDict[createAtom] = IDCounter
 
             # Renumber createAtoms with the new renumberedAtomDict
             createAtoms = renumber(createAtoms, postRenumberedAtomDict)
 
 
-        # Rebuild molecule files with partial structure
-        with restore_dir():
-            lammps_to_molecule(directory, preDataFileName, preMoleculeFileName, preBondingAtoms, deleteAtoms=preDeleteAtoms, validIDSet=prePartialAtomsSet, renumberedAtomDict=preRenumberdAtomDict)
+        # Rebuild molecule templates with partial structure
+        with restore_dir(), stage('pre_partial_molecule'):
+            preMolecule = lammps_to_molecule(directory, preDataFileName, None, str_ids(preBondingAtoms), deleteAtoms=str_ids(preDeleteAtoms),
+                                             validIDSet=set(str_ids(prePartialAtomsSet)), renumberedAtomDict=str_id_dict(preRenumberdAtomDict),
+                                             dataSections=preReaction.dataSections)
 
-        with restore_dir():
-            lammps_to_molecule(directory, postDataFileName, postMoleculeFileName, postBondingAtoms, deleteAtoms=postDeleteAtoms, validIDSet=postPartialAtomsSet, renumberedAtomDict=postRenumberedAtomDict)
+        with restore_dir(), stage('post_partial_molecule'):
+            postMolecule = lammps_to_molecule(directory, postDataFileName, None, str_ids(postBondingAtoms), deleteAtoms=str_ids(postDeleteAtoms),
+                                              validIDSet=set(str_ids(postPartialAtomsSet)), renumberedAtomDict=str_id_dict(postRenumberedAtomDict))
 
-    # Output the map file
-    with restore_dir():
+    mapResult = MapResult(str_id_pairs(mappedIDList), str_id_pairs(fullMappedIDList), str_id_pairs(partialMappedIDList), str_ids(preBondingAtoms),
+                          str_ids(preEdgeAtoms), str_ids(preDeleteAtoms), str_ids(createAtoms), preMolecule, postMolecule, diagnostics, searchStats)
+
+    # Output the molecule and map files
+    with restore_dir(), stage('output'):
         os.chdir(directory)
-        outputData = output_map(mappedIDList, preBondingAtoms, preEdgeAtoms, preDeleteAtoms, createAtoms)
-        save_text_file('automap.data', outputData)
+        if preMoleculeFileName is not None:
+            preMolecule.save(preMoleculeFileName)
+        if postMoleculeFileName is not None:
+            postMolecule.save(postMoleculeFileName)
+        if mapFileName is not None:
+            mapResult.save(mapFileName)
+
+    # Returns the map and templates for other functions to use e.g. testing
+    return mapResult
+
+# Shared pre-bond side for map_branches worker processes, set by init_branch_worker
+WORKER_PRE_REACTION = None
 
-    # Returns mappedIDList for other functions to use e.g. testing
-    return [mappedIDList, partialMappedIDList]
+def init_branch_worker(preReaction):
+    global WORKER_PRE_REACTION
+    WORKER_PRE_REACTION = preReaction
+
+def map_branch(directory, preDataFileName, elementsByType, options, branch, preReaction=None):
+    if preReaction is None:
+        preReaction = WORKER_PRE_REACTION
+
+    with restore_dir():
+        return map_processor(directory, preDataFileName, branch['postDataFileName'], branch.get('preMoleculeFileName'), branch.get('postMoleculeFileName'),
+                             branch['preBondingAtoms'], branch['postBondingAtoms'], branch.get('deleteAtoms'), elementsByType, branch.get('createAtoms'),
+                             mapFileName=branch.get('mapFileName'), preReaction=preReaction, **options)
+
+def map_branches(directory, preDataFileName, branches, elementsByType, workers=1, **options):
+    '''
+    Map several reactions that start from the same pre-bond data file, e.g. primary and secondary amine additions.
+    The pre-bond file is read, and its atom graph and rings found, once for every branch.
+
+    Args:
+        branches: List of dictionaries, one per post-bond data file, with the map_processor arguments
+            postDataFileName, preBondingAtoms, postBondingAtoms and, optionally, deleteAtoms, createAtoms,
+            preMoleculeFileName, postMoleculeFileName and mapFileName (files are only written if named)
+        workers: Number of processes mapping branches at once
+        options: Other map_processor keyword arguments, used for every branch
+
+    Returns:
+        List of MapResult in branch order
+    '''
+    preReaction = PreReaction(directory, preDataFileName, elementsByType)
+    if workers <= 1 or len(branches) <= 1:
+        return [map_branch(directory, preDataFileName, elementsByType, options, branch, preReaction) for branch in branches]
+
+    # Imported here so serial runs don't pay for it
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Workers receive the pre-bond side once when they start, rather than with every branch
+    branchCount = len(branches)
+    with ProcessPoolExecutor(max_workers=min(workers, branchCount), initializer=init_branch_worker, initargs=(preReaction,)) as executor:
+        return list(executor.map(map_branch, [directory] * branchCount, [preDataFileName] * branchCount, [elementsByType] * branchCount, [options] * branchCount, branches))
 
 def output_map(mappedIDList, preBondingAtoms, preEdgeAtoms, preDeleteAtoms, createAtoms):
     # Bonding atoms
@@ -213,6 +409,13 @@ def output_map(mappedIDList, preBondingAtoms, preEdgeAtoms, preDeleteAtoms, crea
 
     return output
 
+def str_id_pairs(mappedIDList):
+    # Convert integer map pairs back to strings for output
+    return [[str(pair[0]), str(pair[1])] for pair in mappedIDList]
+
+def str_id_dict(renumberedAtomDict):
+    return {str(key): str(val) for key, val in renumberedAtomDict.items()}
+
 # Utility for moving to a different os path and then returning to the original directory
 @contextlib.contextmanager
 def restore_dir():
@@ -262,12 +465,17 @@ def bfs(graph, startAtom, endAtom, breakLink=False):
     # If here then no path was found
     return None
 
-def is_cyclic(atomObjectDict, bondingAtoms, reactionType):
+def is_cyclic(atomObjectDict, bondingAtoms, reactionType, cycleCache=None):
     # Create dictionary of adjacent bonds - IMPROVEMENT: Remove H from adjacent bonds since they can't go anywhere
     moleculeGraph = {atom.atomID: atom.firstNeighbourIDs for atom in atomObjectDict.values()}
     preservedAtomIDs = {} # With respect to each bonding atom
 
     for bondingAtom in bondingAtoms:
+        # Reactions sharing a structure share its rings, so a cached result for this bonding atom can be reused
+        if cycleCache is not None and bondingAtom in cycleCache:
+            preservedAtomIDs[bondingAtom] = cycleCache[bondingAtom]
+            continue
+
         # Get starting neighbours
         startNeighbours = atomObjectDict[bondingAtom].firstNeighbourIDs
 
@@ -291,15 +499,12 @@ def is_cyclic(atomObjectDict, bondingAtoms, reactionType):
             
             preservedAtomIDs[bondingAtom] = preservedIDsSet
 
-    return preservedAtomIDs
+        if cycleCache is not None:
+            cycleCache[bondingAtom] = preservedAtomIDs[bondingAtom]
 
-def find_mapped_pair(preAtom, mappedIDList):
-    # Get the post atom from the map for a given preAtom
-    for pair in mappedIDList:
-        if pair[0] == preAtom:
-            return pair[1]
+    return preservedAtomIDs
 
-def is_ring_opening(prePreservedAtomIDs, postPreservedAtomIDs, mappedIDList):
+def is_ring_opening(prePreservedAtomIDs, postPreservedAtomIDs, mappedIDDict):
     '''
     Determine if a reaction is a ring opening polymerisation.
     Return two dicts of bonding atoms keys and preserved atom sets.
@@ -313,7 +518,7 @@ def is_ring_opening(prePreservedAtomIDs, postPreservedAtomIDs, mappedIDList):
         
         # If preBondingAtom is cyclic (not None), get the post bonding atom
         if prePreservedIDSet is not None:
-            postBondingAtom = find_mapped_pair(preBondingAtom, mappedIDList)
+            postBondingAtom = mappedIDDict[preBondingAtom]
 
             # If post bonding atom is not cyclic, ring opening polymerisation is presumed
             if postPreservedAtomIDs[postBondingAtom] is None:
@@ -327,25 +532,107 @@ def is_ring_opening(prePreservedAtomIDs, postPreservedAtomIDs, mappedIDList):
                 # This is done as the postPreservedAtomsIDs for a ring opening reaction will be None
                 postCyclicAtomsSet.add(postBondingAtom)
                 for preCyclicAtom in prePreservedIDSet:
-                    postCyclicAtom = find_mapped_pair(preCyclicAtom, mappedIDList)
+                    postCyclicAtom = mappedIDDict[preCyclicAtom]
                     postCyclicAtomsSet.add(postCyclicAtom)
 
     return preCyclicAtomsSet, postCyclicAtomsSet
 
-def keep_all_neighbours(atomObjectDict, bondingAtoms, partialAtomSet):
-    for bondingAtom in bondingAtoms:
-        # Add bonding atom to the set in case it isn't there already
-        partialAtomSet.add(bondingAtom)
+def keep_all_neighbours(atomObjectDict, bondingAtoms, partialAtomSet, radius=DEFAULT_RADIUS):
+    # Depth limited BFS from all the bonding atoms at once, only visiting atoms within radius bonds
+    # Visited atoms are tracked separately, as atoms already in partialAtomSet must still be searched through
+    visited = set(bondingAtoms)
+    frontier = list(bondingAtoms)
+    for _ in range(radius):
+        nextFrontier = []
+        for atomID in frontier:
+            for neighbour in atomObjectDict[atomID].firstNeighbourIDs:
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    nextFrontier.append(neighbour)
+        frontier = nextFrontier
+
+    partialAtomSet.update(visited)
 
-        # Get atom object
-        atomObject = atomObjectDict[bondingAtom]
+    return partialAtomSet
 
-        # Add neighbourIDs to the partial set
-        partialAtomSet.update(atomObject.firstNeighbourIDs)
-        partialAtomSet.update(atomObject.secondNeighbourIDs)
-        partialAtomSet.update(atomObject.thirdNeighbourIDs)
+def match_partial_sets(mappedIDDict, prePartialAtomsSet, postPartialAtomsSet):
+    # Add the mapped partner of every atom in either partial atom set to the other set
+    postPreDict = {postAtom: preAtom for preAtom, postAtom in mappedIDDict.items()}
+    addPreAtoms = {postPreDict[atom] for atom in postPartialAtomsSet if atom in postPreDict}
+    addPostAtoms = {mappedIDDict[atom] for atom in prePartialAtomsSet}
+    prePartialAtomsSet.update(addPreAtoms)
+    postPartialAtomsSet.update(addPostAtoms)
 
-    return partialAtomSet
+    return prePartialAtomsSet, postPartialAtomsSet
+
+def find_core_atoms(preAtomObjectDict, postAtomObjectDict, preBondingAtoms, postBondingAtoms, mappedIDDict):
+    # Pre atoms that can't be edges, within CORE_RADIUS bonds of a bonding atom in the pre- or post-bond structure
+    coreAtoms = keep_all_neighbours(preAtomObjectDict, preBondingAtoms, set(), CORE_RADIUS)
+    postCoreAtoms = keep_all_neighbours(postAtomObjectDict, postBondingAtoms, set(), CORE_RADIUS)
+    postPreDict = {postAtom: preAtom for preAtom, postAtom in mappedIDDict.items()}
+    coreAtoms.update(postPreDict[atom] for atom in postCoreAtoms if atom in postPreDict)
+
+    return coreAtoms
+
+def minimise_partial_structure(preAtomObjectDict, mappedIDDict, prePartialAtomsSet, postPartialAtomsSet, coreAtoms, typeChangeDistances):
+    '''
+    Peel atoms off the outside of a partial structure until none can be removed.
+
+    An atom can be removed with its hydrogens, or a hydrogen on its own, if it is not a core atom and the structure stays
+    connected without it. Its non-hydrogen neighbours become edges, so they must not be core atoms
+    or within EDGE_TYPE_DISTANCE bonds of a type change. Each removal only needs these local checks,
+    and only the new edges are rechecked.
+    Mapped post atoms are removed with their pre atoms, keeping the atom counts equal.
+    '''
+    def in_structure_neighbours(atomID):
+        return [neighbour for neighbour in preAtomObjectDict[atomID].firstNeighbourIDs if neighbour in prePartialAtomsSet]
+
+    def stays_connected(removeAtom, innerAtoms):
+        # BFS through the structure without removeAtom, stopping as soon as every inner atom is reached
+        targets = set(innerAtoms[1:])
+        seen = {removeAtom, innerAtoms[0]}
+        frontier = [innerAtoms[0]]
+        while frontier and targets:
+            nextFrontier = []
+            for currentAtom in frontier:
+                for neighbour in in_structure_neighbours(currentAtom):
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        targets.discard(neighbour)
+                        nextFrontier.append(neighbour)
+            frontier = nextFrontier
+
+        return len(targets) == 0
+
+    worklist = deque(sorted(prePartialAtomsSet))
+    while worklist:
+        atomID = worklist.popleft()
+        if atomID not in prePartialAtomsSet or atomID in coreAtoms:
+            continue
+
+        # Hydrogens go with the atom they are bonded to, or on their own if that atom can be an edge
+        neighbours = in_structure_neighbours(atomID)
+        isHydrogen = preAtomObjectDict[atomID].element == 'H'
+        innerAtoms = [neighbour for neighbour in neighbours if isHydrogen or preAtomObjectDict[neighbour].element != 'H']
+        hydrogens = [neighbour for neighbour in neighbours if not isHydrogen and preAtomObjectDict[neighbour].element == 'H']
+
+        # The inner atoms become edges
+        if any(innerAtom in coreAtoms or innerAtom in typeChangeDistances for innerAtom in innerAtoms):
+            continue
+        if any(hydrogen in coreAtoms for hydrogen in hydrogens):
+            continue
+
+        # Atoms in rings have more than one inner atom, these must still be connected without the removed atom
+        if len(innerAtoms) > 1 and not stays_connected(atomID, innerAtoms):
+            continue
+
+        for removeAtom in [atomID] + hydrogens:
+            prePartialAtomsSet.discard(removeAtom)
+            postPartialAtomsSet.discard(mappedIDDict[removeAtom])
+
+        worklist.extend(innerAtoms)
+
+    return prePartialAtomsSet, postPartialAtomsSet
 
 def create_partial_map(mappedIDList, prePartialAtomsSet, postPartialAtomsSet):
     # Remove all the IDs that aren't in the pre and post partial atom sets
@@ -371,9 +658,9 @@ def create_partial_map(mappedIDList, prePartialAtomsSet, postPartialAtomsSet):
     renumberedMappedIDList = []
     # Simply renumber the pre and post atoms based on their position in the ID list
     for index, pair in enumerate(partialMappedIDList, start=1):
-        preRenumberedAtomDict[pair[0]] = str(index)
-        postRenumberedAtomDict[pair[1]] = str(index)
-        renumberedMappedIDList.append([str(index), str(index)])
+        preRenumberedAtomDict[pair[0]] = index
+        postRenumberedAtomDict[pair[1]] = index
+        renumberedMappedIDList.append([index, index])
 
     # Assert that the same number of atoms is in pre and post dicts. Lammps will fail otherwise
     assert len(preRenumberedAtomDict) == len(postRenumberedAtomDict), 'Different numbers of atoms have been found in the pre- and post-bond partial structures.\n Please check your input files, raise an issue on Github if the problem persists.'
@@ -413,91 +700,89 @@ def find_edge_atoms(atomObjectDict, partialAtomSet):
     else: # If no edge atoms in molecule then other functions expect None
         return None
 
-def verify_edge_atoms(preEdgeAtoms, mappedIDList, preAtomObjectDict, postAtomObjectDict):
+def type_change_distances(mappedIDDict, preAtomObjectDict, postAtomObjectDict, maxDistance=EDGE_TYPE_DISTANCE):
+    '''
+    Multi-source BFS from every pre atom whose type changes in the post structure.
+    Returns a dict of pre atomIDs to the number of bonds to the nearest type change,
+    for atoms within maxDistance bonds. Atoms further away are left out.
+    Bonding atoms that change type are sources like any other atom and paths may pass
+    through them, unlike the second and third neighbour lists which leave bonding atoms out.
+    '''
+    distances = {}
+    frontier = []
+    for preAtom, postAtom in mappedIDDict.items():
+        if postAtom in postAtomObjectDict and preAtomObjectDict[preAtom].atomType != postAtomObjectDict[postAtom].atomType:
+            distances[preAtom] = 0
+            frontier.append(preAtom)
+
+    distance = 0
+    while frontier and distance < maxDistance:
+        distance += 1
+        nextFrontier = []
+        for atomID in frontier:
+            for neighbour in preAtomObjectDict[atomID].firstNeighbourIDs:
+                if neighbour not in distances:
+                    distances[neighbour] = distance
+                    nextFrontier.append(neighbour)
+        frontier = nextFrontier
+
+    return distances
+
+def atoms_within(atomObjectDict, startAtom, depth):
+    # Depth limited BFS, returns the atomIDs within depth bonds of startAtom, excluding startAtom
+    seen = {startAtom}
+    frontier = [startAtom]
+    for _ in range(depth):
+        nextFrontier = []
+        for atomID in frontier:
+            for neighbour in atomObjectDict[atomID].firstNeighbourIDs:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    nextFrontier.append(neighbour)
+        frontier = nextFrontier
+
+    seen.remove(startAtom)
+    return seen
+
+def verify_edge_atoms(preEdgeAtoms, typeChangeDistances):
+    '''
+    Check edge atoms aren't too close to atoms that change type.
+    Returns a dict of edge atoms that need extending and the number of bonds to extend them by.
+    '''
     # If no edge atoms are given, return an empty extend list
     if preEdgeAtoms is None:
         return {}
 
-    # Convert mappedIDList to mappedIDDict
-    mappedIDDict = {pair[0]: pair[1] for pair in mappedIDList}
-
-    # Compare if pre and post atom types are the same, return True if they are not
-    def compare_atom_type(preAtom):
-        preAtomType = preAtomObjectDict[preAtom].atomType
-        pairAtom = mappedIDDict[preAtom]
-        postAtomType = postAtomObjectDict[pairAtom].atomType
-
-        if preAtomType != postAtomType:
-            return True
-        else:
-            return False
-
-    # Check for atom type changes too close to edge atoms
+    # An edge atom that changes type is extended by 3, one bonded to a type change by 2 and so on
     extendDistanceDict = {}
     for edgeAtom in preEdgeAtoms:
-        # Edge atom
-        stopSearch = compare_atom_type(edgeAtom)
-
-        if stopSearch:
-            extendDistanceDict[edgeAtom] = 3
-            continue
-
-        # First neighbours
-        preEdgeAtomObject = preAtomObjectDict[edgeAtom]
-        for firstNeighbour in preEdgeAtomObject.firstNeighbourIDs:
-            
-            stopSearch = compare_atom_type(firstNeighbour)
-            
-            if stopSearch:
-                extendDistanceDict[edgeAtom] = 2
-                break
-
-        # Second neighbours
-        if stopSearch: continue # Prevents second neighbours running and overwriting the result from first neighbours
-        for secondNeighbour in preEdgeAtomObject.secondNeighbourIDs:
-            stopSearch = compare_atom_type(secondNeighbour)
-            
-            if stopSearch:
-                extendDistanceDict[edgeAtom] = 1
-                break
+        if edgeAtom in typeChangeDistances:
+            extendDistanceDict[edgeAtom] = EDGE_TYPE_DISTANCE + 1 - typeChangeDistances[edgeAtom]
 
     return extendDistanceDict
 
-def extend_edge_atoms(extendEdgeDict, mappedIDList, preAtomObjectDict, postAtomObjectDict, prePartialAtomsSet, postPartialAtomsSet):
-    # Output extended mappedIDList, pre and post partial atom sets. Rerun find_edge_atoms to get new edges.
-    # If an edge is in this list, it at least needs to be extended by one
-    additionalPreAtoms = []
-    additionalPostAtoms = []
-
+def extend_edge_atoms(extendEdgeDict, mappedIDDict, preAtomObjectDict, prePartialAtomsSet, postPartialAtomsSet):
+    # Add the atoms within each edge's extend distance to the pre partial atom set and their mapped partners to the post set
+    # Extending through the map keeps the two sets matched. Rerun find_edge_atoms to get new edges.
     for preEdge, extendDist in extendEdgeDict.items():
-        # For pre-bond
-        additionalPreAtoms.extend(preAtomObjectDict[preEdge].firstNeighbourIDs)
+        addedAtoms = atoms_within(preAtomObjectDict, preEdge, extendDist)
+        prePartialAtomsSet.update(addedAtoms)
+        postPartialAtomsSet.update(mappedIDDict[atom] for atom in addedAtoms)
 
-        # For post-bond
-        postEdge = find_mapped_pair(preEdge, mappedIDList)
-        additionalPostAtoms.extend(postAtomObjectDict[postEdge].firstNeighbourIDs)
+    return prePartialAtomsSet, postPartialAtomsSet
 
-        # When further away neighbours are required
-        if extendDist == 2:
-            additionalPreAtoms.extend(preAtomObjectDict[preEdge].secondNeighbourIDs)
-            additionalPostAtoms.extend(postAtomObjectDict[postEdge].secondNeighbourIDs)
-        
-        if extendDist == 3:
-            additionalPreAtoms.extend(preAtomObjectDict[preEdge].thirdNeighbourIDs)
-            additionalPostAtoms.extend(postAtomObjectDict[postEdge].thirdNeighbourIDs)            
-        
-    # Expand the mappedIDList
-    for preAtom in additionalPreAtoms:
-        # Could be done using the additionalPostAtoms list but this is easier
-        postAtom = find_mapped_pair(preAtom, mappedIDList)
-        if [preAtom, postAtom] not in mappedIDList: # Prevents repeat mapped pairs being added
-            mappedIDList.append([preAtom, postAtom])
-
-    # Update the partial atom sets
-    prePartialAtomsSet.update(additionalPreAtoms)
-    postPartialAtomsSet.update(additionalPostAtoms)
-
-    return mappedIDList, prePartialAtomsSet, postPartialAtomsSet
+def extend_edges_until_stable(preEdgeAtoms, typeChangeDistances, mappedIDDict, preAtomObjectDict, prePartialAtomsSet, postPartialAtomsSet):
+    '''
+    Extend edge atoms that are too close to a type change and refind the edges, until no edge needs extending.
+    Returns the final pre edge atoms and the pre and post partial atom sets.
+    '''
+    preExtendEdgeDict = verify_edge_atoms(preEdgeAtoms, typeChangeDistances)
+    while preExtendEdgeDict:
+        prePartialAtomsSet, postPartialAtomsSet = extend_edge_atoms(preExtendEdgeDict, mappedIDDict, preAtomObjectDict, prePartialAtomsSet, postPartialAtomsSet)
+        preEdgeAtoms = find_edge_atoms(preAtomObjectDict, prePartialAtomsSet)
+        preExtendEdgeDict = verify_edge_atoms(preEdgeAtoms, typeChangeDistances)
+
+    return preEdgeAtoms, prePartialAtomsSet, postPartialAtomsSet
 
 def get_byproducts(postAtomObjectDict, postBondingAtoms):
     # Determine if there is a path from each post atom to a bonding atom in the post structure
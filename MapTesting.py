@@ -1,6 +1,6 @@
 ##############################################################################
 # Developed by: Matthew Bone
-# Last Updated: 30/07/2021
+# Last Updated: 03/08/2021
 # Updated by: Matthew Bone
 #
 # Contact Details:
@@ -16,32 +16,385 @@
 # These pairs are compared to the known correct pairs and an accuracy percentage
 # is given. Many of these tests are not designed to be chemically practical; they're
 # designed to tax different parts of the path search system to check functionality
+#
+# Each case also records its wall time, peak traced memory and the number of atoms
+# assigned by inference. Runs can be appended to a JSON history file and compared
+# against the previous run, so slow downs and new inferences are caught as well as
+# wrong maps. The same cases are run by pytest from test_MapTesting.py.
 ##############################################################################
 
+import os
+import io
+import sys
+import json
+import time
+import datetime
+import tracemalloc
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
 from MapProcessor import map_processor, restore_dir
+from Tracing import TRACER
 
 # Toggle Debug and Test Reports
 DEBUG = False
 TEST_DEBUG = False
 
-def test_report(mappedIDList, correctPostAtomIDs, reactionName, reactionForm):
-    print(f'Reaction: {reactionName}')
-    if reactionForm == 'Full':
-        mappedIDList = mappedIDList[0]
-    elif reactionForm == 'Partial':
-        mappedIDList = mappedIDList[1]
+# Fractional increase in wall time or peak memory over the previous run reported as a regression
+REGRESSION_THRESHOLD = 0.25
+# Timings below this many seconds are mostly noise, so small absolute changes are ignored
+MIN_REGRESSION_TIME = 0.05
+# Traced by compare_symmetric_atoms every time an atom is assigned by inference
+INFERENCE_RULE = 'symmetry_inference'
 
-    # Print test report
-    if TEST_DEBUG:
-        for mappedPair in mappedIDList:
-            print(f'Atom {mappedPair[0]} is mapped to atom {mappedPair[1]}')
+TEST_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases', 'Map_Tests')
 
-    
+MAP_CASES = [
+    # DGEBA-DETDA
+    {
+        'name': 'DGEBA-DETDA', 'directory': 'DGEBA_DETDA', 'form': 'Partial',
+        'preBondingAtoms': ['28', '65'], 'postBondingAtoms': ['28', '65'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'N', 'O', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['2'],
+            '3': ['3'],
+            '6': ['6'],
+            '8': ['78', '29'],
+            '9': ['9'],
+            '13': ['13'],
+            '16': ['16'],
+            '28': ['28'],
+            '29': ['78', '29'],
+            '37': ['37'],
+            '63': ['63'],
+            '64': ['64', '67'],
+            '65': ['65'],
+            '66': ['66'],
+            '67': ['64', '67'],
+            '68': ['79', '80'],
+            '69': ['69'],
+            '70': ['79', '80'],
+            '71': ['71'],
+        },
+    },
+    # Ethyl Ethanoate
+    # Del Atoms ['9', '15', '16', '16', '15', '17']
+    {
+        'name': 'Ethyl Ethanoate', 'directory': 'Ethyl_Ethanoate', 'form': 'Full',
+        'preBondingAtoms': ['11', '6'], 'postBondingAtoms': ['2', '7'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'O', 'O', 'O', 'O', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['9'],
+            '2': ['8'],
+            '3': ['12', '13', '14'],
+            '4': ['12', '13', '14'],
+            '5': ['12', '13', '14'],
+            '6': ['7'],
+            '7': ['10', '11'],
+            '8': ['10', '11'],
+            '10': ['1'],
+            '11': ['2'],
+            '12': ['3', '4', '5'],
+            '13': ['3', '4', '5'],
+            '14': ['3', '4', '5'],
+            '17': ['6'],
+            # Water molecule atoms
+            '9': ['17', '16'],
+            '16': ['17', '16'],
+            '15': ['15']
+        },
+    },
+    # Methane to Ethane
+    {
+        'name': 'Methane to Ethane', 'directory': 'Methane_Ethane', 'form': 'Full',
+        'preBondingAtoms': ['1', '6'], 'postBondingAtoms': ['1', '2'], 'deleteAtoms': ['5', '10', '9', '10'],
+        'elementsByType': ['H', 'C'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['6', '7', '8'],
+            '3': ['6', '7', '8'],
+            '4': ['6', '7', '8'],
+            '5': ['9', '10'],
+            '6': ['2'],
+            '7': ['3', '4', '5'],
+            '8': ['3', '4', '5'],
+            '9': ['3', '4', '5'],
+            '10': ['9', '10'], 
+        },
+    },
+    # Phenol O-Alkylation
+    {
+        'name': 'Phenol O-Alkylation', 'directory': 'Phenol_Alkylation', 'form': 'Partial',
+        'preBondingAtoms': ['13', '14'], 'postBondingAtoms': ['13', '14'], 'deleteAtoms': ['12', '19', '23', '24'],
+        'elementsByType': ['H', 'H', 'C', 'C', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['2'],
+            '4': ['4'],
+            '5': ['5'],
+            '6': ['6'],
+            '9': ['9'],
+            '10': ['10'],
+            '12': ['23', '24'],
+            '13': ['13'],
+            '14': ['14'],
+            '15': ['17'],
+            '16': ['12', '15', '16'], 
+            '17': ['12', '15', '16'],
+            '18': ['12', '15', '16'],
+            '19': ['23', '24'],
+            '20': ['18', '19'],
+            '21': ['18', '19'],
+            '22': ['20'],
+            '23': ['21', '22'],
+            '24': ['21', '22'],
+        },
+    },
+    # Symmetric Diol
+    {
+        'name': 'Symmetric Diol', 'directory': 'Symmetric_Diol', 'form': 'Partial',
+        'preBondingAtoms': ['1', '16'], 'postBondingAtoms': ['1', '16'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['18'],
+            '5': ['5'],
+            '7': ['7', '2', '17'],
+            '8': ['8'],
+            '9': ['9', '15'],
+            '10': ['10'],
+            '11': ['11'],
+            '12': ['12', '13'],
+            '13': ['12', '13'],
+            '14': ['14'],
+            '15': ['9', '15'],
+            '16': ['16'],
+            '17': ['7', '2', '17'],
+            '18': ['7', '2', '17'],
+            '19': ['19'],
+            '20': ['20']
+        },
+    },
+    # Generic PU
+    {
+        'name': 'Generic PU', 'directory': 'Generic_PU', 'form': 'Partial',
+        'preBondingAtoms': ['1', '36'], 'postBondingAtoms': ['1', '36'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'C', 'C', 'N', 'N', 'O', 'O', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['2'],
+            '3': ['3'],
+            '4': ['4', '8'],
+            '5': ['5'],
+            '6': ['6'],
+            '7': ['7'],
+            '8': ['8', '4'],
+            '11': ['11'],
+            '12': ['12'],
+            '30': ['30'],
+            '31': ['31'],
+            '32': ['32', '37'],
+            '33': ['33'],
+            '35': ['39'],
+            '36': ['36'],
+            '37': ['32', '37'],
+            '38': ['35', '38'],
+            '39': ['35', '38'],
+        },
+    },
+    # Edge Atom Symmetry
+    # The key test for this is that 8 and 9, and 11 and 12 are not assigned by inference, but with edge atom symmetry
+    {
+        'name': 'Edge Atom Symmetry', 'directory': 'Edge_Atom_Symmetry', 'form': 'Partial',
+        'preBondingAtoms': ['1', '32'], 'postBondingAtoms': ['1', '32'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['35'],
+            '5': ['5'],
+            '7': ['37'],
+            '8': ['8', '11'],
+            '11': ['8', '11'],
+            '13': ['13'],
+            '14': ['14'],
+            '17': ['17'],
+            '19': ['19'],
+            '23': ['23'],
+            '26': ['26'],
+            '28': ['28'],
+            '32': ['32'],
+            '33': ['33'],
+            '34': ['34'],
+            '35': ['2', '7', '36'],
+            '36': ['2', '7', '36'],
+            '37': ['2', '7', '36'],
+        },
+    },
+    # Queue Tester
+    # If this were to do the edge atoms too late, it would have to infer the symmetry atoms 5, 7 and 8
+    {
+        'name': 'Queue Tester', 'directory': 'Queue_Tester', 'form': 'Partial',
+        'preBondingAtoms': ['1', '33'], 'postBondingAtoms': ['1', '33'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['36'],
+            '5': ['5'],
+            '7': ['38'],
+            '8': ['8'],
+            '9': ['9', '21'],
+            '11': ['11'],
+            '14': ['14'],
+            '17': ['17'],
+            '18': ['18', '19'],
+            '19': ['18', '19'],
+            '20': ['20'],
+            '21': ['9', '21'],
+            '27': ['27'],
+            '28': ['28', '29'],
+            '29': ['28', '29'],
+            '33': ['33'],
+            '34': ['34'],
+            '35': ['35'],
+            '36': ['2', '7', '37'],
+            '37': ['2', '7', '37'],
+            '38': ['2', '7', '37'],
+        },
+    },
+    # Third Neighbour Symmetry
+    # Should determine atoms 8 and 11 by third neighbours, not inference
+    {
+        'name': 'Third Neighbour Symmetry', 'directory': 'Third_Neighbour_Symmetry', 'form': 'Partial',
+        'preBondingAtoms': ['1', '12'], 'postBondingAtoms': ['1', '12'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['33'],
+            '3': ['3', '4'],
+            '4': ['3', '4'],
+            '5': ['5'],
+            '7': ['35'],
+            '8': ['8'],
+            '11': ['11'],
+            '12': ['12'],
+            '13': ['13'],
+            '14': ['14'],
+            '15': ['2', '7', '34'],
+            '16': ['2', '7', '34'],
+            '17': ['2', '7', '34'],
+            '18': ['18'],
+            '23': ['23'],
+            '26': ['26'],
+            '28': ['28', '29'],
+            '29': ['28', '29'],
+        },
+    },
+    # Caprolactam
+    {
+        'name': 'Caprolactam', 'directory': 'Caprolactam', 'form': 'Partial',
+        'preBondingAtoms': ['3', '20'], 'postBondingAtoms': ['3', '20'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'N', 'N', 'N', 'N', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['2'],
+            '3': ['3'],
+            '4': ['4', '5'],
+            '5': ['4', '5'],
+            '6': ['6', '7'],
+            '7': ['6', '7'],
+            '8': ['8'],
+            '9': ['9'],
+            '10': ['10', '11'],
+            '11': ['10', '11'],
+            '12': ['12'],
+            '15': ['15'],
+            '18': ['18'],
+            '19': ['19'],
+            '20': ['20'],
+            '21': ['21'],
+            '22': ['22'],
+            '23': ['23', '24'],
+            '24': ['23', '24'],
+            '25': ['25', '26'],
+            '26': ['25', '26'],
+            '27': ['37'],
+            '28': ['28'],
+            '29': ['29', '30'],
+            '30': ['29', '30'],
+            '31': ['31'],
+            '32': ['32', '33'],
+            '33': ['32', '33'],
+            '34': ['34'],
+            '35': ['35', '36'],
+            '36': ['35', '36'],
+            '37': ['27'],
+        },
+    },
+    # Phenolic Resin
+    # This tests partial molecules with byproducts that aren't deleted
+    {
+        'name': 'Phenolic Resin', 'directory': 'Phenolic_Resin', 'form': 'Partial',
+        'preBondingAtoms': ['4', '19'], 'postBondingAtoms': ['4', '19'], 'deleteAtoms': None,
+        'elementsByType': ['H', 'H', 'C', 'C', 'O', 'O'], 'createAtoms': None,
+        'correct': {
+            '1': ['1'],
+            '2': ['2'],
+            '3': ['3'],
+            '4': ['4'],
+            '6': ['6'],
+            '7': ['7'],
+            '8': ['8'],
+            '9': ['9'],
+            '10': ['10'],
+            '13': ['29', '30'],
+            '16': ['13', '28'],
+            '17': ['13', '28'],
+            '18': ['18'],
+            '19': ['19'],
+            '20': ['20'],
+            '21': ['21'],
+            '22': ['22'],
+            '23': ['23'],
+            '24': ['24'],
+            '25': ['29', '30'],
+            '26': ['26'],
+            '27': ['27'],
+            '29': ['17'],
+            '30': ['25'],
+        },
+    },
+    # Create Atoms
+    # Tests how mapping handles atoms created in the post-bond structure.
+    {
+        'name': 'Create Atoms', 'directory': 'Create_Atoms', 'form': 'Partial',
+        'preBondingAtoms': ['1', '2'], 'postBondingAtoms': ['1', '2'], 'deleteAtoms': ['10', '25'],
+        'elementsByType': ['H', 'H', 'C', 'O', 'O'], 'createAtoms': ['22', '10', '24', '20', '21', '18', '19', '23'],
+        'correct': {
+            '1': ['1'],
+            '2': ['2'],
+            '3': ['3', '8'],
+            '4': ['4'],
+            '5': ['5', '9'],
+            '6': ['6', '15'],
+            '7': ['7'],
+            '8': ['8', '3'],
+            '9': ['9', '5'],
+            '10': ['25'],
+            '11': ['11'],
+            '14': ['14'],
+            '15': ['15', '6'],
+        },
+    },
+]
+
+def score_map(mappedIDList, correctPostAtomIDs):
+    '''Compare a map to the known correct post atoms of each pre atom'''
     totalAtoms = len(correctPostAtomIDs)
     correctAtoms = 0
     incorrectPreAtomsList = []
     for atom in mappedIDList:
-        if atom[1] in correctPostAtomIDs[atom[0]]:
+        if atom[1] in correctPostAtomIDs.get(atom[0], []):
             correctAtoms += 1
         else:
             incorrectPreAtomsList.append(atom[0])
@@ -49,378 +402,181 @@ def test_report(mappedIDList, correctPostAtomIDs, reactionName, reactionForm):
     mappedPostAtomsList = [val[1] for val in mappedIDList]
     repeatedPostIDs = [val for val in mappedPostAtomsList if mappedPostAtomsList.count(val) > 1]
 
-    print(f'Total atoms: {totalAtoms}. Correct atoms: {correctAtoms}. Accuracy: {round(correctAtoms / totalAtoms * 100, 1)}%')
-    print(f'Incorrectly assigned premolecule atomIDs: {incorrectPreAtomsList}, Count {len(incorrectPreAtomsList)}')
-    print(f'Repeated Atoms: {repeatedPostIDs}, Count: {len(repeatedPostIDs)}\n\n')
-
-# DGEBA-DETDA
-with restore_dir():
-    ddMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/DGEBA_DETDA/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', ['28', '65'], 
-        ['28', '65'], None, ['H', 'H', 'C', 'C', 'N', 'O', 'O', 'O'], None, debug=DEBUG
-    )
-
-correctDgebaDetda = {
-    '1': ['1'],
-    '2': ['2'],
-    '3': ['3'],
-    '6': ['6'],
-    '8': ['78', '29'],
-    '9': ['9'],
-    '13': ['13'],
-    '16': ['16'],
-    '28': ['28'],
-    '29': ['78', '29'],
-    '37': ['37'],
-    '63': ['63'],
-    '64': ['64', '67'],
-    '65': ['65'],
-    '66': ['66'],
-    '67': ['64', '67'],
-    '68': ['79', '80'],
-    '69': ['69'],
-    '70': ['79', '80'],
-    '71': ['71'],
-}
-test_report(ddMappedIDList, correctDgebaDetda, 'DGEBA-DETDA', 'Partial')
-
-# Ethyl Ethanoate
-with restore_dir():
-    eeMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Ethyl_Ethanoate/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', ['11', '6'],
-        ['2', '7'], None, ['H', 'H', 'C', 'C', 'O', 'O', 'O', 'O', 'O', 'O'], None, debug=DEBUG
-    ) # Del Atoms ['9', '15', '16', '16', '15', '17']
-correctEthylEthanoate = {
-    '1': ['9'],
-    '2': ['8'],
-    '3': ['12', '13', '14'],
-    '4': ['12', '13', '14'],
-    '5': ['12', '13', '14'],
-    '6': ['7'],
-    '7': ['10', '11'],
-    '8': ['10', '11'],
-    '10': ['1'],
-    '11': ['2'],
-    '12': ['3', '4', '5'],
-    '13': ['3', '4', '5'],
-    '14': ['3', '4', '5'],
-    '17': ['6'],
-    # Water molecule atoms
-    '9': ['17', '16'],
-    '16': ['17', '16'],
-    '15': ['15']
-}
-test_report(eeMappedIDList, correctEthylEthanoate, 'Ethyl Ethanoate', 'Full')
-
-# Methane to Ethane
-with restore_dir():
-    meMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Methane_Ethane/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', ['1', '6'],
-        ['1', '2'], ['5', '10', '9', '10'], ['H', 'C'], None, debug=DEBUG
-    )
-correctEthane = {
-    '1': ['1'],
-    '2': ['6', '7', '8'],
-    '3': ['6', '7', '8'],
-    '4': ['6', '7', '8'],
-    '5': ['9', '10'],
-    '6': ['2'],
-    '7': ['3', '4', '5'],
-    '8': ['3', '4', '5'],
-    '9': ['3', '4', '5'],
-    '10': ['9', '10'], 
-}
-test_report(meMappedIDList, correctEthane, 'Methane to Ethane', 'Full')
-
-# Phenol O-Alkylation
-with restore_dir():
-    paMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Phenol_Alkylation/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', ['13', '14'], 
-        ['13', '14'], ['12', '19', '23', '24'], ['H', 'H', 'C', 'C', 'O', 'O'], None, debug=DEBUG
-    )
-
-correctPhenAlkyl = {
-    '1': ['1'],
-    '2': ['2'],
-    '4': ['4'],
-    '5': ['5'],
-    '6': ['6'],
-    '9': ['9'],
-    '10': ['10'],
-    '12': ['23', '24'],
-    '13': ['13'],
-    '14': ['14'],
-    '15': ['17'],
-    '16': ['12', '15', '16'], 
-    '17': ['12', '15', '16'],
-    '18': ['12', '15', '16'],
-    '19': ['23', '24'],
-    '20': ['18', '19'],
-    '21': ['18', '19'],
-    '22': ['20'],
-    '23': ['21', '22'],
-    '24': ['21', '22'],
-}
-test_report(paMappedIDList, correctPhenAlkyl, 'Phenol O-Alkylation', 'Partial')
-
-# Symmetric Diol
-with restore_dir():
-    sdMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Symmetric_Diol/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', ['1', '16'], 
-        ['1', '16'], None, ['H', 'H', 'C', 'C', 'O', 'O'], None, debug=DEBUG
-    )
-
-correctSymmDiol = {
-    '1': ['1'],
-    '2': ['18'],
-    '5': ['5'],
-    '7': ['7', '2', '17'],
-    '8': ['8'],
-    '9': ['9', '15'],
-    '10': ['10'],
-    '11': ['11'],
-    '12': ['12', '13'],
-    '13': ['12', '13'],
-    '14': ['14'],
-    '15': ['9', '15'],
-    '16': ['16'],
-    '17': ['7', '2', '17'],
-    '18': ['7', '2', '17'],
-    '19': ['19'],
-    '20': ['20']
-}
-test_report(sdMappedIDList, correctSymmDiol, 'Symmetric Diol', 'Partial')
-
-# Generic PU
-with restore_dir():
-    gpMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Generic_PU/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', ['1', '36'], 
-        ['1', '36'], None, ['H', 'H', 'C', 'C', 'C', 'C', 'N', 'N', 'O', 'O', 'O', 'O'], None, debug=DEBUG
-    )
-
-correctGenPU = {
-    '1': ['1'],
-    '2': ['2'],
-    '3': ['3'],
-    '4': ['4', '8'],
-    '5': ['5'],
-    '6': ['6'],
-    '7': ['7'],
-    '8': ['8', '4'],
-    '11': ['11'],
-    '12': ['12'],
-    '30': ['30'],
-    '31': ['31'],
-    '32': ['32', '37'],
-    '33': ['33'],
-    '35': ['39'],
-    '36': ['36'],
-    '37': ['32', '37'],
-    '38': ['35', '38'],
-    '39': ['35', '38'],
-}
-test_report(gpMappedIDList, correctGenPU, 'Generic PU', 'Partial')
-
-# Edge Atom Symmetry
-# The key test for this is that 8 and 9, and 11 and 12 are not assigned by inference, but with edge atom symmetry
-with restore_dir():
-    eaMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Edge_Atom_Symmetry/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', ['1', '32'], 
-        ['1', '32'], None, ['H', 'H', 'C', 'C', 'O', 'O'], None, debug=DEBUG
-    )
-
-correctEdgSym = {
-    '1': ['1'],
-    '2': ['35'],
-    '5': ['5'],
-    '7': ['37'],
-    '8': ['8', '11'],
-    '11': ['8', '11'],
-    '13': ['13'],
-    '14': ['14'],
-    '17': ['17'],
-    '19': ['19'],
-    '23': ['23'],
-    '26': ['26'],
-    '28': ['28'],
-    '32': ['32'],
-    '33': ['33'],
-    '34': ['34'],
-    '35': ['2', '7', '36'],
-    '36': ['2', '7', '36'],
-    '37': ['2', '7', '36'],
-}
-test_report(eaMappedIDList, correctEdgSym, 'Edge Atom Symmetry', 'Partial')
-
-# Queue Tester
-# If this were to do the edge atoms too late, it would have to infer the symmetry atoms 5, 7 and 8
-with restore_dir():
-    qtMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Queue_Tester/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', ['1', '33'], 
-        ['1', '33'], None, ['H', 'H', 'C', 'C', 'O', 'O'], None, debug=DEBUG
-    )
-
-correctQTest = {
-    '1': ['1'],
-    '2': ['36'],
-    '5': ['5'],
-    '7': ['38'],
-    '8': ['8'],
-    '9': ['9', '21'],
-    '11': ['11'],
-    '14': ['14'],
-    '17': ['17'],
-    '18': ['18', '19'],
-    '19': ['18', '19'],
-    '20': ['20'],
-    '21': ['9', '21'],
-    '27': ['27'],
-    '28': ['28', '29'],
-    '29': ['28', '29'],
-    '33': ['33'],
-    '34': ['34'],
-    '35': ['35'],
-    '36': ['2', '7', '37'],
-    '37': ['2', '7', '37'],
-    '38': ['2', '7', '37'],
-}
-test_report(qtMappedIDList, correctQTest, 'Queue Tester', 'Partial')
-
-# Third Neighbour Symmetry
-# Should determine atoms 8 and 11 by third neighbours, not inference
-with restore_dir():
-    tnMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Third_Neighbour_Symmetry/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', 
-        ['1', '12'], ['1', '12'], None, ['H', 'H', 'C', 'C', 'O', 'O'], None, debug=DEBUG
-    )
-
-correctTNTest = {
-    '1': ['1'],
-    '2': ['33'],
-    '3': ['3', '4'],
-    '4': ['3', '4'],
-    '5': ['5'],
-    '7': ['35'],
-    '8': ['8'],
-    '11': ['11'],
-    '12': ['12'],
-    '13': ['13'],
-    '14': ['14'],
-    '15': ['2', '7', '34'],
-    '16': ['2', '7', '34'],
-    '17': ['2', '7', '34'],
-    '18': ['18'],
-    '23': ['23'],
-    '26': ['26'],
-    '28': ['28', '29'],
-    '29': ['28', '29'],
-}
-test_report(tnMappedIDList, correctTNTest, 'Third Neighbour Symmetry', 'Partial')
-
-# Caprolactam
-with restore_dir():
-    caMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Caprolactam/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', 
-        ['3', '20'], ['3', '20'], None, ['H', 'H', 'C', 'C', 'N', 'N', 'N', 'N', 'O'], None, debug=DEBUG
-    )
-
-correctCATest = {
-    '1': ['1'],
-    '2': ['2'],
-    '3': ['3'],
-    '4': ['4', '5'],
-    '5': ['4', '5'],
-    '6': ['6', '7'],
-    '7': ['6', '7'],
-    '8': ['8'],
-    '9': ['9'],
-    '10': ['10', '11'],
-    '11': ['10', '11'],
-    '12': ['12'],
-    '15': ['15'],
-    '18': ['18'],
-    '19': ['19'],
-    '20': ['20'],
-    '21': ['21'],
-    '22': ['22'],
-    '23': ['23', '24'],
-    '24': ['23', '24'],
-    '25': ['25', '26'],
-    '26': ['25', '26'],
-    '27': ['37'],
-    '28': ['28'],
-    '29': ['29', '30'],
-    '30': ['29', '30'],
-    '31': ['31'],
-    '32': ['32', '33'],
-    '33': ['32', '33'],
-    '34': ['34'],
-    '35': ['35', '36'],
-    '36': ['35', '36'],
-    '37': ['27'],
-}
-test_report(caMappedIDList, correctCATest, 'Caprolactam', 'Partial')
-
-# Phenolic Resin
-# This tests partial molecules with byproducts that aren't deleted
-with restore_dir():
-    prMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Phenolic_Resin/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', 
-        ['4', '19'], ['4', '19'], None, ['H', 'H', 'C', 'C', 'O', 'O'], None, debug=DEBUG
-    )
-
-correctPRTest = {
-    '1': ['1'],
-    '2': ['2'],
-    '3': ['3'],
-    '4': ['4'],
-    '6': ['6'],
-    '7': ['7'],
-    '8': ['8'],
-    '9': ['9'],
-    '10': ['10'],
-    '13': ['29', '30'],
-    '16': ['13', '28'],
-    '17': ['13', '28'],
-    '18': ['18'],
-    '19': ['19'],
-    '20': ['20'],
-    '21': ['21'],
-    '22': ['22'],
-    '23': ['23'],
-    '24': ['24'],
-    '25': ['29', '30'],
-    '26': ['26'],
-    '27': ['27'],
-    '29': ['17'],
-    '30': ['25'],
-}
-test_report(prMappedIDList, correctPRTest, 'Phenolic Resin', 'Partial')
-
-# Create Atoms Ethylene Glycol
-# Tests how mapping handles atoms created in the post-bond structure.
-
-with restore_dir():
-    crMappedIDList = map_processor(
-        'Test_Cases/Map_Tests/Create_Atoms/', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', 'pre-molecule.data', 'post-molecule.data', 
-        ['1', '2'], ['1', '2'], ['10', '25'], ['H', 'H', 'C', 'O', 'O'], createAtoms=['22', '10', '24', '20', '21', '18', '19', '23'],
-        debug=DEBUG
-    )
-
-correctCRTest = {
-    '1': ['1'],
-    '2': ['2'],
-    '3': ['3', '8'],
-    '4': ['4'],
-    '5': ['5', '9'],
-    '6': ['6', '15'],
-    '7': ['7'],
-    '8': ['8', '3'],
-    '9': ['9', '5'],
-    '10': ['25'],
-    '11': ['11'],
-    '14': ['14'],
-    '15': ['15', '6'],
-}
-
-test_report(crMappedIDList, correctCRTest, 'Create Atoms', 'Partial')
\ No newline at end of file
+    return {
+        'totalAtoms': totalAtoms,
+        'correctAtoms': correctAtoms,
+        'accuracy': round(correctAtoms / totalAtoms * 100, 1),
+        'incorrectAtoms': incorrectPreAtomsList,
+        'repeatedAtoms': repeatedPostIDs,
+    }
+
+@contextlib.contextmanager
+def count_inferences():
+    '''
+    Count the atoms assigned by inference inside the with block from traced events, so the count
+    doesn't depend on the wording of printed notes. Yields a dictionary whose 'inferences' is set on exit.
+    '''
+    # Only counts are needed, so a trace started here keeps no events
+    wasTraced = TRACER.enabled
+    if not wasTraced:
+        TRACER.enable(size=0)
+    startCount = TRACER.ruleCounts[INFERENCE_RULE]
+    counts = {'inferences': 0}
+    try:
+        yield counts
+    finally:
+        counts['inferences'] = TRACER.ruleCounts[INFERENCE_RULE] - startCount
+        if not wasTraced:
+            TRACER.disable()
+
+def run_case(case, writeFiles=True, debug=DEBUG):
+    '''
+    Map one case and score it. Inferences are counted from traced events and output from map_processor is captured.
+
+    Returns:
+        Dictionary of the case name and directory, accuracy scores, wallTime (s), peakMemory (bytes),
+        inferences, diagnostics count, mappedIDList and captured output
+    '''
+    saveNames = ('pre-molecule.data', 'post-molecule.data', 'automap.data') if writeFiles else (None, None, None)
+
+    # Peak memory covers this case only; time includes tracing overhead, which is the same every run
+    wasTracing = tracemalloc.is_tracing()
+    if not wasTracing:
+        tracemalloc.start()
+    output = io.StringIO()
+    startTime = time.perf_counter()
+    with restore_dir(), contextlib.redirect_stdout(output), count_inferences() as counts:
+        mapResult = map_processor(
+            os.path.join(TEST_DIRECTORY, case['directory']), 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', saveNames[0], saveNames[1],
+            case['preBondingAtoms'], case['postBondingAtoms'], case['deleteAtoms'], case['elementsByType'], case['createAtoms'], debug=debug,
+            mapFileName=saveNames[2]
+        )
+    wallTime = time.perf_counter() - startTime
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    if not wasTracing:
+        tracemalloc.stop()
+
+    if case['form'] == 'Full':
+        mappedIDList = mapResult.mappedIDList
+    elif case['form'] == 'Partial':
+        mappedIDList = mapResult.partialMappedIDList
+
+    result = {'name': case['name'], 'directory': case['directory']}
+    result.update(score_map(mappedIDList, case['correct']))
+    result.update({
+        'wallTime': round(wallTime, 4),
+        'peakMemory': peakMemory,
+        'inferences': counts['inferences'],
+        'diagnostics': len(mapResult.diagnostics),
+        'mappedIDList': mappedIDList,
+        'output': output.getvalue(),
+    })
+
+    return result
+
+def run_cases(cases, workers=1, writeFiles=True):
+    '''Run cases in order, or in a pool of worker processes as map_processor changes the working directory'''
+    if workers is None or workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run_case, cases, [writeFiles] * len(cases)))
+
+    return [run_case(case, writeFiles) for case in cases]
+
+def select_cases(caseNames=None):
+    # Cases are selected by their Test_Cases directory name
+    if not caseNames:
+        return MAP_CASES
+
+    knownCases = [case['directory'] for case in MAP_CASES]
+    for caseName in caseNames:
+        assert caseName in knownCases, f'Unknown map test case {caseName}. Possible cases: {knownCases}'
+
+    return [case for case in MAP_CASES if case['directory'] in caseNames]
+
+def print_report(result):
+    print(f'Reaction: {result["name"]}')
+
+    # Print test report
+    if TEST_DEBUG:
+        print(result['output'], end='')
+        for mappedPair in result['mappedIDList']:
+            print(f'Atom {mappedPair[0]} is mapped to atom {mappedPair[1]}')
+
+    print(f'Total atoms: {result["totalAtoms"]}. Correct atoms: {result["correctAtoms"]}. Accuracy: {result["accuracy"]}%')
+    print(f'Incorrectly assigned premolecule atomIDs: {result["incorrectAtoms"]}, Count {len(result["incorrectAtoms"])}')
+    print(f'Repeated Atoms: {result["repeatedAtoms"]}, Count: {len(result["repeatedAtoms"])}')
+    print(f'Wall time: {result["wallTime"]:.3f} s. Peak memory: {result["peakMemory"] / 1024:.0f} KiB. Inferences: {result["inferences"]}. Diagnostics: {result["diagnostics"]}\n\n')
+
+def load_history(historyFile):
+    if not os.path.exists(historyFile):
+        return []
+
+    with open(historyFile, 'r') as f:
+        return json.load(f)
+
+def append_history(historyFile, results):
+    '''Add a run to the history file, keeping only the numbers needed to compare runs'''
+    history = load_history(historyFile)
+    recordKeys = ['accuracy', 'wallTime', 'peakMemory', 'inferences', 'diagnostics']
+    history.append({
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'cases': {result['directory']: {key: result[key] for key in recordKeys} for result in results},
+    })
+    with open(historyFile, 'w') as f:
+        json.dump(history, f, indent=1)
+
+    return history
+
+def find_regressions(results, previousRun, threshold=REGRESSION_THRESHOLD):
+    '''
+    Compare results to a previous history record. Lower accuracy, more inferences or diagnostics,
+    or wall time or peak memory more than threshold above the previous run are regressions.
+
+    Returns:
+        List of regression messages, empty if there were none
+    '''
+    regressions = []
+    for result in results:
+        previous = previousRun['cases'].get(result['directory'])
+        if previous is None:
+            continue
+
+        name = result['directory']
+        if result['accuracy'] < previous['accuracy']:
+            regressions.append(f'{name}: accuracy fell from {previous["accuracy"]}% to {result["accuracy"]}%')
+        if result['inferences'] > previous['inferences']:
+            regressions.append(f'{name}: inferences rose from {previous["inferences"]} to {result["inferences"]}')
+        if result['diagnostics'] > previous['diagnostics']:
+            regressions.append(f'{name}: diagnostics rose from {previous["diagnostics"]} to {result["diagnostics"]}')
+        if result['wallTime'] > previous['wallTime'] * (1 + threshold) and result['wallTime'] - previous['wallTime'] > MIN_REGRESSION_TIME:
+            regressions.append(f'{name}: wall time rose from {previous["wallTime"]:.3f} s to {result["wallTime"]:.3f} s')
+        if result['peakMemory'] > previous['peakMemory'] * (1 + threshold):
+            regressions.append(f'{name}: peak memory rose from {previous["peakMemory"]} to {result["peakMemory"]} bytes')
+
+    return regressions
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the map test cases and report accuracy, time, memory and inferences')
+    parser.add_argument('--cases', metavar='cases', nargs='+', help='Test_Cases/Map_Tests directory names of the cases to run. Defaults to every case')
+    parser.add_argument('--workers', metavar='workers', type=int, default=1, help='Number of worker processes to run cases in. Defaults to 1')
+    parser.add_argument('--history', metavar='history_file', help='JSON file to append this run to and compare it against the previous run')
+    parser.add_argument('--threshold', metavar='threshold', type=float, default=REGRESSION_THRESHOLD, help=f'Fractional rise in wall time or peak memory reported as a regression. Defaults to {REGRESSION_THRESHOLD}')
+    parser.add_argument('--no_write', action='store_true', help='Do not write molecule and map files into the test case directories')
+    args = parser.parse_args()
+
+    results = run_cases(select_cases(args.cases), args.workers, not args.no_write)
+    for result in results:
+        print_report(result)
+
+    if args.history is not None:
+        history = load_history(args.history)
+        regressions = find_regressions(results, history[-1], args.threshold) if history else []
+        append_history(args.history, results)
+
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
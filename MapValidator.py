@@ -0,0 +1,157 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Consistency checks run on every map made by map_processor. Each check is a
+# single pass over the map, the bonds or the partial structure, so validation
+# costs about the same as building the atom objects. Problems are returned as
+# diagnostics, dictionaries with a check name, a severity, the atomIDs
+# involved and a message, so batch runs can collect and filter them.
+##############################################################################
+
+def diagnostic(check, atomIDs, message, severity='error'):
+    # IDs are stored as strings, matching MapResult
+    return {'check': check, 'severity': severity, 'atomIDs': [str(atomID) for atomID in atomIDs], 'message': message}
+
+def check_bijection(mappedIDList, preAtomObjectDict, postAtomObjectDict, createAtoms):
+    '''Every pre and post atom appears in the map exactly once, create atoms never do'''
+    diagnostics = []
+    preSeen = set()
+    postSeen = set()
+    for preAtom, postAtom in mappedIDList:
+        if preAtom in preSeen:
+            diagnostics.append(diagnostic('bijection', [preAtom], f'Pre atom {preAtom} is mapped more than once'))
+        if postAtom in postSeen:
+            diagnostics.append(diagnostic('bijection', [postAtom], f'Post atom {postAtom} is mapped more than once'))
+        preSeen.add(preAtom)
+        postSeen.add(postAtom)
+
+    unmappedPreAtoms = [atomID for atomID in preAtomObjectDict if atomID not in preSeen]
+    if unmappedPreAtoms:
+        diagnostics.append(diagnostic('bijection', unmappedPreAtoms, f'Pre atoms {unmappedPreAtoms} are missing from the map'))
+
+    unmappedPostAtoms = [atomID for atomID in postAtomObjectDict if atomID not in postSeen]
+    if unmappedPostAtoms:
+        diagnostics.append(diagnostic('bijection', unmappedPostAtoms, f'Post atoms {unmappedPostAtoms} are missing from the map'))
+
+    mappedCreateAtoms = [atomID for atomID in createAtoms if atomID in postSeen]
+    if mappedCreateAtoms:
+        diagnostics.append(diagnostic('bijection', mappedCreateAtoms, f'Create atoms {mappedCreateAtoms} should not be in the map'))
+
+    return diagnostics
+
+def reaction_centre(atomObjectDict, centreAtoms):
+    # The given atoms and their first neighbours, the only atoms whose bonds may change
+    centre = set(centreAtoms)
+    for atomID in centreAtoms:
+        if atomID in atomObjectDict:
+            centre.update(atomObjectDict[atomID].firstNeighbourIDs)
+
+    return centre
+
+def check_bonds(mappedIDDict, fromAtomObjectDict, toAtomObjectDict, fromCentre, toCentre, direction):
+    '''Bonds between atoms outside the reaction centre must still be bonds after the map is applied'''
+    diagnostics = []
+    for atomID, atomObject in fromAtomObjectDict.items():
+        if atomID in fromCentre or atomID not in mappedIDDict:
+            continue
+        mappedAtom = mappedIDDict[atomID]
+        mappedNeighbours = toAtomObjectDict[mappedAtom].firstNeighbourIDs if mappedAtom in toAtomObjectDict else []
+        for neighbour in atomObject.firstNeighbourIDs:
+            # Each bond is checked once, from its lower atomID
+            if neighbour < atomID or neighbour in fromCentre or neighbour not in mappedIDDict:
+                continue
+            mappedNeighbour = mappedIDDict[neighbour]
+            if mappedAtom in toCentre or mappedNeighbour in toCentre:
+                continue
+            if mappedNeighbour not in mappedNeighbours:
+                diagnostics.append(diagnostic('bonds', [atomID, neighbour],
+                                              f'{direction} bond {atomID}-{neighbour} is not a bond after mapping ({mappedAtom}-{mappedNeighbour})'))
+
+    return diagnostics
+
+def check_edge_atoms(preEdgeAtoms, typeChangeDistances, edgeTypeDistance):
+    '''No edge atom may be within edgeTypeDistance bonds of an atom that changes type'''
+    diagnostics = []
+    for edgeAtom in preEdgeAtoms:
+        if edgeAtom in typeChangeDistances and typeChangeDistances[edgeAtom] <= edgeTypeDistance:
+            diagnostics.append(diagnostic('edge_atoms', [edgeAtom],
+                                          f'Edge atom {edgeAtom} is {typeChangeDistances[edgeAtom]} bond(s) from an atom that changes type'))
+
+    return diagnostics
+
+def check_delete_create(mappedIDDict, preDeleteAtoms, postDeleteAtoms, createAtoms, prePartialAtomsSet, postPartialAtomsSet, postAtomObjectDict):
+    '''Delete atoms map onto each other and are kept, create atoms are only in the post structure'''
+    diagnostics = []
+    if len(preDeleteAtoms) != len(postDeleteAtoms):
+        diagnostics.append(diagnostic('delete_atoms', preDeleteAtoms + postDeleteAtoms, 'Different numbers of pre- and post-bond delete atoms'))
+
+    for preAtom, postAtom in zip(preDeleteAtoms, postDeleteAtoms):
+        if mappedIDDict.get(preAtom) != postAtom:
+            diagnostics.append(diagnostic('delete_atoms', [preAtom, postAtom], f'Delete atom {preAtom} is mapped to {mappedIDDict.get(preAtom)} not {postAtom}'))
+        if preAtom not in prePartialAtomsSet or postAtom not in postPartialAtomsSet:
+            diagnostics.append(diagnostic('delete_atoms', [preAtom, postAtom], f'Delete atoms {preAtom} and {postAtom} are not both in the partial structure'))
+
+    for createAtom in createAtoms:
+        if createAtom in postAtomObjectDict:
+            diagnostics.append(diagnostic('create_atoms', [createAtom], f'Create atom {createAtom} was treated as an existing post atom'))
+        if createAtom not in postPartialAtomsSet:
+            diagnostics.append(diagnostic('create_atoms', [createAtom], f'Create atom {createAtom} is not in the partial structure'))
+
+    return diagnostics
+
+def check_partial_structure(mappedIDDict, prePartialAtomsSet, postPartialAtomsSet, createAtoms):
+    '''Both atoms of every mapped pair are in the partial structure, or neither is'''
+    diagnostics = []
+    mappedPostAtoms = set()
+    for preAtom, postAtom in mappedIDDict.items():
+        mappedPostAtoms.add(postAtom)
+        if (preAtom in prePartialAtomsSet) != (postAtom in postPartialAtomsSet):
+            diagnostics.append(diagnostic('partial_structure', [preAtom, postAtom],
+                                          f'Only one of pre atom {preAtom} and post atom {postAtom} is in the partial structure'))
+
+    createAtoms = set(createAtoms)
+    unpairedPostAtoms = [atomID for atomID in postPartialAtomsSet if atomID not in mappedPostAtoms and atomID not in createAtoms]
+    if unpairedPostAtoms:
+        diagnostics.append(diagnostic('partial_structure', unpairedPostAtoms, f'Post atoms {unpairedPostAtoms} are in the partial structure but not the map'))
+
+    return diagnostics
+
+def validate_map(mappedIDList, preAtomObjectDict, postAtomObjectDict, preBondingAtoms, postBondingAtoms, preDeleteAtoms, postDeleteAtoms, createAtoms,
+                 preEdgeAtoms, typeChangeDistances, prePartialAtomsSet, postPartialAtomsSet, edgeTypeDistance):
+    '''
+    Check a full map, in the original integer atomIDs, and its partial structure.
+
+    Returns:
+        List of diagnostic dictionaries, empty if the map passed every check
+    '''
+    preDeleteAtoms = preDeleteAtoms or []
+    postDeleteAtoms = postDeleteAtoms or []
+    createAtoms = createAtoms or []
+    preEdgeAtoms = preEdgeAtoms or []
+
+    mappedIDDict = {preAtom: postAtom for preAtom, postAtom in mappedIDList}
+    postPreDict = {postAtom: preAtom for preAtom, postAtom in mappedIDList}
+
+    # Bonds may only change next to the bonding, delete and create atoms
+    preCentre = reaction_centre(preAtomObjectDict, preBondingAtoms + preDeleteAtoms)
+    postCentre = reaction_centre(postAtomObjectDict, postBondingAtoms + postDeleteAtoms + createAtoms)
+
+    diagnostics = check_bijection(mappedIDList, preAtomObjectDict, postAtomObjectDict, createAtoms)
+    diagnostics.extend(check_bonds(mappedIDDict, preAtomObjectDict, postAtomObjectDict, preCentre, postCentre, 'Pre-bond'))
+    diagnostics.extend(check_bonds(postPreDict, postAtomObjectDict, preAtomObjectDict, postCentre, preCentre, 'Post-bond'))
+    diagnostics.extend(check_edge_atoms(preEdgeAtoms, typeChangeDistances, edgeTypeDistance))
+    diagnostics.extend(check_delete_create(mappedIDDict, preDeleteAtoms, postDeleteAtoms, createAtoms, prePartialAtomsSet, postPartialAtomsSet, postAtomObjectDict))
+    diagnostics.extend(check_partial_structure(mappedIDDict, prePartialAtomsSet, postPartialAtomsSet, createAtoms))
+
+    return diagnostics
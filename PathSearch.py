@@ -18,12 +18,15 @@
 ##############################################################################
 
 import os
-import logging
 import sys
+from collections import deque
 
 from LammpsSearchFuncs import element_atomID_dict
 from AtomObjectBuilder import build_atom_objects, compare_symmetric_atoms
 from QueueFuncs import Queue, queue_bond_atoms, run_queue
+from StageProfiler import stage, set_atoms
+from Tracing import TRACER
+from Progress import PROGRESS
 
 def map_delete_atoms(preDeleteAtoms, postDeleteAtoms, mappedIDList):
     # If delete atoms provided, add them to the mappedIDList. No purpose to including them in the queue
@@ -32,86 +35,161 @@ def map_delete_atoms(preDeleteAtoms, postDeleteAtoms, mappedIDList):
         assert len(preDeleteAtoms) == len(postDeleteAtoms), 'Pre-bond and post-bond files have different numbers of delete atoms.'
         for index, preAtom in enumerate(preDeleteAtoms):
             mappedIDList.append([preAtom, postDeleteAtoms[index]])
-            logging.debug(f'Pre: {preAtom}, Post: {postDeleteAtoms[index]} found with user specified delete atom')
-
-def get_missing_atom_objects(missingAtomList, atomObjectDict):
-    missingAtomObjects = []
-    for atom in missingAtomList:
-        atomObject = atomObjectDict[atom]
-        missingAtomObjects.append(atomObject)
-
-    return missingAtomObjects
-
-def map_missing_atoms(missingPreAtomObjects, missingPostAtomObjects, mappedIDList, queue, allowInference):
-    missingCheckCounter = 1
-    while missingCheckCounter < 4 and len(missingPostAtomObjects) > 0:
-        mappedPreAtomIndex = []
-        for preIndex, preAtom in enumerate(missingPreAtomObjects):
-            missingPostAtomElements = [atom.element for atom in missingPostAtomObjects]
-            elementOccurence = missingPostAtomElements.count(preAtom.element)
-
-            if elementOccurence == 0:
-                print(f"Error: Couldn't find a match in post missing atom for {preAtom.atomID}. Please try again or map the atom manually.")
-
-            elif elementOccurence == 1:
-                postIndex = missingPostAtomElements.index(preAtom.element)
-                logging.debug(f'Pre: {preAtom.atomID}, Post: {missingPostAtomObjects[postIndex].atomID} found with missing atoms single element occurence')
-                match_missing(preAtom, postIndex, missingPostAtomObjects, mappedIDList, queue, preIndex, mappedPreAtomIndex)
-                
-            elif elementOccurence > 1:
-                if preAtom.element == 'H':
-                    postHydrogenIndexList = [index for index, element in enumerate(missingPostAtomElements) if element == 'H']
-                    postIndex = postHydrogenIndexList.pop()
-                    logging.debug(f'Pre: {preAtom.atomID}, Post: {missingPostAtomObjects[postIndex].atomID} found with missing atoms hydrogen symmetry inference')
-                    match_missing(preAtom, postIndex, missingPostAtomObjects, mappedIDList, queue, preIndex, mappedPreAtomIndex)
-                else:
-                    potentialPostAtomObjects = [atomObject for atomObject in missingPostAtomObjects if atomObject.element == preAtom.element]
-                    postIndex = compare_symmetric_atoms(potentialPostAtomObjects, preAtom, 'index', allowInference=allowInference)
-                    if postIndex is not None:
-                        match_missing(preAtom, postIndex, potentialPostAtomObjects, mappedIDList, queue, preIndex, mappedPreAtomIndex)
-                        logging.debug(f'The above atomID pair was found with missing atoms symmetry comparison')
-
-        # Refresh missingPreAtomObjects so that it doesn't print needless error messages on subsequent loops
-        for index in sorted(mappedPreAtomIndex, reverse=True):
-            del missingPreAtomObjects[index]        
-        
-        missingCheckCounter += 1
-
-def match_missing(preAtom, postAtomMissingIndex, missingPostAtomObjects, mapList, queue, preIndex, mappedPreAtomIndex):
-    # Get post atom
-    postAtom = missingPostAtomObjects[postAtomMissingIndex]
-
-    mapList.append([preAtom.atomID, postAtom.atomID])
-    
-    if preAtom.element != 'H':
-        queue.add([[preAtom, postAtom]]) # This circumvents add_to_queue()
-
-    missingPostAtomObjects.pop(postAtomMissingIndex)
-    mappedPreAtomIndex.append(preIndex)
-
-def update_missing_list(missingAtomList, mappedIDList, mapIndex):
-    mappedAtoms = [pair[mapIndex] for pair in mappedIDList]
-    # Update missingAtomList to remove atoms that have been matched
-    newMissingAtomList = [atom for atom in missingAtomList if atom not in mappedAtoms]
-
-    return newMissingAtomList
-
-def map_from_path(directory, preFileName, postFileName, elementsByType, debug, preBondingAtoms, preDeleteAtoms, postBondingAtoms, postDeleteAtoms, createAtoms):
-    # Set log level
-    if debug:
-        logging.basicConfig(level='DEBUG')
-    else:
-        logging.basicConfig(level='INFO')
+            if TRACER.enabled:
+                TRACER.record('delete_atom', preAtom, postDeleteAtoms[index])
+
+def build_post_buckets(missingPostAtomList, postAtomObjectDict, mappedPostAtoms):
+    # Unmatched post atoms by element. Atoms reported missing by the queue come first, then the rest in file order
+    postBuckets = {}
+    for atomID in missingPostAtomList + list(postAtomObjectDict.keys()):
+        if atomID not in mappedPostAtoms:
+            postBuckets.setdefault(postAtomObjectDict[atomID].element, {})[atomID] = None
+
+    return postBuckets
+
+def resolve_missing_atoms(queue, mappedIDList, preAtomObjectDict, postAtomObjectDict, missingPreAtomList, missingPostAtomList, elementDictList, searchStats=None):
+    """Map the pre atoms that the queue could not, using a worklist.
+
+    Unmatched post atoms are kept in per-element buckets. A missing pre atom can only be
+    matched against post atoms of its own element, so it is only rechecked when that bucket
+    changes. Each new match reruns the queue from the matched pair, and any newly mapped
+    atoms push the pending pre atoms of the same elements back onto the worklist. Symmetry
+    inference is only used when the worklist drains with pre atoms still pending, one atom
+    at a time, so every other atom gets a chance to be found without it.
+
+    If searchStats is a dictionary, the number of atoms the queue missed ('missingAtoms')
+    and of times the worklist drained and inference was allowed ('rounds') are added to it.
+
+    Returns:
+        List of pre atomIDs that could not be mapped
+    """
+    mappedPreAtoms = {pair[0] for pair in mappedIDList}
+    mappedPostAtoms = {pair[1] for pair in mappedIDList}
+    postBuckets = build_post_buckets(missingPostAtomList, postAtomObjectDict, mappedPostAtoms)
+
+    # Pending pre atoms by element, in the order they were found missing
+    pendingPreAtoms = {}
+    worklist = deque()
+    queuedAtoms = set()
+
+    def push(atomID):
+        if atomID not in queuedAtoms:
+            queuedAtoms.add(atomID)
+            worklist.append(atomID)
+
+    def add_pending(missingPreAtoms):
+        for atomID in missingPreAtoms:
+            if atomID not in mappedPreAtoms:
+                pendingPreAtoms.setdefault(preAtomObjectDict[atomID].element, {})[atomID] = None
+                push(atomID)
+
+    def absorb_new_pairs(newPairs):
+        # Record new pairs and push pending atoms whose candidate bucket changed
+        changedElements = set()
+        for preAtom, postAtom in newPairs:
+            mappedPreAtoms.add(preAtom)
+            mappedPostAtoms.add(postAtom)
+            preElement = preAtomObjectDict[preAtom].element if preAtom in preAtomObjectDict else None
+            pendingPreAtoms.get(preElement, {}).pop(preAtom, None)
+            if postAtom in postAtomObjectDict:
+                postElement = postAtomObjectDict[postAtom].element
+                if postBuckets.get(postElement, {}).pop(postAtom, 0) is None:
+                    changedElements.add(postElement)
+
+        for element in changedElements:
+            for atomID in pendingPreAtoms.get(element, {}):
+                push(atomID)
+
+    add_pending(missingPreAtomList)
+    if searchStats is not None:
+        searchStats['missingAtoms'] = searchStats.get('missingAtoms', 0) + len(worklist)
+        searchStats.setdefault('rounds', 0)
 
+    inference = False
+    roundNumber = 0
+    while True:
+        progress = False
+        roundNumber += 1
+        if PROGRESS.enabled:
+            PROGRESS.emit('missing_round', round=roundNumber, missing=sum(len(elementAtoms) for elementAtoms in pendingPreAtoms.values()))
+        # Each pass through the worklist is a round, rounds after the first allow one inference
+        with stage('round'):
+            while worklist:
+                preAtomID = worklist.popleft()
+                queuedAtoms.discard(preAtomID)
+                if preAtomID in mappedPreAtoms:
+                    continue
+
+                preAtom = preAtomObjectDict[preAtomID]
+                candidates = list(postBuckets.get(preAtom.element, {}))
+
+                postAtomID = None
+                if len(candidates) == 1:
+                    postAtomID = candidates[0]
+                    if TRACER.enabled:
+                        TRACER.record('missing_single_element', preAtomID, postAtomID)
+                elif len(candidates) > 1:
+                    if preAtom.element == 'H':
+                        postAtomID = candidates[-1]
+                        if TRACER.enabled:
+                            TRACER.record('missing_hydrogen', preAtomID, postAtomID)
+                    else:
+                        candidateObjects = [postAtomObjectDict[atomID] for atomID in candidates]
+                        postAtomID = compare_symmetric_atoms(candidateObjects, preAtom, 'atomID', allowInference=inference)
+                        if postAtomID is not None and TRACER.enabled:
+                            TRACER.record('missing_symmetry', preAtomID, postAtomID)
+
+                # No candidates or no unique candidate, wait until this element's bucket changes
+                if postAtomID is None:
+                    continue
+
+                progress = True
+                inference = False
+                mappedIDList.append([preAtomID, postAtomID])
+                absorb_new_pairs([[preAtomID, postAtomID]])
+                if preAtom.element != 'H':
+                    queue.add([[preAtom, postAtomObjectDict[postAtomID]]]) # This circumvents add_to_queue()
+
+                # Extend the map from the new pair
+                mapLength = len(mappedIDList)
+                newMissingPreAtoms = []
+                with stage('run_queue'):
+                    run_queue(queue, mappedIDList, preAtomObjectDict, postAtomObjectDict, newMissingPreAtoms, [], elementDictList)
+                absorb_new_pairs(mappedIDList[mapLength:])
+                add_pending(newMissingPreAtoms)
+                if PROGRESS.enabled:
+                    PROGRESS.emit('atoms_mapped', mapped=len(mappedIDList), total=len(preAtomObjectDict))
+
+        remainingPreAtoms = [atomID for elementAtoms in pendingPreAtoms.values() for atomID in elementAtoms]
+        # Finished, or stuck even with inference allowed
+        if len(remainingPreAtoms) == 0 or (inference and not progress):
+            return remainingPreAtoms
+
+        # The worklist drained without mapping everything, so allow a single inference
+        inference = True
+        if searchStats is not None:
+            searchStats['rounds'] += 1
+        for atomID in remainingPreAtoms:
+            push(atomID)
+
+def map_from_path(directory, preFileName, postFileName, elementsByType, preBondingAtoms, preDeleteAtoms, postBondingAtoms, postDeleteAtoms, createAtoms, searchStats=None,
+                  preElementDict=None, preAtomGraph=None):
+    '''
+    Map pre- to post-bond atomIDs. IDs are given and returned as integers. searchStats is passed to resolve_missing_atoms.
+    preElementDict and preAtomGraph (from read_atom_graph) can be given to skip parsing the pre-bond file.
+    '''
     # Build atomID to element dict
     os.chdir(directory)
-    preElementDict = element_atomID_dict(preFileName, elementsByType)
+    if preElementDict is None:
+        preElementDict = element_atomID_dict(preFileName, elementsByType)
     postElementDict = element_atomID_dict(postFileName, elementsByType)
     elementDictList = [preElementDict, postElementDict]
 
     # Generate atom class objects list
-    preAtomObjectDict = build_atom_objects(preFileName, preElementDict, preBondingAtoms)
-    postAtomObjectDict = build_atom_objects(postFileName, postElementDict, postBondingAtoms, createAtoms=createAtoms)
+    with stage('atom_objects'):
+        preAtomObjectDict = build_atom_objects(preFileName, preElementDict, preBondingAtoms, atomGraph=preAtomGraph)
+        postAtomObjectDict = build_atom_objects(postFileName, postElementDict, postBondingAtoms, createAtoms=createAtoms)
+        set_atoms(len(preAtomObjectDict))
 
     # Assert the same number of atoms are in pre and post - maps have the same number of atoms in unless create atoms are included
     if createAtoms is None:
@@ -132,53 +210,17 @@ def map_from_path(directory, preFileName, postFileName, elementsByType, debug, p
     map_delete_atoms(preDeleteAtoms, postDeleteAtoms, mappedIDList)
 
     # Search through queue creating new maps based on all elements in a given path
-    run_queue(queue, mappedIDList, preAtomObjectDict, postAtomObjectDict, missingPreAtomList, missingPostAtomList, elementDictList)
-
-    # Update missingPreAtoms to check if the missing atom search loop is needed
-    missingPreAtomList = update_missing_list(missingPreAtomList, mappedIDList, 0)
-
-    # If missing pre atoms are present, map missing atoms and rerun the queue until success or timeout
-    timeoutCounter = 1
-    # Disable inference for the first search
-    inference = False
-    while len(missingPreAtomList) > 0 and timeoutCounter < 11:
-        # Update missing atom lists
-        missingPreAtomList = update_missing_list(missingPreAtomList, mappedIDList, 0)
-        missingPostAtomList = update_missing_list(missingPostAtomList, mappedIDList, 1)
-
-        # Get pre atom objects and record length of missing
-        missingPreAtomObjects = get_missing_atom_objects(missingPreAtomList, preAtomObjectDict)
-        missingPreAtomCount = len(missingPostAtomList)
-
-        # Add any post atoms that aren't in the map or already in the missing atoms
-        mappedPostAtoms = [pair[1] for pair in mappedIDList]
-        totalPostAtomList = list(postAtomObjectDict.keys())
-        unfoundMissingPostAtoms = [atomID for atomID in totalPostAtomList if atomID not in mappedPostAtoms and atomID not in missingPostAtomList]
-        missingPostAtomList.extend(unfoundMissingPostAtoms)
-
-        # Get post atom objects
-        missingPostAtomObjects = get_missing_atom_objects(missingPostAtomList, postAtomObjectDict)
-
-        map_missing_atoms(missingPreAtomObjects, missingPostAtomObjects, mappedIDList, queue, inference)
-
-        # Refresh missingAtomLists
-        missingPreAtomList = update_missing_list(missingPreAtomList, mappedIDList, 0)
-        missingPostAtomList = update_missing_list(missingPostAtomList, mappedIDList, 1)
-
-        # Rerun the queue based on atom pairs added to queue from missingAtoms
+    with stage('run_queue', atoms=len(preAtomObjectDict)):
         run_queue(queue, mappedIDList, preAtomObjectDict, postAtomObjectDict, missingPreAtomList, missingPostAtomList, elementDictList)
-        logging.debug(f'missingPreAtoms after loop {timeoutCounter}: {missingPreAtomList}') 
-
-        # Enable inference if no new missing atoms were solved this loop
-        if missingPreAtomCount == len(missingPreAtomList):
-            inference = True
-        else: # Disable inference if missing atoms were solved as other atoms may now be found without inference
-            inference = False
 
-        timeoutCounter += 1
+    # Map atoms the queue couldn't, rerunning the queue from every new pair until the worklist drains
+    with stage('missing_atoms', atoms=len(missingPreAtomList)):
+        missingPreAtomList = resolve_missing_atoms(queue, mappedIDList, preAtomObjectDict, postAtomObjectDict, missingPreAtomList, missingPostAtomList, elementDictList, searchStats)
 
     if len(missingPreAtomList) > 0:
-        print('Error: Missing Atom Search timed out. Atoms will be missing from the map. Please raise an issue on GitHub if the problem persists.')
-        sys.exit()
+        for atomID in missingPreAtomList:
+            print(f"Error: Couldn't find a match in post missing atom for {atomID}. Please try again or map the atom manually.")
+        print('Error: Missing Atom Search could not map every atom. Atoms will be missing from the map. Please raise an issue on GitHub if the problem persists.')
+        sys.exit(1) # Non-zero so branch workers, the server and scripts see the map failed
 
     return mappedIDList
@@ -0,0 +1,107 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Progress events for long running tools. Callbacks added to PROGRESS are
+# called with a dictionary for each event, holding the event name, a time.time()
+# timestamp and the event's values:
+#   rows_parsed   - file, section, rows (rows read so far for that section)
+#   atoms_mapped  - mapped, total (pre atoms mapped by run_queue)
+#   missing_round - round, missing (pre atoms still missing at the round start)
+#   bytes_written - file, bytes (uncompressed size of the saved file)
+# An exception raised by a callback stops the tool, so a caller can abort a job
+# that has stalled. Events are only built while a callback is registered.
+# ProgressBar is the callback used by the command line --progress option.
+##############################################################################
+
+import sys
+import time
+import contextlib
+
+class ProgressReporter:
+    def __init__(self):
+        self.enabled = False
+        self.callbacks = []
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+        self.enabled = True
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+        self.enabled = len(self.callbacks) > 0
+
+    @contextlib.contextmanager
+    def listen(self, callback):
+        '''Call callback with every event emitted inside the with block'''
+        self.add_callback(callback)
+        try:
+            yield callback
+        finally:
+            self.remove_callback(callback)
+
+    def emit(self, event, **values):
+        values['event'] = event
+        values['time'] = time.time()
+        for callback in list(self.callbacks):
+            callback(values)
+
+class ProgressBar:
+    '''Rewrites a single status line on stream, at most once every interval seconds'''
+    def __init__(self, stream=sys.stderr, interval=0.1, width=30):
+        self.stream = stream
+        self.interval = interval
+        self.width = width
+        self.lastWrite = 0.0
+        self.lineLength = 0
+        self.skippedEvent = None
+
+    def __call__(self, event):
+        # Missing rounds are rare and worth showing straight away
+        if event['event'] != 'missing_round' and event['time'] - self.lastWrite < self.interval:
+            self.skippedEvent = event
+            return
+        self.lastWrite = event['time']
+        self.skippedEvent = None
+        self.write(self.format_event(event))
+
+    def format_event(self, event):
+        if event['event'] == 'rows_parsed':
+            return f"Parsing {event['file']}: {event['rows']} {event['section']} rows"
+        elif event['event'] == 'atoms_mapped':
+            filled = min(self.width * event['mapped'] // max(event['total'], 1), self.width)
+            return f"Mapping [{'#' * filled}{'.' * (self.width - filled)}] {event['mapped']}/{event['total']} atoms"
+        elif event['event'] == 'missing_round':
+            return f"Missing atoms round {event['round']}: {event['missing']} atoms left"
+        elif event['event'] == 'bytes_written':
+            return f"Wrote {event['file']} ({event['bytes']} bytes)"
+        return event['event']
+
+    def write(self, line):
+        # Pad with spaces to cover any longer previous line
+        self.stream.write('\r' + line.ljust(self.lineLength))
+        self.stream.flush()
+        self.lineLength = len(line)
+
+    def close(self):
+        # Show the final state, then move off the status line so later output starts on a new line
+        if self.skippedEvent is not None:
+            self.write(self.format_event(self.skippedEvent))
+            self.skippedEvent = None
+        if self.lineLength > 0:
+            self.stream.write('\n')
+            self.stream.flush()
+            self.lineLength = 0
+
+# Shared by every tool in this process
+PROGRESS = ProgressReporter()
@@ -16,9 +16,11 @@
 # path search used in mapping.
 ##############################################################################
 
-import logging
 from collections import deque
 
+from Tracing import TRACER
+from Progress import PROGRESS
+
 # Classes and functions for search
 class Queue:
     def __init__(self):
@@ -50,7 +52,8 @@ def queue_bond_atoms(preAtomObjectDict, preBondingAtoms, postAtomObjectDict, pos
         postAtomObject = postAtomObjectDict[postBondingAtoms[index]]
         queue.add([[preAtomObject, postAtomObject]])
         mappedIDList.append([preBondAtom, postBondingAtoms[index]])
-        logging.debug(f'Pre: {preBondAtom}, Post: {postBondingAtoms[index]} found with user specified bond atom')
+        if TRACER.enabled:
+            TRACER.record('bonding_atom', preBondAtom, postBondingAtoms[index])
 
 def run_queue(queue, mappedIDList, preAtomObjectDict, postAtomObjectDict, missingPreAtomList, missingPostAtomList, elementDictList):
     while not queue.empty():
@@ -68,4 +71,6 @@ def run_queue(queue, mappedIDList, preAtomObjectDict, postAtomObjectDict, missin
         missingPostAtomList.extend(missingPostAtoms)
 
         # Add new pairs to mapped ID list
-        mappedIDList.extend(newMap)
\ No newline at end of file
+        mappedIDList.extend(newMap)
+        if PROGRESS.enabled and newMap:
+            PROGRESS.emit('atoms_mapped', mapped=len(mappedIDList), total=len(preAtomObjectDict))
\ No newline at end of file
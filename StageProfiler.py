@@ -0,0 +1,168 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Optional timers for the stages of clean, molecule and map. Tools wrap each
+# stage in 'with stage(name):'; while profiling is off this only checks a flag.
+# Stages nest, so each one is reported under the path of the stages it ran in,
+# e.g. 'map/map_from_path/run_queue', and its time includes those inside it.
+# The report is a JSON dictionary of stage paths with their total time, number
+# of calls and the largest atom count recorded for them.
+# With memory tracking on, each stage also reports the peak Python memory it
+# allocated above what was in use when it started (from tracemalloc) and the
+# peak resident set size (RSS) of the process while it ran, sampled by a
+# background thread. tracemalloc slows the tools down several times, so memory
+# is only tracked when asked for.
+##############################################################################
+
+import json
+import mmap
+import time
+import threading
+import contextlib
+import tracemalloc
+
+# Seconds between RSS samples
+RSS_INTERVAL = 0.01
+
+def read_rss():
+    '''Resident set size of this process in bytes, or None where /proc is not available'''
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StageProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.stages = {}
+        self.path = []
+        self.peaks = []
+        self.rssPeak = None
+        self.sampler = None
+        self.startedTracing = False
+
+    def enable(self, memory=False):
+        # Start a new report
+        self.disable()
+        self.enabled = True
+        self.memory = memory
+        self.stages = {}
+        self.path = []
+        self.peaks = []
+        if memory:
+            self.startedTracing = not tracemalloc.is_tracing()
+            if self.startedTracing:
+                tracemalloc.start()
+            self.rssPeak = read_rss()
+            self.sampler = threading.Thread(target=self.sample_rss, daemon=True)
+            self.sampler.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.sampler is not None:
+            sampler, self.sampler = self.sampler, None
+            sampler.join()
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+
+    def sample_rss(self):
+        sampler = threading.current_thread()
+        while self.sampler is sampler:
+            rss = read_rss()
+            if rss is None:
+                return
+            self.rssPeak = max_rss(self.rssPeak, rss)
+            time.sleep(RSS_INTERVAL)
+
+    @contextlib.contextmanager
+    def stage(self, name, atoms=None):
+        if not self.enabled:
+            yield
+            return
+
+        self.path.append(name)
+        record = self.stages.setdefault('/'.join(self.path), {'calls': 0, 'time': 0.0, 'atoms': None, 'peakMemory': 0, 'peakRss': None})
+        self.set_atoms(atoms)
+        if self.memory:
+            self.start_memory()
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['time'] += time.perf_counter() - startTime
+            record['calls'] += 1
+            if self.memory:
+                self.stop_memory(record)
+            self.path.pop()
+
+    def start_memory(self):
+        # tracemalloc and the RSS sampler keep one running peak each, so the enclosing stage's peaks
+        # are stored before they are reset for this stage and merged back in when it finishes
+        currentMemory, peakMemory = tracemalloc.get_traced_memory()
+        if self.peaks:
+            self.peaks[-1]['memory'] = max(self.peaks[-1]['memory'], peakMemory)
+            self.peaks[-1]['rss'] = max_rss(self.peaks[-1]['rss'], self.rssPeak)
+        tracemalloc.reset_peak()
+        self.rssPeak = read_rss()
+        self.peaks.append({'start': currentMemory, 'memory': currentMemory, 'rss': self.rssPeak})
+
+    def stop_memory(self, record):
+        peaks = self.peaks.pop()
+        peakMemory = max(peaks['memory'], tracemalloc.get_traced_memory()[1])
+        peakRss = max_rss(peaks['rss'], max_rss(self.rssPeak, read_rss()))
+        record['peakMemory'] = max(record['peakMemory'], peakMemory - peaks['start'])
+        record['peakRss'] = max_rss(record['peakRss'], peakRss)
+        if self.peaks:
+            self.peaks[-1]['memory'] = max(self.peaks[-1]['memory'], peakMemory)
+            self.peaks[-1]['rss'] = max_rss(self.peaks[-1]['rss'], peakRss)
+
+    def set_atoms(self, atoms):
+        '''Record the number of atoms handled by the current stage, for stages that only know it part way through'''
+        if not self.enabled or atoms is None or not self.path:
+            return
+
+        record = self.stages['/'.join(self.path)]
+        record['atoms'] = atoms if record['atoms'] is None else max(record['atoms'], atoms)
+
+    def report(self):
+        stages = {}
+        for path, record in self.stages.items():
+            stages[path] = {'time': round(record['time'], 6), 'calls': record['calls'], 'atoms': record['atoms']}
+            if self.memory:
+                stages[path]['peakMemory'] = record['peakMemory']
+                stages[path]['peakRss'] = record['peakRss']
+
+        return {'stages': stages}
+
+    def save(self, fileName):
+        with open(fileName, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+def max_rss(rss1, rss2):
+    # RSS is None where it cannot be read
+    if rss1 is None or rss2 is None:
+        return rss1 if rss2 is None else rss2
+    return max(rss1, rss2)
+
+# Shared by every tool in this process
+PROFILER = StageProfiler()
+
+def stage(name, atoms=None):
+    return PROFILER.stage(name, atoms)
+
+def set_atoms(atoms):
+    PROFILER.set_atoms(atoms)
@@ -0,0 +1,258 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Random, highly symmetric reactions for stressing the symmetry handling of the
+# path search. Two identical hydrocarbons (a chain, a ring or a dendrimer) each
+# lose a hydrogen from a random carbon, the carbons bond and the hydrogens leave
+# as H2, as in the Methane_Ethane case. Atom IDs are shuffled independently in
+# the pre- and post-bond structures so file order gives nothing away.
+#
+# Symmetric atoms can be mapped either way, so accuracy is measured as the
+# fraction of pre-bond bonds, away from the reaction, that are still bonds
+# after mapping. Any symmetry-equivalent map scores 100%. The fraction of atoms
+# matching the generated map is reported too, as a measure of how often the
+# mapper picked a different but equivalent atom.
+##############################################################################
+
+import io
+import time
+import random
+import contextlib
+
+from LammpsTreatmentFuncs import clean_data
+from MapProcessor import map_processor, restore_dir
+from MapTesting import count_inferences
+
+TOPOLOGIES = ['chain', 'ring', 'dendrimer']
+ELEMENTS_BY_TYPE = ['H', 'C']
+MASSES = ['1 1.008', '2 12.011']
+# Bond types by the sorted element pair
+BOND_TYPES = {('C', 'H'): 1, ('C', 'C'): 2, ('H', 'H'): 3}
+
+def carbon_skeleton(topology, size):
+    '''
+    Carbon-carbon bonds of one molecule, with carbons numbered from 0.
+    size is the number of carbons of a chain or ring, or the number of generations of a
+    dendrimer, where the core carbon has 4 branches and every other carbon 3.
+    '''
+    if topology == 'chain':
+        assert size >= 1, 'A chain needs at least 1 carbon'
+        return size, [(index, index + 1) for index in range(size - 1)]
+
+    if topology == 'ring':
+        assert size >= 3, 'A ring needs at least 3 carbons'
+        return size, [(index, (index + 1) % size) for index in range(size)]
+
+    if topology == 'dendrimer':
+        assert size >= 1, 'A dendrimer needs at least 1 generation'
+        bonds = []
+        generation = [0]
+        carbonCount = 1
+        for generationIndex in range(1, size):
+            branches = 4 if generationIndex == 1 else 3
+            nextGeneration = []
+            for parent in generation:
+                for _ in range(branches):
+                    bonds.append((parent, carbonCount))
+                    nextGeneration.append(carbonCount)
+                    carbonCount += 1
+            generation = nextGeneration
+        return carbonCount, bonds
+
+    raise ValueError(f'Unknown topology {topology}. Possible topologies: {TOPOLOGIES}')
+
+class SymmetricReaction:
+    '''
+    A generated reaction in canonical atom numbering (from 0), and its shuffled pre- and post-bond atomIDs.
+    preIDs and postIDs give the file atomID of each canonical atom, so the generated map pairs them up.
+    '''
+    def __init__(self, topology, size, seed=None):
+        rng = random.Random(seed)
+        self.topology = topology
+        self.size = size
+
+        # Two copies of the molecule, carbons then hydrogens of each
+        carbonCount, carbonBonds = carbon_skeleton(topology, size)
+        self.elements = []
+        self.molecules = []
+        self.preBonds = []
+        carbonsWithHydrogens = []
+        for molecule in (1, 2):
+            carbonStart = len(self.elements)
+            self.elements.extend(['C'] * carbonCount)
+            self.molecules.extend([molecule] * carbonCount)
+            self.preBonds.extend((carbon1 + carbonStart, carbon2 + carbonStart) for carbon1, carbon2 in carbonBonds)
+
+            # Fill every carbon up to 4 bonds with hydrogens
+            carbonBondCounts = [0] * carbonCount
+            for carbon1, carbon2 in carbonBonds:
+                carbonBondCounts[carbon1] += 1
+                carbonBondCounts[carbon2] += 1
+            hydrogens = {}
+            for carbon, bondCount in enumerate(carbonBondCounts):
+                for _ in range(4 - bondCount):
+                    hydrogens.setdefault(carbon + carbonStart, []).append(len(self.elements))
+                    self.preBonds.append((carbon + carbonStart, len(self.elements)))
+                    self.elements.append('H')
+                    self.molecules.append(molecule)
+            carbonsWithHydrogens.append(hydrogens)
+
+        # Each molecule loses a hydrogen from a random carbon, the carbons bond and the hydrogens form H2
+        self.bondingAtoms = []
+        self.deleteAtoms = []
+        for hydrogens in carbonsWithHydrogens:
+            carbon = rng.choice(sorted(hydrogens))
+            self.bondingAtoms.append(carbon)
+            self.deleteAtoms.append(rng.choice(hydrogens[carbon]))
+
+        brokenBonds = {(carbon, hydrogen) for carbon, hydrogen in zip(self.bondingAtoms, self.deleteAtoms)}
+        self.postBonds = [bond for bond in self.preBonds if bond not in brokenBonds] + [tuple(self.bondingAtoms), tuple(self.deleteAtoms)]
+
+        self.preIDs = list(range(1, len(self.elements) + 1))
+        self.postIDs = list(range(1, len(self.elements) + 1))
+        rng.shuffle(self.preIDs)
+        rng.shuffle(self.postIDs)
+
+    def data_lines(self, bonds, atomIDs, molecules):
+        '''Tidied lines of a data file with the given bonds, angles and dihedrals made from them'''
+        neighbours = [[] for _ in self.elements]
+        for atom1, atom2 in bonds:
+            neighbours[atom1].append(atom2)
+            neighbours[atom2].append(atom1)
+        angles = [(atom1, centre, atom2) for centre in range(len(self.elements)) for index, atom1 in enumerate(neighbours[centre]) for atom2 in neighbours[centre][index + 1:]]
+        dihedrals = [(atom1, atom2, atom3, atom4) for atom2, atom3 in bonds for atom1 in neighbours[atom2] if atom1 != atom3 for atom4 in neighbours[atom3] if atom4 not in (atom2, atom1)]
+
+        lines = ['Symmetric reaction', f'{len(self.elements)} atoms', f'{len(bonds)} bonds', f'{len(angles)} angles', f'{len(dihedrals)} dihedrals', '0 impropers',
+                 '2 atom types', f'{len(BOND_TYPES)} bond types', '1 angle types', '1 dihedral types', '1 improper types',
+                 f'0.0 {len(self.elements)}.0 xlo xhi', '0.0 10.0 ylo yhi', '0.0 10.0 zlo zhi', 'Masses'] + MASSES
+
+        # Atoms in atomID order, spread along x
+        lines.append('Atoms')
+        atomOrder = sorted(range(len(self.elements)), key=lambda atom: atomIDs[atom])
+        lines.extend(f'{atomIDs[atom]} {molecules[atom]} {ELEMENTS_BY_TYPE.index(self.elements[atom]) + 1} 0.0 {float(atomIDs[atom])} 0.0 0.0' for atom in atomOrder)
+
+        lines.append('Bonds')
+        lines.extend(f'{index} {BOND_TYPES[tuple(sorted((self.elements[atom1], self.elements[atom2])))]} {atomIDs[atom1]} {atomIDs[atom2]}' for index, (atom1, atom2) in enumerate(bonds, start=1))
+        lines.append('Angles')
+        lines.extend(f'{index} 1 ' + ' '.join(str(atomIDs[atom]) for atom in angle) for index, angle in enumerate(angles, start=1))
+        if dihedrals:
+            lines.append('Dihedrals')
+            lines.extend(f'{index} 1 ' + ' '.join(str(atomIDs[atom]) for atom in dihedral) for index, dihedral in enumerate(dihedrals, start=1))
+
+        return clean_data([line + '\n' for line in lines])
+
+    def pre_lines(self):
+        return self.data_lines(self.preBonds, self.preIDs, self.molecules)
+
+    def post_lines(self):
+        # The bonded molecules share a molecule ID, H2 gets its own
+        molecules = [3 if atom in self.deleteAtoms else 1 for atom in range(len(self.elements))]
+        return self.data_lines(self.postBonds, self.postIDs, molecules)
+
+    def map_arguments(self):
+        '''Bonding atoms, delete atoms (pre then post) and elements by type in the form taken by map_processor'''
+        preBondingAtoms = [str(self.preIDs[atom]) for atom in self.bondingAtoms]
+        postBondingAtoms = [str(self.postIDs[atom]) for atom in self.bondingAtoms]
+        deleteAtoms = [str(self.preIDs[atom]) for atom in self.deleteAtoms] + [str(self.postIDs[atom]) for atom in self.deleteAtoms]
+
+        return preBondingAtoms, postBondingAtoms, deleteAtoms, ELEMENTS_BY_TYPE
+
+    def score(self, mappedIDList):
+        '''
+        Returns:
+            Percentage of pre-bond bonds outside the reaction kept by the map, and percentage of atoms
+            mapped to the generated post atom
+        '''
+        mappedIDDict = {int(preAtom): int(postAtom) for preAtom, postAtom in mappedIDList}
+        postBondSet = {frozenset((self.postIDs[atom1], self.postIDs[atom2])) for atom1, atom2 in self.postBonds}
+        reactionAtoms = set(self.bondingAtoms + self.deleteAtoms)
+
+        checkedBonds = [(atom1, atom2) for atom1, atom2 in self.preBonds if atom1 not in reactionAtoms or atom2 not in reactionAtoms]
+        keptBonds = 0
+        for atom1, atom2 in checkedBonds:
+            postAtoms = frozenset((mappedIDDict.get(self.preIDs[atom1]), mappedIDDict.get(self.preIDs[atom2])))
+            if postAtoms in postBondSet:
+                keptBonds += 1
+
+        exactAtoms = sum(1 for atom in range(len(self.elements)) if mappedIDDict.get(self.preIDs[atom]) == self.postIDs[atom])
+
+        return round(keptBonds / len(checkedBonds) * 100, 1), round(exactAtoms / len(self.elements) * 100, 1)
+
+def run_reaction(reaction):
+    '''
+    Map a SymmetricReaction without writing files.
+
+    Returns:
+        Dictionary of topology, size, atom count, wall time (s), inference rounds and count,
+        bond and exact accuracy and any error printed by the mapper
+    '''
+    preBondingAtoms, postBondingAtoms, deleteAtoms, elementsByType = reaction.map_arguments()
+    result = {'topology': reaction.topology, 'size': reaction.size, 'atoms': len(reaction.elements)}
+
+    output = io.StringIO()
+    startTime = time.perf_counter()
+    try:
+        with restore_dir(), contextlib.redirect_stdout(output), count_inferences() as counts:
+            mapResult = map_processor('.', reaction.pre_lines(), reaction.post_lines(), None, None, preBondingAtoms, postBondingAtoms,
+                                      deleteAtoms, elementsByType, None, mapFileName=None)
+    except SystemExit: # The missing atom search exits if it can't map every atom
+        mapResult = None
+    result['wallTime'] = round(time.perf_counter() - startTime, 4)
+    result['inferences'] = counts['inferences']
+
+    if mapResult is None:
+        errors = [line for line in output.getvalue().splitlines() if line.startswith('Error')]
+        result.update({'rounds': None, 'bondAccuracy': 0.0, 'exactAccuracy': 0.0, 'diagnostics': None, 'error': errors[-1] if errors else 'Mapping failed'})
+        return result
+
+    bondAccuracy, exactAccuracy = reaction.score(mapResult.fullMappedIDList)
+    result.update({'rounds': mapResult.searchStats['rounds'], 'bondAccuracy': bondAccuracy, 'exactAccuracy': exactAccuracy,
+                   'diagnostics': len(mapResult.diagnostics), 'error': None})
+
+    return result
+
+def symmetry_sweep(topologies, sizes, trials=3, seed=0):
+    '''Run trials random reactions for every topology and size, returning a list of run_reaction results'''
+    results = []
+    for topology in topologies:
+        for size in sizes:
+            for trial in range(trials):
+                # String seeds give the same reactions in every run
+                results.append(run_reaction(SymmetricReaction(topology, size, seed=f'{seed}-{topology}-{size}-{trial}')))
+
+    return results
+
+if __name__ == '__main__':
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Map random highly symmetric reactions and report time, inference rounds and accuracy as symmetry grows')
+    parser.add_argument('--topologies', metavar='topologies', nargs='+', choices=TOPOLOGIES, default=TOPOLOGIES, help='Molecule shapes to generate. Defaults to all of chain, ring and dendrimer')
+    parser.add_argument('--sizes', metavar='sizes', type=int, nargs='+', default=[3, 4, 5], help='Carbons in each chain or ring, or dendrimer generations. Defaults to 3 4 5')
+    parser.add_argument('--trials', metavar='trials', type=int, default=3, help='Random reactions for each topology and size. Defaults to 3')
+    parser.add_argument('--seed', metavar='seed', type=int, default=0, help='Seed for the random reactions. Defaults to 0')
+    parser.add_argument('--json', metavar='json_file', help='Write every result to a JSON file')
+    args = parser.parse_args()
+
+    results = symmetry_sweep(args.topologies, args.sizes, args.trials, args.seed)
+    print(f'{"Topology":<10} {"Size":>4} {"Atoms":>6} {"Time (s)":>9} {"Rounds":>6} {"Inferences":>10} {"Bonds %":>8} {"Exact %":>8}')
+    for result in results:
+        rounds = '-' if result['rounds'] is None else result['rounds']
+        print(f'{result["topology"]:<10} {result["size"]:>4} {result["atoms"]:>6} {result["wallTime"]:>9.3f} {rounds:>6} {result["inferences"]:>10} {result["bondAccuracy"]:>8} {result["exactAccuracy"]:>8}')
+        if result['error'] is not None:
+            print(f' {result["error"]}')
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
@@ -0,0 +1,453 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Builds large pre- and post-bond data files from the small MapTesting cases so
+# the scaling of clean, molecule and map can be measured. The case is copied
+# until the requested number of atoms is reached. Each molecule of one copy is
+# bonded to the same molecule of the next copy, by removing a hydrogen far from
+# the reaction on each side and bonding their heavy atoms, so every copy forms a
+# chain. Only copy 0 reacts; later copies are the unreacted pre-bond molecules
+# in both files.
+#
+# Alongside the data files a settings file with placeholder coefficients is
+# written, for timing clean, and expected_map.json with the map arguments and
+# the acceptable post atoms of every pre atom. Copy 0 is expected to match the
+# map of the original case; later copies map onto themselves. Atoms that
+# colour refinement can't tell apart within a copy (e.g. methyl hydrogens) are
+# accepted as alternatives. Angles, dihedrals and impropers across the new
+# bonds are not added as they play no part in mapping.
+##############################################################################
+
+import os
+import sys
+import json
+import time
+import datetime
+from collections import deque
+
+from LammpsFileReader import read_data_sections
+from LammpsSearchFuncs import get_header
+from LammpsTreatmentFuncs import open_file
+from MapProcessor import map_processor, restore_dir, DEFAULT_RADIUS
+from MapTesting import MAP_CASES, TEST_DIRECTORY, score_map
+
+SECTIONS = ['Masses', 'Atoms', 'Bonds', 'Angles', 'Dihedrals', 'Impropers']
+# Number of atom IDs at the start of each connectivity section row, after the row ID and type
+SECTION_ATOM_COUNTS = {'Bonds': 2, 'Angles': 3, 'Dihedrals': 4, 'Impropers': 4}
+HEADER_COUNTS = {'Atoms': 'atoms', 'Bonds': 'bonds', 'Angles': 'angles', 'Dihedrals': 'dihedrals', 'Impropers': 'impropers'}
+TYPE_COUNTS = ['atom_types', 'bond_types', 'angle_types', 'dihedral_types', 'improper_types']
+# Placeholder coefficients written to the settings file for each type
+PLACEHOLDER_COEFFS = {'bond_types': 'bond_coeff {} 350.0 1.0', 'angle_types': 'angle_coeff {} 50.0 109.5',
+                      'dihedral_types': 'dihedral_coeff {} 0.0 1 0 0.0', 'improper_types': 'improper_coeff {} 0.0 0.0'}
+
+def read_case(fileName):
+    headerLines, sections = read_data_sections(fileName, SECTIONS)
+
+    return get_header(headerLines), sections
+
+def build_neighbours(atomRows, bondRows):
+    neighbours = {int(row[0]): [] for row in atomRows}
+    for row in bondRows:
+        atom1, atom2 = int(row[2]), int(row[3])
+        neighbours[atom1].append(atom2)
+        neighbours[atom2].append(atom1)
+
+    return neighbours
+
+def bond_distances(neighbours, startAtoms):
+    # BFS distances from startAtoms, unreachable atoms are left out
+    distances = {atomID: 0 for atomID in startAtoms}
+    queue = deque(startAtoms)
+    while queue:
+        atomID = queue.popleft()
+        for neighbour in neighbours[atomID]:
+            if neighbour not in distances:
+                distances[neighbour] = distances[atomID] + 1
+                queue.append(neighbour)
+
+    return distances
+
+def find_molecules(neighbours):
+    molecules = []
+    seen = set()
+    for atomID in neighbours:
+        if atomID not in seen:
+            molecule = sorted(bond_distances(neighbours, [atomID]))
+            seen.update(molecule)
+            molecules.append(molecule)
+
+    return molecules
+
+def colour_classes(atomTypes, neighbours, markers):
+    '''
+    Group atoms that colour refinement can't tell apart. Atoms start coloured by type and
+    marker, then colours are split by neighbour colours until the number of colours is stable.
+
+    Returns:
+        Dictionary of atomID: list of atomIDs with the same final colour
+    '''
+    colours = {atomID: (atomTypes[atomID], markers.get(atomID, '')) for atomID in neighbours}
+    colourCount = 0
+    while True:
+        signatures = {atomID: (colours[atomID], tuple(sorted(colours[neighbour] for neighbour in neighbours[atomID]))) for atomID in neighbours}
+        relabel = {signature: index for index, signature in enumerate(sorted(set(signatures.values())))}
+        colours = {atomID: relabel[signature] for atomID, signature in signatures.items()}
+        if len(relabel) == colourCount:
+            break
+        colourCount = len(relabel)
+
+    groups = {}
+    for atomID, colour in colours.items():
+        groups.setdefault(colour, []).append(atomID)
+
+    return {atomID: groups[colour] for atomID, colour in colours.items()}
+
+def choose_link_atoms(neighbours, atomTypes, elementsByType, reactionAtoms, excludedAtoms):
+    '''
+    Pick a head and a tail hydrogen on every molecule, as far from the reaction atoms and each other as possible.
+
+    Returns:
+        List of (headH, tailH) pairs, one per molecule, and the smallest bond distance from any link to the reaction
+    '''
+    reactionDistances = bond_distances(neighbours, reactionAtoms)
+    links = []
+    for molecule in find_molecules(neighbours):
+        hydrogens = [atomID for atomID in molecule if elementsByType[atomTypes[atomID] - 1] == 'H' and len(neighbours[atomID]) == 1
+                     and atomID not in excludedAtoms and neighbours[atomID][0] not in excludedAtoms]
+        assert len(hydrogens) >= 2, f'Molecule containing atom {molecule[0]} needs two hydrogens away from the reaction to be linked into a chain'
+
+        # Molecules that never react have no distance to the reaction, treat them as far away
+        farDistance = len(neighbours)
+        tailH = max(hydrogens, key=lambda atomID: (reactionDistances.get(atomID, farDistance), -atomID))
+        tailDistances = bond_distances(neighbours, [tailH])
+        headH = max([atomID for atomID in hydrogens if atomID != tailH],
+                    key=lambda atomID: (min(reactionDistances.get(atomID, farDistance), tailDistances[atomID]), -atomID))
+        links.append((headH, tailH))
+
+    closestLink = min(reactionDistances.get(atomID, farDistance) for link in links for atomID in link)
+
+    return links, closestLink
+
+class CopyTemplate:
+    '''
+    One copy of a case with some hydrogens removed and atoms renumbered from 1.
+    Rows keep their original columns so they can be written with an offset for each copy.
+    '''
+    def __init__(self, sections, deleteAtoms, elementsByType, markers):
+        deleteAtoms = set(deleteAtoms)
+        self.localIDs = {}
+        self.atoms = []
+        for row in sections['Atoms']:
+            atomID = int(row[0])
+            if atomID in deleteAtoms:
+                continue
+            self.localIDs[atomID] = len(self.localIDs) + 1
+            self.atoms.append((int(row[1]), row[2], row[3], float(row[4]), ' '.join(row[5:])))
+
+        # Connectivity rows are (type, [local atomIDs], trailing columns)
+        self.sections = {}
+        for sectionName, atomCount in SECTION_ATOM_COUNTS.items():
+            rows = []
+            for row in sections[sectionName]:
+                atomIDs = [int(atomID) for atomID in row[2:2 + atomCount]]
+                if all(atomID in self.localIDs for atomID in atomIDs):
+                    rows.append((row[1], [self.localIDs[atomID] for atomID in atomIDs], ' '.join(row[2 + atomCount:])))
+            self.sections[sectionName] = rows
+
+        # Symmetry classes within this copy, in local IDs
+        atomTypes = {self.localIDs[int(row[0])]: int(row[2]) for row in sections['Atoms'] if int(row[0]) in self.localIDs}
+        neighbours = {localID: [] for localID in atomTypes}
+        for _, (atom1, atom2), _ in self.sections['Bonds']:
+            neighbours[atom1].append(atom2)
+            neighbours[atom2].append(atom1)
+        localMarkers = {self.localIDs[atomID]: marker for atomID, marker in markers.items() if atomID in self.localIDs}
+        self.classes = colour_classes(atomTypes, neighbours, localMarkers)
+
+    def __len__(self):
+        return len(self.atoms)
+
+    def atom_lines(self, atomOffset, moleculeOffset, shift):
+        return [f'{localID + atomOffset} {molecule + moleculeOffset} {atomType} {charge} {x + shift} {rest}\n'
+                for localID, (molecule, atomType, charge, x, rest) in enumerate(self.atoms, start=1)]
+
+    def section_lines(self, sectionName, rowOffset, atomOffset):
+        lines = []
+        for rowID, (rowType, atomIDs, rest) in enumerate(self.sections[sectionName], start=rowOffset + 1):
+            atomString = ' '.join(str(atomID + atomOffset) for atomID in atomIDs)
+            lines.append(f'{rowID} {rowType} {atomString} {rest}'.rstrip() + '\n')
+
+        return lines
+
+def write_chain(fileName, header, masses, copies, linkBonds, xLength):
+    '''
+    Write copies of CopyTemplates one after another, with linkBonds as extra bonds.
+    copies is a list of (template, moleculeOffset), linkBonds a list of (bond type, atomID, atomID) in final IDs.
+    '''
+    atomOffsets = []
+    atomCount = 0
+    for template, _ in copies:
+        atomOffsets.append(atomCount)
+        atomCount += len(template)
+
+    counts = {'Atoms': atomCount}
+    for sectionName in SECTION_ATOM_COUNTS:
+        counts[sectionName] = sum(len(template.sections[sectionName]) for template, _ in copies)
+    counts['Bonds'] += len(linkBonds)
+
+    with open_file(fileName, 'w') as f:
+        f.write(f'{header["comment"][0]} - {len(copies)} linked copies\n\n')
+        for sectionName, keyword in HEADER_COUNTS.items():
+            if sectionName == 'Atoms' or keyword in header:
+                f.write(f'{counts[sectionName]} {keyword}\n')
+        f.write('\n')
+        for key in TYPE_COUNTS:
+            if key in header:
+                f.write(f'{header[key][0]} {key.replace("_", " ")}\n')
+        f.write('\n')
+        xlo, xhi = header['xlo_xhi']
+        f.write(f'{xlo} {xlo + xLength * len(copies)} xlo xhi\n')
+        for key in ['ylo_yhi', 'zlo_zhi']:
+            f.write(f'{header[key][0]} {header[key][1]} {key.replace("_", " ")}\n')
+
+        f.write('\nMasses\n\n')
+        f.writelines(' '.join(row) + '\n' for row in masses)
+
+        f.write('\nAtoms\n\n')
+        for index, (template, moleculeOffset) in enumerate(copies):
+            f.writelines(template.atom_lines(atomOffsets[index], moleculeOffset, xLength * index))
+
+        for sectionName in SECTION_ATOM_COUNTS:
+            if counts[sectionName] == 0:
+                continue
+            f.write(f'\n{sectionName}\n\n')
+            rowOffset = 0
+            for index, (template, _) in enumerate(copies):
+                f.writelines(template.section_lines(sectionName, rowOffset, atomOffsets[index]))
+                rowOffset += len(template.sections[sectionName])
+            if sectionName == 'Bonds':
+                f.writelines(f'{rowOffset + index} {bondType} {atom1} {atom2}\n' for index, (bondType, atom1, atom2) in enumerate(linkBonds, start=1))
+
+    return atomOffsets
+
+def write_settings(fileName, header):
+    # Placeholder coefficients for every type so the chain can be cleaned
+    atomTypes = header['atom_types'][0]
+    lines = [f'pair_coeff {type1} {type2} lj/cut/coul/long 0.1 3.0\n' for type1 in range(1, atomTypes + 1) for type2 in range(type1, atomTypes + 1)]
+    for key, coeffString in PLACEHOLDER_COEFFS.items():
+        if key in header:
+            lines.extend(coeffString.format(typeID) + '\n' for typeID in range(1, header[key][0] + 1))
+
+    with open(fileName, 'w') as f:
+        f.writelines(lines)
+
+def link_bond_type(sections, atomTypes, atom1, atom2):
+    # Use the type of an existing bond between the same atom types, or the first bond type
+    linkTypes = {atomTypes[atom1], atomTypes[atom2]}
+    for row in sections['Bonds']:
+        if {atomTypes[int(row[2])], atomTypes[int(row[3])]} == linkTypes:
+            return row[1]
+
+    return sections['Bonds'][0][1]
+
+def generate_chain(caseName, directory, targetAtoms):
+    '''
+    Write a chain of copies of a MapTesting case with at least targetAtoms pre-bond atoms to directory.
+
+    Returns:
+        Dictionary saved as expected_map.json, holding the map arguments and expected post atoms
+    '''
+    case = next((case for case in MAP_CASES if case['directory'] == caseName), None)
+    assert case is not None, f'Unknown map test case {caseName}. Possible cases: {[case["directory"] for case in MAP_CASES]}'
+
+    caseDirectory = os.path.join(TEST_DIRECTORY, caseName)
+    preHeader, preSections = read_case(os.path.join(caseDirectory, 'cleanedpre_reaction.data'))
+    postHeader, postSections = read_case(os.path.join(caseDirectory, 'cleanedpost_reaction.data'))
+
+    # The full map of one copy, which copy 0 should reproduce
+    with restore_dir():
+        baseResult = map_processor(caseDirectory, 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', None, None, case['preBondingAtoms'],
+                                   case['postBondingAtoms'], case['deleteAtoms'], case['elementsByType'], case['createAtoms'], mapFileName=None)
+    baseMap = {int(preAtom): int(postAtom) for preAtom, postAtom in baseResult.fullMappedIDList}
+
+    preTypes = {int(row[0]): int(row[2]) for row in preSections['Atoms']}
+    preNeighbours = build_neighbours(preSections['Atoms'], preSections['Bonds'])
+    postNeighbours = build_neighbours(postSections['Atoms'], postSections['Bonds'])
+
+    deleteAtoms = [int(atomID) for atomID in case['deleteAtoms'] or []]
+    preDeleteAtoms, postDeleteAtoms = deleteAtoms[:len(deleteAtoms) // 2], deleteAtoms[len(deleteAtoms) // 2:]
+    preBondingAtoms = [int(atomID) for atomID in case['preBondingAtoms']]
+    links, closestLink = choose_link_atoms(preNeighbours, preTypes, case['elementsByType'], preBondingAtoms + preDeleteAtoms, set(preBondingAtoms + preDeleteAtoms))
+    if closestLink <= DEFAULT_RADIUS + 1:
+        print(f'Warning: A link between copies of {caseName} is {closestLink} bonds from the reaction and may be in the partial structure')
+
+    # Post-bond copy 0 loses the hydrogens its tails map to
+    postTails = []
+    for _, tailH in links:
+        tailParent = preNeighbours[tailH][0]
+        assert baseMap[tailParent] in postNeighbours[baseMap[tailH]], f'Tail hydrogen {tailH} of {caseName} is not bonded to the same atom after the reaction'
+        postTails.append(baseMap[tailH])
+
+    heads = [headH for headH, _ in links]
+    tails = [tailH for _, tailH in links]
+    headMarkers = {preNeighbours[headH][0]: 'head' for headH in heads}
+    tailMarkers = {preNeighbours[tailH][0]: 'tail' for tailH in tails}
+
+    # Every link removes a head hydrogen from one copy and a tail hydrogen from the next, so a chain of
+    # copyCount copies has copyCount * copyAtoms + 2 * len(links) atoms
+    copyAtoms = len(preSections['Atoms']) - 2 * len(links)
+    if targetAtoms <= len(preSections['Atoms']):
+        copyCount = 1
+    else:
+        copyCount = max(2, -(-(targetAtoms - 2 * len(links)) // copyAtoms))
+    preFirst = CopyTemplate(preSections, tails if copyCount > 1 else [], case['elementsByType'], tailMarkers)
+    postFirst = CopyTemplate(postSections, postTails if copyCount > 1 else [], case['elementsByType'],
+                             {baseMap[atomID]: marker for atomID, marker in tailMarkers.items()})
+    middle = CopyTemplate(preSections, heads + tails, case['elementsByType'], {**headMarkers, **tailMarkers})
+    last = CopyTemplate(preSections, heads, case['elementsByType'], headMarkers)
+    laterCopies = [middle] * (copyCount - 2) + [last] if copyCount > 1 else []
+
+    moleculeCount = max(int(row[1]) for row in preSections['Atoms'] + postSections['Atoms'])
+    xLength = preHeader['xlo_xhi'][1] - preHeader['xlo_xhi'][0]
+
+    def link_bonds(firstTemplate, firstTails, atomOffsets):
+        # Bond each tail heavy atom of one copy to the head heavy atom of the same molecule in the next copy
+        bonds = []
+        for index, ((headH, tailH), firstTail) in enumerate(zip(links, firstTails)):
+            tailParent, headParent = preNeighbours[tailH][0], preNeighbours[headH][0]
+            bondType = link_bond_type(preSections, preTypes, tailParent, headParent)
+            previousTail = firstTemplate.localIDs[firstTail]
+            for copyIndex, template in enumerate(laterCopies, start=1):
+                bonds.append((bondType, previousTail + atomOffsets[copyIndex - 1], template.localIDs[headParent] + atomOffsets[copyIndex]))
+                previousTail = template.localIDs.get(tailParent)
+
+        return bonds
+
+    # Atom offsets only depend on template sizes, so link bonds can be made before writing
+    def offsets(firstTemplate):
+        atomOffsets = [0]
+        for template in [firstTemplate] + laterCopies[:-1]:
+            atomOffsets.append(atomOffsets[-1] + len(template))
+        return atomOffsets
+
+    preOffsets = offsets(preFirst)
+    postOffsets = offsets(postFirst)
+    preLinks = link_bonds(preFirst, [preNeighbours[tailH][0] for tailH in tails], preOffsets)
+    postLinks = link_bonds(postFirst, [baseMap[preNeighbours[tailH][0]] for tailH in tails], postOffsets)
+
+    os.makedirs(directory, exist_ok=True)
+    moleculeOffsets = [copyIndex * moleculeCount for copyIndex in range(copyCount)]
+    write_chain(os.path.join(directory, 'pre_reaction.data'), preHeader, preSections['Masses'], list(zip([preFirst] + laterCopies, moleculeOffsets)), preLinks, xLength)
+    write_chain(os.path.join(directory, 'post_reaction.data'), postHeader, postSections['Masses'], list(zip([postFirst] + laterCopies, moleculeOffsets)), postLinks, xLength)
+    write_settings(os.path.join(directory, 'system.in.settings'), preHeader)
+
+    # Expected post atoms: copy 0 follows the case map, later copies map onto themselves
+    correct = {}
+    for preAtom, postAtom in baseMap.items():
+        if preAtom not in preFirst.localIDs:
+            continue
+        postLocal = postFirst.localIDs[postAtom]
+        choices = set(postFirst.classes[postLocal])
+        choices.update(postFirst.localIDs[int(atomID)] for atomID in case['correct'].get(str(preAtom), []) if int(atomID) in postFirst.localIDs)
+        correct[str(preFirst.localIDs[preAtom])] = [str(atomID) for atomID in sorted(choices)]
+    for copyIndex, template in enumerate(laterCopies, start=1):
+        for localID in range(1, len(template) + 1):
+            correct[str(localID + preOffsets[copyIndex])] = [str(atomID + postOffsets[copyIndex]) for atomID in sorted(template.classes[localID])]
+
+    def renumbered(atomIDs, template):
+        return [str(template.localIDs[int(atomID)]) for atomID in atomIDs]
+
+    expected = {
+        'case': caseName,
+        'copies': copyCount,
+        'preAtoms': preOffsets[-1] + len(laterCopies[-1] if laterCopies else preFirst),
+        'preBondingAtoms': renumbered(case['preBondingAtoms'], preFirst),
+        'postBondingAtoms': renumbered(case['postBondingAtoms'], postFirst),
+        'deleteAtoms': renumbered(preDeleteAtoms, preFirst) + renumbered(postDeleteAtoms, postFirst) if case['deleteAtoms'] else None,
+        'elementsByType': case['elementsByType'],
+        'createAtoms': renumbered(case['createAtoms'], postFirst) if case['createAtoms'] else None,
+        'correct': correct,
+    }
+    arguments = ['--ba'] + expected['preBondingAtoms'] + expected['postBondingAtoms'] + ['--ebt'] + expected['elementsByType']
+    if expected['deleteAtoms']:
+        arguments += ['--da'] + expected['deleteAtoms']
+    if expected['createAtoms']:
+        arguments += ['--ca'] + expected['createAtoms']
+    expected['arguments'] = ' '.join(arguments)
+
+    with open(os.path.join(directory, 'expected_map.json'), 'w') as f:
+        json.dump(expected, f)
+
+    return expected
+
+def time_tools(directory, expected):
+    '''
+    Time clean, molecule and map on a generated chain and score the full map against the expected map.
+    Returns a dictionary of wall times in seconds, atom count and map accuracy.
+    '''
+    # Imported here so generating files doesn't pay for them
+    from LammpsUnifiedCleaner import file_unifier
+    from LammpsToMolecule import lammps_to_molecule
+
+    directory = os.path.abspath(directory)
+    result = {'case': expected['case'], 'copies': expected['copies'], 'preAtoms': expected['preAtoms']}
+    with restore_dir():
+        startTime = time.perf_counter()
+        file_unifier(directory, 'system.in.settings', ['pre_reaction.data', 'post_reaction.data'])
+        result['clean'] = round(time.perf_counter() - startTime, 4)
+
+    with restore_dir():
+        startTime = time.perf_counter()
+        lammps_to_molecule(directory, 'pre_reaction.data', 'pre-molecule.data')
+        result['molecule'] = round(time.perf_counter() - startTime, 4)
+
+    with restore_dir():
+        startTime = time.perf_counter()
+        mapResult = map_processor(directory, 'pre_reaction.data', 'post_reaction.data', 'pre-molecule.data', 'post-molecule.data', expected['preBondingAtoms'],
+                                  expected['postBondingAtoms'], expected['deleteAtoms'], expected['elementsByType'], expected['createAtoms'])
+        result['map'] = round(time.perf_counter() - startTime, 4)
+
+    result['accuracy'] = score_map(mapResult.fullMappedIDList, expected['correct'])['accuracy']
+
+    return result
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate large linked copies of map test cases and optionally time the AutoMapper tools on them')
+    parser.add_argument('cases', metavar='cases', nargs='+', help='Test_Cases/Map_Tests directory names of the cases to copy, e.g. DGEBA_DETDA Phenolic_Resin Generic_PU')
+    parser.add_argument('--atoms', metavar='atoms', type=int, nargs='+', default=[1000], help='Smallest number of pre-bond atoms of each generated chain. Defaults to 1000')
+    parser.add_argument('--output', metavar='output', default='.', help='Directory to write each <case>_<atoms> directory to. Defaults to the current directory')
+    parser.add_argument('--benchmark', action='store_true', help='Time clean, molecule and map on each generated chain')
+    parser.add_argument('--history', metavar='history_file', help='JSON file to append benchmark results to')
+    args = parser.parse_args()
+
+    results = []
+    for caseName in args.cases:
+        for targetAtoms in args.atoms:
+            chainDirectory = os.path.join(args.output, f'{caseName}_{targetAtoms}')
+            expected = generate_chain(caseName, chainDirectory, targetAtoms)
+            print(f'{chainDirectory}: {expected["copies"]} copies, {expected["preAtoms"]} pre-bond atoms. Map arguments: {expected["arguments"]}')
+            if args.benchmark:
+                result = time_tools(chainDirectory, expected)
+                print(f' clean {result["clean"]:.3f} s, molecule {result["molecule"]:.3f} s, map {result["map"]:.3f} s, accuracy {result["accuracy"]}%')
+                results.append(result)
+
+    if args.history is not None and results:
+        history = []
+        if os.path.exists(args.history):
+            with open(args.history, 'r') as f:
+                history = json.load(f)
+        history.append({'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0], 'results': results})
+        with open(args.history, 'w') as f:
+            json.dump(history, f, indent=1)
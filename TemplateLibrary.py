@@ -0,0 +1,383 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A directory of solved maps that map_processor can reuse instead of running
+# the path search. Each atom built by build_atom_objects gets a canonical label
+# from its element, its role (bonding or delete atom, by position) and, through
+# colour refinement, the labels of the atoms around it. Where refinement leaves
+# symmetric atoms with the same label, interchangeable twins are numbered in
+# order, then each atom of a shared label is picked in turn and refinement
+# repeated until every label is unique, keeping the smallest labelled graph.
+# Labels don't depend on atomIDs, so a template stores its map as pairs
+# of pre and post labels and can be projected onto any reaction whose pre- and
+# post-bond molecules give the same labelled graphs.
+#
+# Templates are indexed by a fingerprint of the reaction centre: the atoms up
+# to CENTRE_RADIUS bonds from the bonding atoms. This is quick to compute, so a
+# reaction with no template for its centre costs little. Full labels are only
+# found when the centre matches, and a template is only used if the whole
+# labelled graphs are identical. Otherwise the path search runs as normal.
+##############################################################################
+
+import os
+import json
+import hashlib
+import tempfile
+from collections import Counter, deque, defaultdict
+
+INDEX_FILE = 'index.json'
+# Bonds from the bonding atoms included in the reaction centre fingerprint, as the default partial structure radius
+CENTRE_RADIUS = 3
+
+def atom_graph(atomObjectDict, bondingAtoms, deleteAtoms):
+    '''Element, role and neighbours of each atom. Bonding and delete atoms are given roles by their position'''
+    roles = {}
+    for index, atomID in enumerate(bondingAtoms):
+        roles[atomID] = f'b{index}'
+    if deleteAtoms is not None:
+        for index, atomID in enumerate(deleteAtoms):
+            roles[atomID] = f'd{index}'
+
+    return {atomID: (atom.element, roles.get(atomID, ''), atom.firstNeighbourIDs) for atomID, atom in atomObjectDict.items()}
+
+def centre_graph(graph, bondingAtoms, radius):
+    # Breadth first search out from the bonding atoms, neighbours outside the centre are dropped
+    distances = {atomID: 0 for atomID in bondingAtoms}
+    searchQueue = deque(bondingAtoms)
+    while searchQueue:
+        atomID = searchQueue.popleft()
+        if distances[atomID] == radius:
+            continue
+        for neighbour in graph[atomID][2]:
+            if neighbour not in distances:
+                distances[neighbour] = distances[atomID] + 1
+                searchQueue.append(neighbour)
+
+    return {atomID: (element, role, [neighbour for neighbour in neighbours if neighbour in distances])
+            for atomID, (element, role, neighbours) in graph.items() if atomID in distances}
+
+class OrderedPartition:
+    '''
+    Atoms in an order that keeps each colour together as a cell. Cells are named by their start
+    position, so colours don't depend on atomIDs. Cells are split until the partition is equitable:
+    every atom in a cell has the same number of neighbours in each other cell.
+    '''
+    def __init__(self, graph):
+        self.graph = graph
+        self.order = list(graph)
+        self.cellStart = {atomID: 0 for atomID in graph}
+        self.cellEnd = {0: len(graph)} if graph else {}
+        if graph:
+            self.refine(self.split(0, lambda atomID: graph[atomID][:2])) # Element and role
+
+    def colours(self):
+        return dict(self.cellStart)
+
+    def split(self, start, key):
+        '''Split a cell into cells ordered by key. Returns the starts of the new cells'''
+        groups = defaultdict(list)
+        for atomID in self.order[start:self.cellEnd[start]]:
+            groups[key(atomID)].append(atomID)
+        if len(groups) == 1:
+            return [start]
+
+        starts = []
+        position = start
+        for groupKey in sorted(groups):
+            group = groups[groupKey]
+            self.order[position:position + len(group)] = group
+            for atomID in group:
+                self.cellStart[atomID] = position
+            self.cellEnd[position] = position + len(group)
+            starts.append(position)
+            position += len(group)
+
+        return starts
+
+    def refine(self, splitters):
+        '''Split cells by their number of neighbours in each splitter cell, adding new cells as splitters, until nothing splits'''
+        splitters = deque(splitters)
+        waiting = set(splitters)
+        while splitters:
+            splitter = splitters.popleft()
+            waiting.discard(splitter)
+            counts = Counter(neighbour for atomID in self.order[splitter:self.cellEnd[splitter]] for neighbour in self.graph[atomID][2])
+            for start in sorted({self.cellStart[atomID] for atomID in counts}):
+                starts = self.split(start, counts.__getitem__)
+                if len(starts) == 1:
+                    continue
+
+                # Neighbour counts for the largest new cell follow from the others, unless the old cell is still waiting
+                if start not in waiting:
+                    largest = max(starts, key=lambda cell: self.cellEnd[cell] - cell)
+                    starts.remove(largest)
+                for cell in starts:
+                    if cell not in waiting:
+                        splitters.append(cell)
+                        waiting.add(cell)
+
+    def split_twins(self):
+        # Atoms in a cell with the same neighbours (e.g. the hydrogens of a CH3) can be swapped without
+        # changing the graph, so they are numbered in atomID order and split without a search
+        newCells = []
+        for start, end in list(self.cellEnd.items()):
+            if end - start == 1:
+                continue
+            twins = defaultdict(list)
+            for atomID in sorted(self.order[start:end]):
+                twins[frozenset(self.graph[atomID][2])].append(atomID)
+            twinIndex = {atomID: index for twinAtoms in twins.values() for index, atomID in enumerate(twinAtoms)}
+            newCells.extend(self.split(start, twinIndex.__getitem__))
+        self.refine(newCells)
+
+    def individualise(self, atomID):
+        start = self.cellStart[atomID]
+        self.split(start, lambda otherAtom: otherAtom != atomID)
+        self.refine([start])
+
+    def shared_cell(self, start=0):
+        # First cell from start with more than one atom, singleton cells are skipped by their ends
+        while self.cellEnd[start] - start == 1:
+            start = self.cellEnd[start]
+        return start
+
+    def copy(self):
+        partition = OrderedPartition({})
+        partition.graph = self.graph
+        partition.order = list(self.order)
+        partition.cellStart = dict(self.cellStart)
+        partition.cellEnd = dict(self.cellEnd)
+        return partition
+
+class Orbits:
+    '''Union find of atoms that automorphisms swap, atoms with the same root are in the same orbit'''
+    def __init__(self):
+        self.parents = {}
+
+    def root(self, atomID):
+        while self.parents.get(atomID, atomID) != atomID:
+            atomID = self.parents[atomID]
+        return atomID
+
+    def join(self, automorphism, atomIDs):
+        for atomID in atomIDs:
+            if atomID not in automorphism:
+                continue
+            root, imageRoot = self.root(atomID), self.root(automorphism[atomID])
+            if root != imageRoot:
+                self.parents[max(root, imageRoot)] = min(root, imageRoot)
+
+def canonical_labels(graph):
+    '''
+    Give every atom a unique label that doesn't depend on atomIDs. Symmetric atoms are separated by
+    splitting twins, then every atom of the first shared cell is tried in turn and refinement repeated,
+    keeping the labels that give the smallest graph_form. Atoms known to be swapped by an automorphism
+    of the graph give the same forms, so only one atom of each such orbit is tried.
+    '''
+    partition = OrderedPartition(graph)
+    partition.split_twins()
+
+    if len(partition.cellEnd) == len(graph):
+        return partition.colours()
+
+    leaves = {}
+    automorphisms = []
+    def leaf_depth(colours, form, path):
+        '''Returns the depth to go back up to, the length of path unless the form equals an earlier leaf'''
+        if not leaves:
+            leaves['first'] = leaves['best'] = {'colours': colours, 'form': form, 'path': path}
+            return len(path)
+        equalLeaf = next((leaf for leaf in (leaves['first'], leaves['best']) if form == leaf['form']), None)
+        if equalLeaf is None:
+            if form < leaves['best']['form']:
+                leaves['best'] = {'colours': colours, 'form': form, 'path': path}
+            return len(path)
+
+        # The atom with each label in the equal leaf can be swapped for the atom with that label here
+        atomByColour = {colour: atomID for atomID, colour in colours.items()}
+        automorphism = {atomID: atomByColour[colour] for atomID, colour in equalLeaf['colours'].items() if atomByColour[colour] != atomID}
+        if automorphism:
+            automorphisms.append(automorphism)
+
+        # The automorphism maps the subtree the equal leaf came from onto this one, so the rest of this one can be skipped
+        depth = 0
+        while path[depth] == equalLeaf['path'][depth]:
+            depth += 1
+        return depth
+
+    def node(partition, path, start):
+        # Cells before start are all single atoms, as cells are only ever split
+        start = partition.shared_cell(start)
+        return {'partition': partition, 'path': path, 'pathAtoms': set(path), 'start': start, 'cell': sorted(partition.order[start:partition.cellEnd[start]]),
+                'index': 0, 'orbits': Orbits(), 'joined': 0, 'triedAtoms': []}
+
+    def next_atom(current):
+        # Only automorphisms that fix every atom already picked can be used to skip atoms here.
+        # These keep the partition, so atoms in the cell are only swapped with other atoms in the cell
+        orbits = current['orbits']
+        while current['index'] < len(current['cell']):
+            atomID = current['cell'][current['index']]
+            current['index'] += 1
+            for automorphism in automorphisms[current['joined']:]:
+                if current['pathAtoms'].isdisjoint(automorphism):
+                    orbits.join(automorphism, current['cell'])
+            current['joined'] = len(automorphisms)
+            if all(orbits.root(atomID) != orbits.root(triedAtom) for triedAtom in current['triedAtoms']):
+                current['triedAtoms'].append(atomID)
+                return atomID
+
+        return None
+
+    # Depth first search of the atoms to pick, the node at each depth of the current path is kept on the stack
+    stack = [node(partition, [], 0)]
+    while stack:
+        current = stack[-1]
+        atomID = next_atom(current)
+        if atomID is None:
+            stack.pop()
+            continue
+
+        child = current['partition'].copy()
+        child.individualise(atomID)
+        path = current['path'] + [atomID]
+        if len(child.cellEnd) < len(graph):
+            stack.append(node(child, path, current['start']))
+            continue
+
+        # Every atom has its own colour, its position, so ordering by position gives graph_form without sorting
+        colours = child.colours()
+        form = [[colour, graph[leafAtom][0], graph[leafAtom][1], sorted(colours[neighbour] for neighbour in graph[leafAtom][2])] for colour, leafAtom in enumerate(child.order)]
+        del stack[leaf_depth(colours, form, path) + 1:]
+
+    return leaves['best']['colours']
+
+def graph_form(graph, colours):
+    # Sorted colour, element, role and neighbour colours of each atom. Equal forms are equal labelled graphs
+    return sorted([colours[atomID], element, role, sorted(colours[neighbour] for neighbour in neighbours)] for atomID, (element, role, neighbours) in graph.items())
+
+def form_hash(*forms):
+    return hashlib.sha256(json.dumps(forms).encode()).hexdigest()
+
+class ReactionGraphs:
+    '''Labelled pre- and post-bond graphs of a reaction, with the fingerprints used to find its template'''
+    def __init__(self, preAtomObjectDict, postAtomObjectDict, preBondingAtoms, postBondingAtoms, preDeleteAtoms, postDeleteAtoms):
+        self.preGraph = atom_graph(preAtomObjectDict, preBondingAtoms, preDeleteAtoms)
+        self.postGraph = atom_graph(postAtomObjectDict, postBondingAtoms, postDeleteAtoms)
+        self.preBondingAtoms = preBondingAtoms
+        self.postBondingAtoms = postBondingAtoms
+        self._centre = None
+        self._labels = None
+
+    def centre(self):
+        if self._centre is None:
+            preCentre = centre_graph(self.preGraph, self.preBondingAtoms, CENTRE_RADIUS)
+            postCentre = centre_graph(self.postGraph, self.postBondingAtoms, CENTRE_RADIUS)
+            self._centre = form_hash(graph_form(preCentre, OrderedPartition(preCentre).colours()), graph_form(postCentre, OrderedPartition(postCentre).colours()))
+
+        return self._centre
+
+    def labels(self):
+        '''Returns: pre labels, post labels and the hash of both labelled graphs'''
+        if self._labels is None:
+            preLabels = canonical_labels(self.preGraph)
+            postLabels = canonical_labels(self.postGraph)
+            graphHash = form_hash(graph_form(self.preGraph, preLabels), graph_form(self.postGraph, postLabels))
+            self._labels = (preLabels, postLabels, graphHash)
+
+        return self._labels
+
+class TemplateLibrary:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index = self.load_index()
+
+    def template_files(self):
+        return sorted(fileName for fileName in os.listdir(self.directory) if fileName.endswith('.json') and fileName != INDEX_FILE)
+
+    def load_template(self, fileName):
+        try:
+            with open(os.path.join(self.directory, fileName), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print(f'Warning: Template {fileName} in {self.directory} could not be read and has been skipped.')
+            return None
+
+    def load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return self.rebuild_index()
+
+    def rebuild_index(self):
+        '''Index every template in the directory by its reaction centre fingerprint'''
+        self.index = {}
+        for fileName in self.template_files():
+            template = self.load_template(fileName)
+            if template is not None:
+                self.index.setdefault(template['centre'], []).append(fileName)
+        self.write_json(INDEX_FILE, self.index)
+
+        return self.index
+
+    def write_json(self, fileName, contents):
+        # Write to a temporary file and rename it, so readers never see a partly written file
+        fileHandle, tempName = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fileHandle, 'w') as f:
+            json.dump(contents, f)
+        os.replace(tempName, os.path.join(self.directory, fileName))
+
+    def project(self, reaction):
+        '''
+        Map a reaction with a stored template, if there is one for the same labelled graphs.
+
+        Returns:
+            List of [preAtomID, postAtomID] pairs and the template file name, or None
+        '''
+        candidates = self.index.get(reaction.centre(), [])
+        if len(candidates) == 0:
+            return None
+
+        preLabels, postLabels, graphHash = reaction.labels()
+        for fileName in candidates:
+            template = self.load_template(fileName)
+            if template is None or template['graph'] != graphHash:
+                continue
+
+            preAtoms = {label: atomID for atomID, label in preLabels.items()}
+            postAtoms = {label: atomID for atomID, label in postLabels.items()}
+            return [[preAtoms[preLabel], postAtoms[postLabel]] for preLabel, postLabel in template['map']], fileName
+
+        return None
+
+    def add(self, reaction, mappedIDList):
+        '''Store a solved map as a template, returns its file name'''
+        preLabels, postLabels, graphHash = reaction.labels()
+        fileName = graphHash[:16] + '.json'
+        if os.path.exists(os.path.join(self.directory, fileName)):
+            return fileName
+
+        template = {'centre': reaction.centre(), 'graph': graphHash, 'atoms': len(preLabels),
+                    'map': sorted([preLabels[preAtom], postLabels[postAtom]] for preAtom, postAtom in mappedIDList)}
+        self.write_json(fileName, template)
+
+        # Reload the index first so templates added by other processes aren't dropped
+        self.index = self.load_index()
+        centreFiles = self.index.setdefault(template['centre'], [])
+        if fileName not in centreFiles:
+            centreFiles.append(fileName)
+        self.write_json(INDEX_FILE, self.index)
+
+        return fileName
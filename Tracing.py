@@ -0,0 +1,92 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# Records mapping events (pre atom, post atom and the rule that paired them)
+# in a fixed size ring buffer, so a slow or wrong map can be examined after the
+# run. Hot loops guard each call with 'if TRACER.enabled:', so nothing is built
+# or formatted while tracing is off. With echo on, events are also sent to
+# logging.debug in the same wording as the old debug messages.
+##############################################################################
+
+import json
+import logging
+from collections import deque, Counter
+
+# Number of events kept, the oldest are dropped first
+TRACE_SIZE = 100000
+
+# Debug message wording for each rule
+RULE_DESCRIPTIONS = {
+    'bonding_atom': 'user specified bond atom',
+    'delete_atom': 'user specified delete atom',
+    'single_element': 'single element occurence',
+    'hydrogen': 'hydrogen symmetry inference',
+    'first_neighbours': 'first neighbour comparison',
+    'second_neighbours': 'second neighbour comparison',
+    'third_neighbours': 'third neighbour comparison',
+    'symmetry_inference': 'symmetry inference',
+    'missing_single_element': 'missing atoms single element occurence',
+    'missing_hydrogen': 'missing atoms hydrogen symmetry inference',
+    'missing_symmetry': 'missing atoms symmetry comparison',
+    'template': 'template library projection',
+}
+
+class Tracer:
+    def __init__(self, size=TRACE_SIZE):
+        self.enabled = False
+        self.echo = False
+        self.events = deque(maxlen=size)
+        self.eventCount = 0
+        self.ruleCounts = Counter()
+
+    def enable(self, size=TRACE_SIZE, echo=False):
+        # Start a new trace. A size of 0 keeps no events, only the counts
+        self.events = deque(maxlen=size)
+        self.eventCount = 0
+        self.ruleCounts = Counter()
+        self.enabled = True
+        self.echo = echo
+
+    def disable(self):
+        self.enabled = False
+        self.echo = False
+
+    def record(self, rule, preAtom, postAtom):
+        self.eventCount += 1
+        self.ruleCounts[rule] += 1
+        event = (self.eventCount, rule, preAtom, postAtom)
+        self.events.append(event)
+        if self.echo:
+            logging.debug(format_event(event))
+
+    def dump(self, fileName):
+        '''Write the kept events to fileName as JSON lines, oldest first. Event numbers show if older events were dropped'''
+        with open(fileName, 'w') as f:
+            for eventNumber, rule, preAtom, postAtom in self.events:
+                f.write(json.dumps({'event': eventNumber, 'rule': rule, 'pre': preAtom, 'post': postAtom}) + '\n')
+
+def format_event(event):
+    _, rule, preAtom, postAtom = event
+    return f'Pre: {preAtom}, Post: {postAtom} found with {RULE_DESCRIPTIONS.get(rule, rule)}'
+
+def configure_logging(debug):
+    '''Show debug messages, including traced events, when debug is True'''
+    logging.basicConfig(level='DEBUG' if debug else 'INFO')
+    if debug and not TRACER.enabled:
+        TRACER.enable(echo=True)
+    elif debug:
+        TRACER.echo = True
+
+# Shared by every tool in this process
+TRACER = Tracer()
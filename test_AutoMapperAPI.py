@@ -0,0 +1,53 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Tests that the API can chain clean and
+# map entirely in memory, without writing any files, and that reactions sharing
+# a pre-bond file map the same as they do alone.
+##############################################################################
+
+import os
+from AutoMapperAPI import clean, map_reaction, map_reactions
+
+def test_clean_to_map_in_memory():
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Cleaner/Methane_Ethane/') # Allows for relative pathing in pytest
+    filesBefore = sorted(os.listdir(path))
+
+    cleaned = clean(path, 'system.in.settings', ['pre-system.data', 'post-system.data'])
+    result = map_reaction(path, cleaned.tidied_lines('pre-system.data'), cleaned.tidied_lines('post-system.data'), ['1', '6'], ['1', '2'], ['H', 'C'],
+                          preDeleteAtoms=['5', '10'], postDeleteAtoms=['9', '10'])
+
+    # Pre atom 1 is the carbon that bonds, pre atom 5 is a deleted hydrogen
+    mappedIDDict = dict((pair[0], pair[1]) for pair in result.mappedIDList)
+    checkValues = [len(result.mappedIDList), mappedIDDict['1'], mappedIDDict['5'], len(result.preTemplate.types), sorted(os.listdir(path)) == filesBefore]
+    expected = [10, '1', '9', 10, True]
+
+    assert checkValues == expected
+
+def test_map_reactions_shared_pre():
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/') # Allows for relative pathing in pytest
+    elementsByType = ['H', 'H', 'C', 'C', 'N', 'O', 'O', 'O']
+    single = map_reaction(path, 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', ['28', '65'], ['28', '65'], elementsByType)
+
+    # The same reaction with the bonding atoms swapped is a second branch from the same pre-bond file
+    reactions = [{'postDataFile': 'cleanedpost_reaction.data', 'preBondingAtoms': ['28', '65'], 'postBondingAtoms': ['28', '65']},
+                 {'postDataFile': 'cleanedpost_reaction.data', 'preBondingAtoms': ['65', '28'], 'postBondingAtoms': ['65', '28']}]
+    serialResults = map_reactions(path, 'cleanedpre_reaction.data', reactions, elementsByType)
+    parallelResults = map_reactions(path, 'cleanedpre_reaction.data', reactions, elementsByType, workers=2)
+
+    checkValues = [[result.fullMappedIDList == single.fullMappedIDList for result in serialResults + parallelResults],
+                   [result.bondingIDs for result in parallelResults], [result.preTemplate.header['comment'] for result in serialResults]]
+    expected = [[True] * 4, [single.bondingIDs, single.bondingIDs[::-1]], [single.preTemplate.header['comment'], ['LAMMPS Description', 'Bonding_Atoms  14 9']]]
+
+    assert checkValues == expected
@@ -0,0 +1,65 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. This tests that the reaction pipeline
+# groups steps correctly, runs several reactions concurrently and stops a
+# reaction at its first failed step.
+##############################################################################
+
+import os
+import shutil
+import asyncio
+from AutoMapperPipeline import group_steps, run_pipeline
+
+TEST_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases')
+
+def test_group_steps():
+    requests = [{'tool': [tool]} for tool in ['clean', 'molecule', 'molecule', 'map', 'map', 'molecule']]
+    groups = group_steps(requests)
+
+    checkValues = [[request['tool'][0] for request in group] for group in groups]
+    expected = [['clean'], ['molecule', 'molecule'], ['map'], ['map'], ['molecule']]
+
+    assert checkValues == expected
+
+def test_run_pipeline(tmp_path):
+    cleanDir = str(tmp_path / 'clean')
+    mapDir = str(tmp_path / 'map')
+    shutil.copytree(os.path.join(TEST_DIRECTORY, 'Cleaner', 'Methane_Ethane'), cleanDir)
+    os.makedirs(mapDir)
+    for fileName in ['cleanedpre_reaction.data', 'cleanedpost_reaction.data']:
+        shutil.copy(os.path.join(TEST_DIRECTORY, 'Map_Tests', 'Methane_Ethane', fileName), mapDir)
+
+    mapStep = [mapDir, 'map', 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', '--save_name', 'pre-molecule.data', 'post-molecule.data',
+               '--ba', '1', '6', '1', '2', '--da', '5', '10', '9', '10', '--ebt', 'H', 'C']
+    reactions = [
+        {'name': 'clean', 'steps': [[cleanDir, 'clean', 'pre-system.data', 'post-system.data', '--coeff_file', 'system.in.settings'],
+                                    [cleanDir, 'molecule', 'cleanedpre-system.data', '--save_name', 'pre-molecule.data'],
+                                    [cleanDir, 'molecule', 'cleanedpost-system.data', '--save_name', 'post-molecule.data']]},
+        {'name': 'map', 'steps': [mapStep]},
+        # The missing file fails the first molecule group, so the map step never runs
+        {'name': 'failed', 'steps': [[mapDir, 'molecule', 'missing.data', '--save_name', 'missing-molecule.data'],
+                                     [mapDir, 'molecule', 'cleanedpre_reaction.data', '--save_name', 'other-molecule.data'],
+                                     mapStep]},
+    ]
+
+    results = asyncio.run(run_pipeline(reactions, workers=2))
+
+    checkValues = [[(name, [response['status'] for response in responses]) for name, responses in results],
+                   [os.path.exists(os.path.join(cleanDir, fileName)) for fileName in ['cleanedpre-system.data', 'pre-molecule.data', 'post-molecule.data']],
+                   os.path.exists(os.path.join(mapDir, 'automap.data'))]
+    expected = [[('clean', ['ok', 'ok', 'ok']), ('map', ['ok']), ('failed', ['error', 'ok'])],
+                [True, True, True], True]
+
+    assert checkValues == expected
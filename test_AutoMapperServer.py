@@ -0,0 +1,65 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. This tests that a running AutoMapper
+# server runs forwarded requests and reports failures, and that AutoMapper.py
+# falls back to running locally when the server address can't be reached.
+##############################################################################
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+from AutoMapper import build_parser
+from AutoMapperServer import send_request, forward_request
+
+def test_server_request(tmp_path):
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/')
+    shutil.copy(os.path.join(path, 'cleanedpre_reaction.data'), tmp_path)
+    address = str(tmp_path / 'server.sock')
+
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'AutoMapperServer.py'), '--address', address, '--workers', '1'],
+                              stdout=subprocess.DEVNULL)
+    try:
+        # Wait for the server to start listening
+        for _ in range(300):
+            if os.path.exists(address):
+                break
+            time.sleep(0.1)
+
+        request = vars(build_parser().parse_args([str(tmp_path), 'molecule', 'cleanedpre_reaction.data', '--save_name', 'pre-molecule.data']))
+        response = send_request(address, request)
+
+        missingRequest = vars(build_parser().parse_args([str(tmp_path), 'molecule', 'missing.data', '--save_name', 'missing-molecule.data']))
+        missingResponse = send_request(address, missingRequest)
+    finally:
+        server.terminate()
+        server.wait()
+
+    checkValues = [response['status'], 'error' in response, os.path.exists(tmp_path / 'pre-molecule.data'), missingResponse['status'], 'missing.data' in missingResponse['error']]
+    expected = ['ok', False, True, 'error', True]
+
+    assert checkValues == expected
+
+def test_unreachable_server(tmp_path, monkeypatch):
+    args = build_parser().parse_args([str(tmp_path), 'molecule', 'pre.data', '--save_name', 'pre-molecule.data'])
+
+    # An unresolvable host and a closed port must both run locally instead of raising
+    checkValues = []
+    for address in ['automapper.invalid:7000', '127.0.0.1:1']:
+        monkeypatch.setenv('AUTOMAPPER_SERVER', address)
+        checkValues.append(forward_request(args))
+
+    assert checkValues == [False, False]
@@ -0,0 +1,94 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Tests that the chunked parallel section
+# reader gives the same results as the serial reader.
+##############################################################################
+
+import os
+import shutil
+import LammpsFileReader
+from LammpsFileReader import read_data_sections, read_header, file_summary, write_section_index, load_section_index
+from LammpsTreatmentFuncs import read_data_file
+from LammpsSearchFuncs import get_header
+
+SECTIONS = ['Atoms', 'Masses', 'Bonds', 'Angles', 'Dihedrals', 'Impropers']
+
+def test_parallel_matches_serial(monkeypatch):
+    fileName = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/cleanedpre_reaction.data')
+    serialHeader, serialSections = read_data_sections(fileName, SECTIONS)
+
+    # Force the parallel route with chunks of a few lines each
+    monkeypatch.setattr(LammpsFileReader, 'PARALLEL_THRESHOLD', 0)
+    monkeypatch.setattr(LammpsFileReader, 'CHUNK_SIZE', 200)
+    parallelHeader, parallelSections = read_data_sections(fileName, SECTIONS, workers=2)
+
+    checkValues = [parallelHeader == serialHeader, parallelSections == serialSections, len(parallelSections['Atoms']) > 0]
+    expected = [True, True, True]
+
+    assert checkValues == expected
+
+def test_read_header():
+    fileName = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/cleanedpre_reaction.data')
+    summary = file_summary(fileName)
+
+    checkValues = [read_header(fileName) == get_header(read_data_file(fileName)), summary['counts']['atoms'], summary['types']['atom types'], summary['box']['xlo xhi']]
+    expected = [True, 80, 8, [0.0, 25.0]]
+
+    assert checkValues == expected
+
+def test_section_index(tmp_path):
+    sourceName = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/cleanedpre_reaction.data')
+    fileName = os.path.join(str(tmp_path), 'indexed.data')
+    shutil.copy(sourceName, fileName)
+
+    serialHeader, serialSections = read_data_sections(fileName, SECTIONS)
+    index = write_section_index(fileName)
+    indexedHeader, indexedSections = read_data_sections(fileName, SECTIONS)
+
+    # Changing the file must invalidate the index
+    with open(fileName, 'a') as f:
+        f.write('\n')
+    staleIndex = load_section_index(fileName)
+
+    checkValues = [indexedHeader == serialHeader, indexedSections == serialSections, index['sections']['Atoms'][2], staleIndex]
+    expected = [True, True, 80, None]
+
+    assert checkValues == expected
+
+def test_section_index_same_size_edit(tmp_path):
+    sourceName = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/cleanedpre_reaction.data')
+    fileName = os.path.join(str(tmp_path), 'padded.data')
+
+    # Pad both ends with comments so the sections are far from the start and end of the file
+    with open(sourceName, 'r') as f:
+        lines = f.readlines()
+    lines[0] = lines[0].rstrip('\n') + ' ' + 'x' * 100000 + '\n'
+    lines.append('# ' + 'x' * 100000 + '\n')
+    with open(fileName, 'w') as f:
+        f.writelines(lines)
+    write_section_index(fileName)
+
+    # Join two Bonds rows and split another at a space, so the row count changes but the size doesn't
+    with open(fileName, 'rb') as f:
+        contents = bytearray(f.read())
+    bondsStart = contents.index(b'Bonds')
+    joinedNewline = contents.index(b'\n', contents.index(b'\n', bondsStart + 6) + 1)
+    splitSpace = contents.index(b' ', joinedNewline + 1)
+    contents[joinedNewline] = ord(' ')
+    contents[splitSpace] = ord('\n')
+    with open(fileName, 'wb') as f:
+        f.write(contents)
+
+    assert load_section_index(fileName) is None
@@ -17,8 +17,10 @@
 ##############################################################################
 
 import os
+import gzip
+import shutil
 from LammpsToMolecule import lammps_to_molecule
-from LammpsTreatmentFuncs import clean_data
+from LammpsTreatmentFuncs import clean_data, read_data_file
 from LammpsSearchFuncs import get_data, find_sections
 
 def test_lammps_to_molecule():
@@ -38,4 +40,19 @@ def test_lammps_to_molecule():
     checkValues = [len(sectionIndex), mol[sectionIndex[-2]], int(types[5][1]), atomSectionLengths, int(mol[2].split()[0])] 
     expected = [6, 'Angles', 2, True, 12]
 
-    assert checkValues == expected
\ No newline at end of file
+    assert checkValues == expected
+
+def test_compressed_lammps_to_molecule(tmp_path):
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Methane_Ethane')
+    with open(os.path.join(path, 'cleanedpre_reaction.data'), 'rb') as f, gzip.open(os.path.join(str(tmp_path), 'pre.data.gz'), 'wb') as g:
+        shutil.copyfileobj(f, g)
+
+    # Compressed input and output should give the same molecule as plain text
+    plainMolecule = lammps_to_molecule(path, 'cleanedpre_reaction.data', None, ['1', '6'])
+    compressedMolecule = lammps_to_molecule(str(tmp_path), 'pre.data.gz', 'pre-molecule.data.xz', ['1', '6'])
+    savedLines = read_data_file(os.path.join(str(tmp_path), 'pre-molecule.data.xz'))
+
+    checkValues = [compressedMolecule.tidied_lines() == plainMolecule.tidied_lines(), savedLines == plainMolecule.tidied_lines()]
+    expected = [True, True]
+
+    assert checkValues == expected
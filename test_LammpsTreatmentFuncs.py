@@ -0,0 +1,70 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 30/07/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. This tests the data treatment tools
+##############################################################################
+
+import os
+from LammpsTreatmentFuncs import id_key, FileCache, clean_data, int_ids, str_ids, refine_data
+
+def test_id_key():
+    numericIDs = sorted(['10', '2', '1', '33', '4'], key=id_key)
+    labelIDs = sorted(['c10', 'c2', '3', 'h1'], key=id_key)
+
+    checkValues = [numericIDs, labelIDs]
+    expected = [['1', '2', '4', '10', '33'], ['3', 'c2', 'c10', 'h1']]
+
+    assert checkValues == expected
+
+def test_file_cache(tmp_path):
+    fileName = os.path.join(str(tmp_path), 'cache.data')
+    with open(fileName, 'w') as f:
+        f.write('Comment\n\n2 atoms # two\n')
+
+    cache = FileCache(maxSize=1)
+    firstRead = cache.get(fileName, clean_data)
+    firstRead.append('changed') # Callers get copies, the cache must not change
+    secondRead = cache.get(fileName, clean_data)
+
+    # Changing the file size changes the stamp so the cache reloads
+    with open(fileName, 'w') as f:
+        f.write('Comment\n\n10 atoms\n')
+    thirdRead = cache.get(fileName, clean_data)
+
+    checkValues = [secondRead, thirdRead, len(cache.entries)]
+    expected = [['Comment', '2 atoms'], ['Comment', '10 atoms'], 1]
+
+    assert checkValues == expected
+
+def test_int_ids():
+    IDs = int_ids(['3', '12', '1'])
+
+    checkValues = [IDs, sorted(IDs), str_ids(IDs), int_ids(None)]
+    expected = [[3, 12, 1], [1, 3, 12], ['3', '12', '1'], None]
+
+    assert checkValues == expected
+
+def test_refine_data():
+    bonds = [['1', '1', '4', '2'], ['2', '1', '2', '3'], ['3', '2', '3', '9'], ['4', '1', '1', '4']]
+    atoms = [['4', '1', '1'], ['9', '1', '1'], ['2', '1', '1']]
+    newAtomIDs = {'1': '3', '2': '1', '3': '2', '4': '4'}
+
+    # Bonds are kept in file order and renumbered, atoms are sorted by ID
+    refinedBonds = refine_data(bonds, [2, 3], set(newAtomIDs), newAtomIDs)
+    refinedAtoms = refine_data(atoms, 0, {'2', '4'}, newAtomIDs)
+
+    checkValues = [refinedBonds, refinedAtoms, bonds[0]]
+    expected = [[['1', '1', '4', '1'], ['2', '1', '1', '2'], ['3', '1', '3', '4']], [['1', '1', '1'], ['4', '1', '1']], ['1', '1', '4', '2']]
+
+    assert checkValues == expected
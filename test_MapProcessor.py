@@ -0,0 +1,179 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Tests the type change distance field,
+# that edge atoms are extended through the map until none are too close to a
+# type change, that small radii give valid structures that grow with radius,
+# that minimised partial structures still meet the partial structure constraints
+# and that branches mapped from one pre-bond file match separate maps.
+##############################################################################
+
+import os
+import shutil
+from types import SimpleNamespace
+import MapProcessor
+from MapProcessor import type_change_distances, verify_edge_atoms, extend_edges_until_stable, map_processor, map_branches, restore_dir
+from MapTesting import MAP_CASES, TEST_DIRECTORY
+
+def carbon_chain(length, changedTypes):
+    # Linear chain of carbons 1 to length, atoms in changedTypes have type 2 instead of 1
+    chain = {}
+    for atomID in range(1, length + 1):
+        neighbours = [neighbour for neighbour in [atomID - 1, atomID + 1] if 1 <= neighbour <= length]
+        chain[atomID] = SimpleNamespace(atomID=atomID, element='C', atomType='2' if atomID in changedTypes else '1', firstNeighbourIDs=neighbours)
+
+    return chain
+
+def test_type_change_distances():
+    # Atom 1 is a bonding atom that changes type, atom 6 changes type away from the reaction
+    preAtomObjectDict = carbon_chain(9, [])
+    postAtomObjectDict = carbon_chain(9, [1, 6])
+    mappedIDDict = {atomID: atomID for atomID in preAtomObjectDict}
+
+    distances = type_change_distances(mappedIDDict, preAtomObjectDict, postAtomObjectDict)
+
+    # Atom 3 is two bonds from the bonding atom, so it is too close even though second neighbour lists leave bonding atoms out
+    checkValues = [distances, verify_edge_atoms([3, 9], distances), verify_edge_atoms(None, distances)]
+    expected = [{1: 0, 2: 1, 3: 2, 6: 0, 5: 1, 7: 1, 4: 2, 8: 2}, {3: 1}, {}]
+
+    assert checkValues == expected
+
+def test_extend_edges_until_stable():
+    preAtomObjectDict = carbon_chain(12, [])
+    postAtomObjectDict = carbon_chain(12, [1, 6])
+    mappedIDDict = {atomID: atomID for atomID in preAtomObjectDict}
+    distances = type_change_distances(mappedIDDict, preAtomObjectDict, postAtomObjectDict)
+
+    # Each extension brings a new edge near the type change at atom 6, so several passes are needed
+    preEdgeAtoms, prePartialAtomsSet, postPartialAtomsSet = extend_edges_until_stable([2], distances, mappedIDDict, preAtomObjectDict, {1, 2}, {1, 2})
+
+    checkValues = [preEdgeAtoms, sorted(prePartialAtomsSet), prePartialAtomsSet == postPartialAtomsSet, verify_edge_atoms(preEdgeAtoms, distances)]
+    expected = [[9], list(range(1, 10)), True, {}]
+
+    assert checkValues == expected
+
+def test_extend_edges_through_map():
+    # Post atoms are numbered from 101 and the reaction closes a ring, bonding post atom 102 to 108
+    preAtomObjectDict = carbon_chain(8, [])
+    postChain = carbon_chain(8, [1])
+    postChain[2].firstNeighbourIDs.append(8)
+    postChain[8].firstNeighbourIDs.append(2)
+    postAtomObjectDict = {atomID + 100: SimpleNamespace(atomID=atomID + 100, element=atom.element, atomType=atom.atomType,
+                                                        firstNeighbourIDs=[neighbour + 100 for neighbour in atom.firstNeighbourIDs]) for atomID, atom in postChain.items()}
+    mappedIDDict = {atomID: atomID + 100 for atomID in preAtomObjectDict}
+    distances = type_change_distances(mappedIDDict, preAtomObjectDict, postAtomObjectDict)
+
+    # Post atoms 107 and 108 are near the edge in the post graph, but their pre partners aren't near it in the pre graph
+    preEdgeAtoms, prePartialAtomsSet, postPartialAtomsSet = extend_edges_until_stable([2], distances, mappedIDDict, preAtomObjectDict, {1, 2}, {101, 102})
+
+    checkValues = [preEdgeAtoms, sorted(prePartialAtomsSet), sorted(postPartialAtomsSet)]
+    expected = [[4], [1, 2, 3, 4], [101, 102, 103, 104]]
+
+    assert checkValues == expected
+
+def test_small_radius():
+    # Radii below the default must still give matched partial structures, and keep more atoms as the radius grows
+    checkValues = []
+    expected = []
+    grownCases = []
+    for case in MAP_CASES:
+        sizes = []
+        diagnostics = []
+        for radius in [1, 2, 3]:
+            with restore_dir():
+                result = map_processor(os.path.join(TEST_DIRECTORY, case['directory']), 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', None, None,
+                                       case['preBondingAtoms'], case['postBondingAtoms'], case['deleteAtoms'], case['elementsByType'], case['createAtoms'],
+                                       mapFileName=None, radius=radius)
+            sizes.append(len(result.mappedIDList))
+            diagnostics.extend(result.diagnostics)
+
+        checkValues.append((case['name'], diagnostics, sizes == sorted(sizes)))
+        expected.append((case['name'], [], True))
+        if sizes[0] < sizes[1] < sizes[2]:
+            grownCases.append(case['name'])
+
+    assert checkValues == expected
+    assert grownCases == ['DGEBA-DETDA', 'Phenol O-Alkylation', 'Phenolic Resin', 'Create Atoms']
+
+def test_minimise_partial_structure(monkeypatch):
+    # Record the ring opening atoms of each map, which minimising must keep
+    ringOpeningAtoms = []
+    is_ring_opening = MapProcessor.is_ring_opening
+    def record_ring_opening(*args):
+        preCyclicAtomsSet, postCyclicAtomsSet = is_ring_opening(*args)
+        ringOpeningAtoms.append(set(preCyclicAtomsSet))
+        return preCyclicAtomsSet, postCyclicAtomsSet
+    monkeypatch.setattr(MapProcessor, 'is_ring_opening', record_ring_opening)
+
+    # A larger radius than the default leaves room to minimise in every case with a partial structure
+    checkValues = []
+    expected = []
+    for case in MAP_CASES:
+        results = []
+        for minimise in [False, True]:
+            with restore_dir():
+                results.append(map_processor(os.path.join(TEST_DIRECTORY, case['directory']), 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', None, None,
+                                             case['preBondingAtoms'], case['postBondingAtoms'], case['deleteAtoms'], case['elementsByType'], case['createAtoms'],
+                                             mapFileName=None, radius=6, minimise=minimise))
+        fullResult, minimisedResult = results
+
+        # Whole structures are kept when there's no partial structure
+        keptPreAtoms = {int(pair[0]) for pair in (minimisedResult.partialMappedIDList or minimisedResult.fullMappedIDList)}
+        sameAtomCount = case['createAtoms'] is not None or len(minimisedResult.preTemplate.types) == len(minimisedResult.postTemplate.types)
+
+        checkValues.append((case['name'], minimisedResult.diagnostics, len(minimisedResult.mappedIDList) <= len(fullResult.mappedIDList),
+                            ringOpeningAtoms[-1].issubset(keptPreAtoms), sameAtomCount))
+        expected.append((case['name'], [], True, True, True))
+
+    assert checkValues == expected
+
+def test_map_branches(tmp_path, monkeypatch):
+    path = os.path.join(TEST_DIRECTORY, 'DGEBA_DETDA')
+    elementsByType = ['H', 'H', 'C', 'C', 'N', 'O', 'O', 'O']
+    # The same reaction with the bonding atoms swapped is a second branch from the same pre-bond file
+    bondingAtomLists = [['28', '65'], ['65', '28']]
+    separateResults = []
+    for bondingAtoms in bondingAtomLists:
+        with restore_dir():
+            separateResults.append(map_processor(path, 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', None, None, bondingAtoms, bondingAtoms,
+                                                 None, elementsByType, None, mapFileName=None))
+
+    # The pre-bond file is removed as soon as it has been read, so reading it again in any process would fail
+    preReads = []
+    read_molecule_sections = MapProcessor.read_molecule_sections
+    def read_once(fileName):
+        preReads.append(fileName)
+        dataSections = read_molecule_sections(fileName)
+        os.remove(fileName)
+        return dataSections
+    monkeypatch.setattr(MapProcessor, 'read_molecule_sections', read_once)
+
+    branches = [{'postDataFileName': 'cleanedpost_reaction.data', 'preBondingAtoms': bondingAtoms, 'postBondingAtoms': bondingAtoms} for bondingAtoms in bondingAtomLists]
+    checkValues = []
+    for workers in [1, 2]:
+        directory = str(tmp_path / f'workers{workers}')
+        os.makedirs(directory)
+        for fileName in ['cleanedpre_reaction.data', 'cleanedpost_reaction.data']:
+            shutil.copy(os.path.join(path, fileName), directory)
+
+        with restore_dir():
+            branchResults = map_branches(directory, 'cleanedpre_reaction.data', branches, elementsByType, workers=workers)
+        checkValues.append([(result.fullMappedIDList == separate.fullMappedIDList, result.mappedIDList == separate.mappedIDList, result.edgeIDs == separate.edgeIDs,
+                             result.preTemplate.output_list() == separate.preTemplate.output_list(), result.postTemplate.output_list() == separate.postTemplate.output_list())
+                            for result, separate in zip(branchResults, separateResults)])
+
+    checkValues.append(preReads)
+    expected = [[(True,) * 5] * 2, [(True,) * 5] * 2, ['cleanedpre_reaction.data'] * 2]
+
+    assert checkValues == expected
@@ -0,0 +1,71 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Runs every MapTesting case without
+# writing files and checks the map is fully correct. Wall time, peak memory
+# and inference counts are attached to each test as properties, so they
+# appear in pytest's --junitxml report.
+##############################################################################
+
+import pytest
+from MapTesting import MAP_CASES, run_case, find_regressions, count_inferences
+from Tracing import TRACER
+
+@pytest.mark.parametrize('case', MAP_CASES, ids=[case['directory'] for case in MAP_CASES])
+def test_map_case(case, record_property):
+    result = run_case(case, writeFiles=False)
+    for key in ['wallTime', 'peakMemory', 'inferences']:
+        record_property(key, result[key])
+
+    checkValues = [result['accuracy'], result['incorrectAtoms'], result['repeatedAtoms'], result['diagnostics']]
+    expected = [100.0, [], [], 0]
+
+    assert checkValues == expected
+
+def test_find_regressions():
+    previousRun = {'cases': {
+        'A': {'accuracy': 100.0, 'wallTime': 1.0, 'peakMemory': 1000, 'inferences': 0, 'diagnostics': 0},
+        'B': {'accuracy': 100.0, 'wallTime': 0.01, 'peakMemory': 1000, 'inferences': 1, 'diagnostics': 0},
+    }}
+    results = [
+        {'directory': 'A', 'accuracy': 90.0, 'wallTime': 1.5, 'peakMemory': 1100, 'inferences': 1, 'diagnostics': 0},
+        # Doubled but below MIN_REGRESSION_TIME, fewer inferences is an improvement
+        {'directory': 'B', 'accuracy': 100.0, 'wallTime': 0.02, 'peakMemory': 2000, 'inferences': 0, 'diagnostics': 0},
+        # Not in the previous run
+        {'directory': 'C', 'accuracy': 50.0, 'wallTime': 9.0, 'peakMemory': 9000, 'inferences': 9, 'diagnostics': 9},
+    ]
+    regressions = find_regressions(results, previousRun, threshold=0.25)
+
+    checkValues = [regression.split(':')[0] + ' ' + regression.split(':')[1].split()[0] for regression in regressions]
+    expected = ['A accuracy', 'A inferences', 'A wall', 'B peak']
+
+    assert checkValues == expected
+
+def test_count_inferences():
+    # DGEBA-DETDA needs three inferences, counted from traced events rather than printed notes
+    result = run_case(MAP_CASES[0], writeFiles=False)
+
+    # Counts nest inside a trace that is already running, which is left running with its events
+    TRACER.enable()
+    try:
+        with count_inferences() as counts:
+            TRACER.record('symmetry_inference', 1, 2)
+            TRACER.record('missing_symmetry', 1, 2)
+    finally:
+        TRACER.disable()
+
+    checkValues = [result['inferences'], counts['inferences'], len(TRACER.events), TRACER.enabled]
+    expected = [3, 1, 2, False]
+
+    assert checkValues == expected
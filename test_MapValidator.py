@@ -0,0 +1,51 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Tests that a correct map passes
+# validation and that a broken map is reported.
+##############################################################################
+
+import os
+from AutoMapperAPI import map_reaction
+from LammpsToMolecule import lammps_to_molecule
+from LammpsSearchFuncs import element_atomID_dict
+from AtomObjectBuilder import build_atom_objects
+from MapProcessor import restore_dir
+from MapValidator import validate_map
+
+def test_validate_map():
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/') # Allows for relative pathing in pytest
+    elementsByType = ['H', 'H', 'C', 'C', 'N', 'O', 'O', 'O']
+    result = map_reaction(path, 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', ['28', '65'], ['28', '65'], elementsByType)
+
+    # Full structure atom objects for checking a map by hand
+    atomObjectDicts = []
+    for fileName in ['cleanedpre_reaction.data', 'cleanedpost_reaction.data']:
+        with restore_dir():
+            lines = lammps_to_molecule(path, fileName, None).tidied_lines()
+        atomObjectDicts.append(build_atom_objects(lines, element_atomID_dict(lines, elementsByType), [28, 65]))
+    allAtoms = [set(atomObjectDict) for atomObjectDict in atomObjectDicts]
+
+    # Break the map by swapping the post atoms of two ring carbons, away from the reaction, and mapping atom 2 twice
+    mappedIDDict = {int(pair[0]): int(pair[1]) for pair in result.fullMappedIDList}
+    mappedIDDict[1], mappedIDDict[3] = mappedIDDict[3], mappedIDDict[1]
+    brokenIDList = [[preAtom, postAtom] for preAtom, postAtom in mappedIDDict.items()] + [[2, mappedIDDict[4]]]
+
+    diagnostics = validate_map(brokenIDList, atomObjectDicts[0], atomObjectDicts[1], [28, 65], [28, 65], None, None, None, None, {}, allAtoms[0], allAtoms[1], 2)
+    brokenBonds = sorted(problem['atomIDs'] for problem in diagnostics if problem['check'] == 'bonds' and problem['message'].startswith('Pre'))
+
+    checkValues = [result.diagnostics, sorted({problem['check'] for problem in diagnostics}), brokenBonds]
+    expected = [[], ['bijection', 'bonds', 'partial_structure'], [['1', '30'], ['2', '13'], ['3', '11'], ['3', '6']]]
+
+    assert checkValues == expected
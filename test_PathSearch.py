@@ -0,0 +1,62 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. This tests that the missing atom
+# worklist maps the test cases without inference, stops after one inference
+# round when an atom can't be matched and exits with an error if atoms are left.
+##############################################################################
+
+import os
+import pytest
+from types import SimpleNamespace
+import PathSearch
+from PathSearch import resolve_missing_atoms
+from QueueFuncs import Queue
+from AutoMapperAPI import map_reaction
+
+TEST_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests')
+
+def map_case(directory, bondingAtoms):
+    return map_reaction(os.path.join(TEST_DIRECTORY, directory), 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', bondingAtoms, bondingAtoms, ['H', 'H', 'C', 'C', 'O', 'O'])
+
+def test_no_inference_rounds():
+    checkValues = []
+    for directory, bondingAtoms in [('Queue_Tester', ['1', '33']), ('Edge_Atom_Symmetry', ['1', '32'])]:
+        result = map_case(directory, bondingAtoms)
+        checkValues.append((len(result.mappedIDList) > 0, result.searchStats['rounds']))
+
+    assert checkValues == [(True, 0), (True, 0)]
+
+def test_impossible_atom():
+    # Pre atom 2 is the only nitrogen, so no post atom can ever match it
+    preAtomObjectDict = {1: SimpleNamespace(atomID=1, element='C'), 2: SimpleNamespace(atomID=2, element='N')}
+    postAtomObjectDict = {10: SimpleNamespace(atomID=10, element='C'), 11: SimpleNamespace(atomID=11, element='O')}
+    mappedIDList = [[1, 10]]
+    searchStats = {}
+
+    missingPreAtoms = resolve_missing_atoms(Queue(), mappedIDList, preAtomObjectDict, postAtomObjectDict, [2], [11], [{}, {}], searchStats)
+
+    # Returned after the single inference round rather than retried forever
+    checkValues = [missingPreAtoms, mappedIDList, searchStats]
+    expected = [[2], [[1, 10]], {'missingAtoms': 1, 'rounds': 1}]
+
+    assert checkValues == expected
+
+def test_missing_atoms_exit(monkeypatch):
+    monkeypatch.setattr(PathSearch, 'resolve_missing_atoms', lambda *args: [5])
+
+    with pytest.raises(SystemExit) as exitInfo:
+        map_case('Queue_Tester', ['1', '33'])
+
+    assert exitInfo.value.code == 1
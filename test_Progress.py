@@ -0,0 +1,60 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Checks the events sent to progress
+# callbacks during a map or file save and the progress line written by
+# ProgressBar.
+##############################################################################
+
+import io
+import os
+from Progress import PROGRESS, ProgressBar
+from AutoMapperAPI import map_reaction
+from LammpsTreatmentFuncs import save_text_file
+
+def test_map_events():
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/') # Allows for relative pathing in pytest
+    events = []
+    with PROGRESS.listen(events.append):
+        map_reaction(path, 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', ['28', '65'], ['28', '65'], ['H', 'H', 'C', 'C', 'N', 'O', 'O', 'O'])
+    atomsMapped = [event for event in events if event['event'] == 'atoms_mapped']
+    rowsParsed = {(event['section'], event['rows']) for event in events if event['event'] == 'rows_parsed'}
+
+    checkValues = [PROGRESS.enabled, (atomsMapped[-1]['mapped'], atomsMapped[-1]['total']), ('Atoms', 80) in rowsParsed,
+                   any(event['event'] == 'missing_round' for event in events)]
+    expected = [False, (80, 80), True, True]
+
+    assert checkValues == expected
+
+def test_bytes_written(tmp_path):
+    events = []
+    with PROGRESS.listen(events.append):
+        save_text_file(tmp_path / 'test.data', [['1', '2'], '\n', ['Atoms']])
+
+    checkValues = [(event['event'], event['bytes']) for event in events]
+    expected = [('bytes_written', os.path.getsize(tmp_path / 'test.data'))]
+
+    assert checkValues == expected
+
+def test_progress_bar():
+    stream = io.StringIO()
+    progressBar = ProgressBar(stream=stream, interval=60, width=10)
+    progressBar({'event': 'atoms_mapped', 'time': 100.0, 'mapped': 5, 'total': 10})
+    progressBar({'event': 'atoms_mapped', 'time': 100.5, 'mapped': 10, 'total': 10})
+    progressBar.close()
+
+    checkValues = stream.getvalue().split('\r')
+    expected = ['', 'Mapping [#####.....] 5/10 atoms', 'Mapping [##########] 10/10 atoms\n']
+
+    assert checkValues == expected
@@ -0,0 +1,91 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Checks stages are only recorded while
+# profiling, that a map run reports its main stages and that memory is tracked
+# for nested stages and the clean stages.
+##############################################################################
+
+import os
+from StageProfiler import StageProfiler, PROFILER
+from AutoMapperAPI import map_reaction
+from LammpsUnifiedCleaner import file_unifier
+
+def test_nested_stages():
+    profiler = StageProfiler()
+    with profiler.stage('off'):
+        pass
+
+    profiler.enable()
+    for _ in range(2):
+        with profiler.stage('outer', atoms=5):
+            with profiler.stage('inner'):
+                profiler.set_atoms(3)
+            profiler.set_atoms(2)
+    report = profiler.report()['stages']
+
+    checkValues = [list(report.keys()), [record['calls'] for record in report.values()], [record['atoms'] for record in report.values()]]
+    expected = [['outer', 'outer/inner'], [2, 2], [5, 3]]
+
+    assert checkValues == expected
+
+def test_map_profile():
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/') # Allows for relative pathing in pytest
+    PROFILER.enable()
+    try:
+        map_reaction(path, 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', ['28', '65'], ['28', '65'], ['H', 'H', 'C', 'C', 'N', 'O', 'O', 'O'])
+    finally:
+        PROFILER.disable()
+    report = PROFILER.report()['stages']
+
+    checkValues = [stageName in report for stageName in ['pre_molecule/refine', 'map_from_path/run_queue', 'map_from_path/missing_atoms/round', 'edge_atoms', 'byproducts', 'partial_map']]
+    checkValues.append(report['map_from_path/run_queue']['atoms'])
+    expected = [True] * 6 + [80]
+
+    assert checkValues == expected
+
+def test_memory_stages():
+    profiler = StageProfiler()
+    profiler.enable(memory=True)
+    try:
+        with profiler.stage('outer'):
+            with profiler.stage('inner'):
+                block = bytearray(1000000)
+            del block
+            with profiler.stage('small'):
+                pass
+    finally:
+        profiler.disable()
+    report = profiler.report()['stages']
+
+    checkValues = [report['outer/inner']['peakMemory'] >= 1000000, report['outer']['peakMemory'] >= report['outer/inner']['peakMemory'],
+                   report['outer/small']['peakMemory'] < 1000000, report['outer']['peakRss'] >= report['outer/small']['peakRss']]
+    expected = [True] * 4
+
+    assert checkValues == expected
+
+def test_clean_memory_profile():
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Cleaner/Methane_Ethane/') # Allows for relative pathing in pytest
+    PROFILER.enable(memory=True)
+    try:
+        with PROFILER.stage('clean'):
+            file_unifier(path, 'system.in.settings', ['pre-system.data', 'post-system.data'])
+    finally:
+        PROFILER.disable()
+    report = PROFILER.report()['stages']
+
+    checkValues = [report[f'clean/{stageName}']['peakMemory'] > 0 for stageName in ['data', 'union_types', 'remap_sections', 'flatten']]
+    expected = [True] * 4
+
+    assert checkValues == expected
@@ -0,0 +1,47 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Maps small random symmetric reactions
+# and checks the bond preservation score.
+##############################################################################
+
+from SymmetryGenerator import SymmetricReaction, run_reaction, carbon_skeleton
+
+def test_carbon_skeleton():
+    checkValues = [len(carbon_skeleton('chain', 4)[1]), len(carbon_skeleton('ring', 6)[1]), carbon_skeleton('dendrimer', 3)[0]]
+    expected = [3, 6, 17]
+
+    assert checkValues == expected
+
+def test_symmetric_reactions():
+    results = [run_reaction(SymmetricReaction(topology, size, seed=topology)) for topology, size in [('chain', 5), ('ring', 6), ('dendrimer', 3)]]
+
+    checkValues = [[result['bondAccuracy'], result['diagnostics'], result['error']] for result in results]
+    expected = [[100.0, 0, None]] * 3
+
+    assert checkValues == expected
+
+def test_score():
+    reaction = SymmetricReaction('chain', 2, seed=1)
+    generatedMap = [[reaction.preIDs[atom], reaction.postIDs[atom]] for atom in range(len(reaction.elements))]
+
+    # Swapping the two carbons of the first ethane leaves 14 of the 16 atoms on the generated map
+    carbon1, carbon2 = 0, 1
+    swappedMap = [list(pair) for pair in generatedMap]
+    swappedMap[carbon1][1], swappedMap[carbon2][1] = generatedMap[carbon2][1], generatedMap[carbon1][1]
+
+    checkValues = [reaction.score(generatedMap), reaction.score(swappedMap)[1]]
+    expected = [(100.0, 100.0), round(14 / 16 * 100, 1)]
+
+    assert checkValues == expected
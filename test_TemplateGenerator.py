@@ -0,0 +1,52 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Generates a short chain of linked
+# DGEBA-DETDA copies and checks it maps onto the expected map, and that
+# chains are never smaller than the requested number of atoms.
+##############################################################################
+
+from LammpsFileReader import file_summary
+from MapProcessor import map_processor, restore_dir
+from MapTesting import score_map
+from TemplateGenerator import generate_chain
+
+def test_generate_chain(tmp_path):
+    expected = generate_chain('DGEBA_DETDA', str(tmp_path), 200)
+    preSummary = file_summary(str(tmp_path / 'pre_reaction.data'))
+    postSummary = file_summary(str(tmp_path / 'post_reaction.data'))
+
+    with restore_dir():
+        mapResult = map_processor(str(tmp_path), 'pre_reaction.data', 'post_reaction.data', None, None, expected['preBondingAtoms'], expected['postBondingAtoms'],
+                                  expected['deleteAtoms'], expected['elementsByType'], expected['createAtoms'], mapFileName=None)
+    score = score_map(mapResult.fullMappedIDList, expected['correct'])
+
+    # 3 copies of 80 atoms, with two hydrogens removed for each of the 4 links between copies
+    checkValues = [expected['copies'], preSummary['counts']['atoms'], postSummary['counts']['atoms'], len(expected['correct']), score['accuracy'], mapResult.diagnostics]
+    expected = [3, 232, 232, 232, 100.0, []]
+
+    assert checkValues == expected
+
+def test_chain_size(tmp_path):
+    # 232 atoms is exactly 3 DGEBA-DETDA copies, so one more atom needs a fourth copy
+    checkValues = []
+    for caseName, targetAtoms in [('DGEBA_DETDA', 232), ('DGEBA_DETDA', 233), ('DGEBA_DETDA', 3000), ('Phenolic_Resin', 3000)]:
+        directory = tmp_path / f'{caseName}_{targetAtoms}'
+        expected = generate_chain(caseName, str(directory), targetAtoms)
+        preAtoms = file_summary(str(directory / 'pre_reaction.data'))['counts']['atoms']
+        checkValues.append((expected['copies'], preAtoms == expected['preAtoms'], preAtoms >= targetAtoms))
+
+    expected = [(3, True, True), (4, True, True), (40, True, True), (116, True, True)]
+
+    assert checkValues == expected
@@ -0,0 +1,83 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Maps a symmetric reaction into an empty
+# template library, then checks the same reaction with shuffled atomIDs is
+# mapped from the stored template and a different reaction is not. Also checks
+# canonical labels don't depend on atomIDs when refinement can't tell atoms apart.
+##############################################################################
+
+import os
+import copy
+import json
+import random
+import contextlib
+from MapProcessor import map_processor, restore_dir
+from SymmetryGenerator import SymmetricReaction
+from TemplateLibrary import canonical_labels, graph_form
+
+def map_with_library(reaction, library):
+    preBondingAtoms, postBondingAtoms, deleteAtoms, elementsByType = reaction.map_arguments()
+    with restore_dir(), contextlib.redirect_stdout(None):
+        return map_processor('.', reaction.pre_lines(), reaction.post_lines(), None, None, preBondingAtoms, postBondingAtoms,
+                             deleteAtoms, elementsByType, None, mapFileName=None, templateLibrary=str(library))
+
+def test_template_projection(tmp_path):
+    firstResult = map_with_library(SymmetricReaction('ring', 6, seed='first'), tmp_path)
+    with open(tmp_path / 'index.json', 'r') as f:
+        index = json.load(f)
+    templateFile = list(index.values())[0][0]
+
+    shuffledReaction = SymmetricReaction('ring', 6, seed='second')
+    shuffledResult = map_with_library(shuffledReaction, tmp_path)
+    otherResult = map_with_library(SymmetricReaction('ring', 7, seed='first'), tmp_path)
+
+    checkValues = [firstResult.searchStats['template'], len(index), shuffledResult.searchStats['template'], shuffledReaction.score(shuffledResult.fullMappedIDList)[0],
+                   len(shuffledResult.diagnostics), otherResult.searchStats['template'], len(os.listdir(tmp_path))]
+    expected = [None, 1, templateFile, 100.0, 0, None, 3]
+
+    assert checkValues == expected
+
+def test_shuffled_dendrimer(tmp_path):
+    # The same dendrimer reaction with new atomIDs, so only the labels can match it to the stored template
+    reaction = SymmetricReaction('dendrimer', 3, seed='first')
+    shuffledReaction = copy.copy(reaction)
+    rng = random.Random('second')
+    shuffledReaction.preIDs = rng.sample(reaction.preIDs, len(reaction.preIDs))
+    shuffledReaction.postIDs = rng.sample(reaction.postIDs, len(reaction.postIDs))
+
+    map_with_library(reaction, tmp_path)
+    shuffledResult = map_with_library(shuffledReaction, tmp_path)
+
+    checkValues = [shuffledResult.searchStats['template'] is not None, shuffledReaction.score(shuffledResult.fullMappedIDList)[0], shuffledResult.diagnostics]
+    expected = [True, 100.0, []]
+
+    assert checkValues == expected
+
+def test_canonical_labels():
+    # A 6-ring and two 3-rings of carbons, refinement gives every atom the same colour so
+    # the labels depend on which ring is picked first
+    graph = {}
+    for start, size in [(1, 6), (7, 3), (10, 3)]:
+        for index in range(size):
+            graph[start + index] = ('C', '', [start + (index - 1) % size, start + (index + 1) % size])
+
+    forms = []
+    for seed in range(5):
+        atomIDs = random.Random(seed).sample(list(graph), len(graph))
+        newIDs = dict(zip(graph, atomIDs))
+        shuffledGraph = {newIDs[atomID]: (element, role, [newIDs[neighbour] for neighbour in neighbours]) for atomID, (element, role, neighbours) in graph.items()}
+        forms.append(graph_form(shuffledGraph, canonical_labels(shuffledGraph)))
+
+    assert all(form == forms[0] for form in forms)
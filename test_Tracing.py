@@ -0,0 +1,55 @@
+##############################################################################
+# Developed by: Matthew Bone
+# Last Updated: 03/08/2021
+# Updated by: Matthew Bone
+#
+# Contact Details:
+# Bristol Composites Institute (BCI)
+# Department of Aerospace Engineering - University of Bristol
+# Queen's Building - University Walk
+# Bristol, BS8 1TR
+# U.K.
+# Email - matthew.bone@bristol.ac.uk
+#
+# File Description:
+# A unit test file designed for PyTest. Checks the trace ring buffer and that a
+# traced map records the rule used for each pair.
+##############################################################################
+
+import os
+import json
+from Tracing import Tracer, TRACER
+from AutoMapperAPI import map_reaction
+
+def test_ring_buffer(tmp_path):
+    tracer = Tracer()
+    tracer.record('single_element', 1, 2)
+
+    tracer.enable(size=3)
+    for atomID in range(1, 6):
+        tracer.record('single_element', atomID, atomID + 10)
+    traceFile = tmp_path / 'trace.jsonl'
+    tracer.dump(traceFile)
+    with open(traceFile, 'r') as f:
+        events = [json.loads(line) for line in f]
+
+    # Rule counts cover every event, including those dropped from the buffer
+    checkValues = [tracer.eventCount, [event['event'] for event in events], [event['pre'] for event in events], tracer.ruleCounts['single_element']]
+    expected = [5, [3, 4, 5], [3, 4, 5], 5]
+
+    assert checkValues == expected
+
+def test_map_trace():
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Map_Tests/DGEBA_DETDA/') # Allows for relative pathing in pytest
+    TRACER.enable()
+    try:
+        result = map_reaction(path, 'cleanedpre_reaction.data', 'cleanedpost_reaction.data', ['28', '65'], ['28', '65'], ['H', 'H', 'C', 'C', 'N', 'O', 'O', 'O'])
+    finally:
+        TRACER.disable()
+    events = list(TRACER.events)
+    mappedPairs = {(int(preAtom), int(postAtom)) for preAtom, postAtom in result.fullMappedIDList}
+
+    checkValues = [[event[1:] for event in events if event[1] == 'bonding_atom'], all((event[2], event[3]) in mappedPairs for event in events), len(events)]
+    expected = [[('bonding_atom', 28, 28), ('bonding_atom', 65, 65)], True, 80]
+
+    assert checkValues == expected
@@ -13,11 +13,14 @@
 #
 # File Description:
 # A unit test file designed for PyTest. This tests the clean function is capable
-# of unifying two data files and cutting down a coefficient file.
+# of unifying two data files and cutting down a coefficient file, and that an
+# incremental clean gives the same files as cleaning every file at once.
 ##############################################################################
 
 import os
+import shutil
 from LammpsUnifiedCleaner import file_unifier
+from AutoMapperAPI import clean
 from LammpsTreatmentFuncs import clean_data
 from LammpsSearchFuncs import get_data, find_sections
 
@@ -42,4 +45,45 @@ def test_unified_cleaner():
     checkValues = [len(settings), len(sectionIndex), data[sectionIndex[-2]], int(data[7][0]), matchAtomsCount] 
     expected = [8, 5, 'Angles', 3, True]
 
-    assert checkValues == expected
\ No newline at end of file
+    assert checkValues == expected
+
+def copy_cleaner_case(directory):
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'Test_Cases/Cleaner/Methane_Ethane/')
+    os.makedirs(directory)
+    for fileName in ['pre-system.data', 'post-system.data', 'system.in.settings']:
+        shutil.copy(os.path.join(path, fileName), directory)
+    # A second copy of the pre-bond file adds no new types
+    shutil.copy(os.path.join(path, 'pre-system.data'), os.path.join(directory, 'copy-system.data'))
+
+def read_cleaned(directory):
+    cleanedFiles = {}
+    for fileName in sorted(os.listdir(directory)):
+        if fileName.startswith('cleaned'):
+            with open(os.path.join(directory, fileName), 'r') as f:
+                cleanedFiles[fileName] = f.read()
+
+    return cleanedFiles
+
+def test_incremental_clean(tmp_path):
+    fullDir = str(tmp_path / 'full')
+    incrementalDir = str(tmp_path / 'incremental')
+    copy_cleaner_case(fullDir)
+    copy_cleaner_case(incrementalDir)
+
+    clean(fullDir, 'system.in.settings', ['pre-system.data', 'post-system.data', 'copy-system.data'], writeFiles=True)
+
+    # Post-system adds bond and dihedral types, so the cleaned pre-system file must be renumbered
+    clean(incrementalDir, 'system.in.settings', ['pre-system.data'], writeFiles=True, incremental=True)
+    unionChange = clean(incrementalDir, 'system.in.settings', ['post-system.data'], writeFiles=True, incremental=True)
+
+    # Copy-system doesn't change the union, so only it is parsed and written
+    unchangedUnion = clean(incrementalDir, 'system.in.settings', ['copy-system.data'], writeFiles=True, incremental=True)
+
+    # Only incremental cleans save a manifest, the cleaned files are the same
+    incrementalFiles = read_cleaned(incrementalDir)
+    manifest = incrementalFiles.pop('cleanedsystem.in.settings.manifest.json', None)
+
+    checkValues = [list(unionChange.data), unionChange.settings is None, list(unchangedUnion.data), unchangedUnion.settings is None, manifest is not None, incrementalFiles == read_cleaned(fullDir)]
+    expected = [['pre-system.data', 'post-system.data'], False, ['copy-system.data'], True, True, True]
+
+    assert checkValues == expected